@@ -0,0 +1,423 @@
+"""模型呼叫的流量控制
+
+交班時段大量語音同時湧入，若全部直接送出 Whisper / GPT 請求，OpenAI 會回傳 429，
+各執行緒的重試又同時堆積。這裡在呼叫前先排隊，而不是讓請求失敗：
+
+- 全域並行上限：同一時間最多 ADMISSION_MAX_CONCURRENT 個模型呼叫，
+  超過時依先來後到排隊（Redis sorted set，多個 gunicorn worker 與獨立 worker 共用）
+- 每位 LINE 使用者的 token bucket：每分鐘 ADMISSION_USER_RATE 則語音、最多連續 ADMISSION_USER_BURST 則，
+  超過時工作延後執行，不佔用 worker
+- 排隊超過 ADMISSION_NOTIFY_AFTER 秒時呼叫通知函數（LINE 推送目前的排隊位置），每個工作只通知一次
+- 背景工作排隊超過 ADMISSION_DEFER_AFTER 秒時拋出 AdmissionBusy，由工作改為延後重新執行，
+  不讓 worker 執行緒長時間空等；重新執行時沿用第一次排隊的順位，不會排到後來的請求之後
+
+Redis 無法使用時改用程序內的計數，限制只在單一程序內有效。
+
+    with admission.model_slot():
+        response = client.chat.completions.create(...)
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+
+import clients
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+# 所有程序合計同時進行的模型呼叫數
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '8'))
+# 每位使用者每分鐘可開始處理的語音數，以及可連續送出的數量
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', '4'))
+ADMISSION_USER_BURST = float(os.getenv('ADMISSION_USER_BURST', '3'))
+# 排隊超過此秒數才通知使用者，短暫等待不發送訊息
+ADMISSION_NOTIFY_AFTER = float(os.getenv('ADMISSION_NOTIFY_AFTER', '3'))
+# 最長排隊時間（秒），超過時放棄並回報錯誤（網頁上傳等無法延後的請求）
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '300'))
+# 背景工作最多在 worker 內排隊的秒數，超過時改為延後重新執行
+ADMISSION_DEFER_AFTER = float(os.getenv('ADMISSION_DEFER_AFTER', '10'))
+# 背景工作最多延後的次數，超過後改在 worker 內排隊（最多 ADMISSION_MAX_WAIT 秒）
+ADMISSION_MAX_DEFERRALS = int(os.getenv('ADMISSION_MAX_DEFERRALS', '20'))
+# 呼叫中的名額保留時間（秒）；程序異常結束時名額在此時間後自動釋放，須大於最長的 API 逾時
+ADMISSION_LEASE_SECONDS = float(os.getenv('ADMISSION_LEASE_SECONDS', '600'))
+
+POLL_INTERVAL = 0.25
+# 工作因名額不足延後時，重新執行前等待的秒數
+DEFER_DELAY = 15
+# /metrics 的兩個 gauge 共用同一次查詢結果的秒數
+DEPTH_CACHE_SECONDS = 1
+# 排隊者超過此秒數未再詢問即視為已離開（例如程序結束）
+WAITER_TIMEOUT = 10
+# Redis 失敗後改用程序內計數的時間（秒）
+REDIS_RETRY_SECONDS = 30
+REDIS_PREFIX = 'care_sch:admission:'
+
+# 取得名額：清除過期的名額與離開的排隊者，排在前面且仍有空位時取得名額（回傳 0），否則回傳排隊位置
+# 排隊順序依 priority（第一次排隊的時間），延後重新執行的工作沿用原本的 priority
+ACQUIRE_SCRIPT = """
+local holders, waiters, seen = KEYS[1], KEYS[2], KEYS[3]
+local ticket, now = ARGV[1], tonumber(ARGV[2])
+local limit, lease, waiter_timeout = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local priority = tonumber(ARGV[6])
+redis.call('ZREMRANGEBYSCORE', holders, '-inf', now)
+for _, stale in ipairs(redis.call('ZRANGEBYSCORE', seen, '-inf', now - waiter_timeout)) do
+    redis.call('ZREM', waiters, stale)
+    redis.call('ZREM', seen, stale)
+end
+if not redis.call('ZSCORE', waiters, ticket) then
+    redis.call('ZADD', waiters, priority, ticket)
+end
+redis.call('ZADD', seen, now, ticket)
+local free = limit - redis.call('ZCARD', holders)
+local rank = redis.call('ZRANK', waiters, ticket)
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, math.ceil(lease * 2))
+end
+if rank < free then
+    redis.call('ZREM', waiters, ticket)
+    redis.call('ZREM', seen, ticket)
+    redis.call('ZADD', holders, now + lease, ticket)
+    return 0
+end
+return rank - math.max(free, 0) + 1
+"""
+
+# token bucket：先預約一個 token，回傳需要等待的秒數（token 不足時為負值，等待到補滿為止）
+RESERVE_SCRIPT = """
+local now, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 60)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+ADMISSION_WAIT_SECONDS = metrics.histogram(
+    'admission_wait_seconds', '模型呼叫與使用者語音等待放行的時間（秒）', ['kind']
+)
+
+_queue_notifier_var = contextvars.ContextVar('admission_queue_notifier', default=None)
+_NULL_CONTEXT = nullcontext()
+
+
+class AdmissionTimeout(Exception):
+    """排隊超過 ADMISSION_MAX_WAIT"""
+
+
+class AdmissionBusy(Exception):
+    """背景工作排隊超過 defer_after，應延後 retry_after 秒重新執行
+
+    priority 為此工作第一次排隊的順位，重新執行時傳給 queue_notifications 沿用。
+    """
+
+    # 名額不足而延後不是階段失敗，metrics.track 不計入錯誤次數
+    counts_as_error = False
+
+    def __init__(self, position, priority=None, retry_after=DEFER_DELAY):
+        super().__init__(f"模型呼叫名額不足（排隊位置 {position}）")
+        self.position = position
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class _QueueNotifier:
+    """同一個工作的多個呼叫（例如分段轉錄）共用，只通知一次，並共用排隊順位"""
+
+    def __init__(self, callback, defer_after=None, priority=None):
+        self.callback = callback
+        self.defer_after = defer_after
+        self.priority = priority
+        self._lock = threading.Lock()
+        self._notified = False
+
+    def ticket_priority(self, now):
+        """第一次排隊時決定工作的順位，之後的呼叫沿用"""
+        with self._lock:
+            if self.priority is None:
+                self.priority = now
+            return self.priority
+
+    def notify(self, position):
+        with self._lock:
+            if self._notified:
+                return
+            self._notified = True
+        try:
+            self.callback(position)
+        except Exception as e:
+            logger.warning(f"排隊通知失敗: {str(e)}")
+
+
+@contextmanager
+def queue_notifications(callback, defer_after=None, priority=None):
+    """此區塊內的模型呼叫排隊過久時，以排隊位置呼叫 callback(position)
+
+    指定 defer_after 時，排隊超過該秒數即拋出 AdmissionBusy（供可延後重新執行的背景工作使用）；
+    重新執行時傳入 AdmissionBusy.priority，排在延後之後才到的請求前面。
+    """
+    token = _queue_notifier_var.set(_QueueNotifier(callback, defer_after, priority))
+    try:
+        yield
+    finally:
+        _queue_notifier_var.reset(token)
+
+
+class _LocalBackend:
+    """程序內版本，演算法與 Redis 腳本相同"""
+
+    name = 'local'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._holders = {}
+        # ticket -> (priority, 最後詢問時間)
+        self._waiters = {}
+        self._buckets = {}
+
+    def try_acquire(self, ticket, now, limit, lease, priority=None):
+        with self._lock:
+            for holder, expires_at in list(self._holders.items()):
+                if expires_at <= now:
+                    del self._holders[holder]
+            for waiter, (_, seen) in list(self._waiters.items()):
+                if seen < now - WAITER_TIMEOUT:
+                    del self._waiters[waiter]
+            # 與 Redis sorted set 相同：依 (priority, ticket) 排序，已排隊的 ticket 不改變順位
+            order = self._waiters[ticket][0] if ticket in self._waiters else (now if priority is None else priority)
+            self._waiters[ticket] = (order, now)
+            free = limit - len(self._holders)
+            rank = sum(1 for waiter, (other, _) in self._waiters.items() if (other, waiter) < (order, ticket))
+            if rank < free:
+                del self._waiters[ticket]
+                self._holders[ticket] = now + lease
+                return 0
+            return rank - max(free, 0) + 1
+
+    def release(self, ticket):
+        with self._lock:
+            self._holders.pop(ticket, None)
+            self._waiters.pop(ticket, None)
+
+    def reserve(self, key, now, rate, burst):
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0, now - ts) * rate) - 1
+            self._buckets[key] = (tokens, now)
+            return 0.0 if tokens >= 0 else -tokens / rate
+
+    def depth(self):
+        with self._lock:
+            return len(self._waiters), len(self._holders)
+
+
+class _RedisBackend:
+    name = 'redis'
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._acquire = None
+        self._reserve = None
+        self.keys = [REDIS_PREFIX + name for name in ('holders', 'waiters', 'seen')]
+
+    def try_acquire(self, ticket, now, limit, lease, priority=None):
+        if self._acquire is None:
+            self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+        priority = now if priority is None else priority
+        return int(self._acquire(keys=self.keys, args=[ticket, now, limit, lease, WAITER_TIMEOUT, priority]))
+
+    def release(self, ticket):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.keys[0], ticket)
+        pipe.zrem(self.keys[1], ticket)
+        pipe.zrem(self.keys[2], ticket)
+        pipe.execute()
+
+    def reserve(self, key, now, rate, burst):
+        if self._reserve is None:
+            self._reserve = self.redis.register_script(RESERVE_SCRIPT)
+        value = self._reserve(keys=[REDIS_PREFIX + 'user:' + key], args=[now, rate, burst])
+        return float(value.decode() if isinstance(value, bytes) else value)
+
+    def depth(self):
+        pipe = self.redis.pipeline()
+        pipe.zcard(self.keys[1])
+        pipe.zcount(self.keys[0], time.time(), '+inf')
+        waiting, holding = pipe.execute()
+        return waiting, holding
+
+
+class AdmissionController:
+    """全域並行上限與每位使用者的速率限制；Redis 失敗時暫時改用程序內計數"""
+
+    def __init__(self, redis_client=None, max_concurrent=ADMISSION_MAX_CONCURRENT,
+                 user_rate=ADMISSION_USER_RATE, user_burst=ADMISSION_USER_BURST,
+                 max_wait=ADMISSION_MAX_WAIT, lease_seconds=ADMISSION_LEASE_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.user_rate = user_rate / 60
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self.lease_seconds = lease_seconds
+        self.local = _LocalBackend()
+        self.redis = _RedisBackend(redis_client) if redis_client is not None else None
+        self._redis_down_until = 0
+        self._depth = None
+
+    def _call(self, method, *args):
+        """以 Redis 執行，失敗時改用程序內計數；回傳 (使用的 backend, 結果)"""
+        if self.redis is not None and time.time() >= self._redis_down_until:
+            try:
+                return self.redis, getattr(self.redis, method)(*args)
+            except Exception as e:
+                # 多個執行緒同時失敗時只記錄一次
+                if time.time() >= self._redis_down_until:
+                    logger.warning(f"流量控制無法使用 Redis，{REDIS_RETRY_SECONDS} 秒內改用程序內計數: {str(e)}")
+                self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+        return self.local, getattr(self.local, method)(*args)
+
+    def reserve_user(self, user_id):
+        """為使用者預約一次處理，回傳需延後的秒數（0 表示可立即處理）"""
+        if self.user_rate <= 0:
+            return 0.0
+        _, wait = self._call('reserve', user_id, time.time(), self.user_rate, self.user_burst)
+        if wait > 0:
+            ADMISSION_WAIT_SECONDS.observe(wait, kind='user')
+            logger.info(f"使用者 {user_id} 超過速率限制，延後 {wait:.1f} 秒處理")
+        return wait
+
+    def _try_acquire(self, ticket, priority=None, previous=None):
+        backend, position = self._call(
+            'try_acquire', ticket, time.time(), self.max_concurrent, self.lease_seconds, priority
+        )
+        if previous is not None and backend is not previous:
+            # 排隊中途切換 Redis／程序內計數時，撤回在原 backend 的排隊登記
+            self._release(previous, ticket)
+        return backend, position
+
+    def _waited(self, started, position, notifier, priority=None):
+        """排隊中每次輪詢：超過時間上限時放棄，排隊過久時通知使用者，背景工作改為延後執行"""
+        waited = time.monotonic() - started
+        if waited > self.max_wait:
+            raise AdmissionTimeout(f"等待模型呼叫名額超過 {self.max_wait:.0f} 秒（排隊位置 {position}）")
+        if notifier is not None:
+            if waited >= ADMISSION_NOTIFY_AFTER:
+                notifier.notify(position)
+            if notifier.defer_after is not None and waited >= notifier.defer_after:
+                ADMISSION_WAIT_SECONDS.observe(waited, kind='deferred')
+                raise AdmissionBusy(position, priority)
+
+    def _acquired(self, started, position):
+        waited = time.monotonic() - started
+        ADMISSION_WAIT_SECONDS.observe(waited, kind='model')
+        if waited >= 1:
+            logger.info(f"等待模型呼叫名額 {waited:.1f} 秒（最初排在第 {position} 位）")
+            tracing.set_attribute('admission.wait_seconds', round(waited, 3))
+
+    @contextmanager
+    def slot(self):
+        """取得一個模型呼叫名額，名額不足時排隊等待"""
+        ticket = uuid.uuid4().hex
+        notifier = _queue_notifier_var.get()
+        priority = notifier.ticket_priority(time.time()) if notifier is not None else None
+        started = time.monotonic()
+        backend, position = self._try_acquire(ticket, priority)
+        first_position = position
+        try:
+            while position:
+                self._waited(started, position, notifier, priority)
+                time.sleep(POLL_INTERVAL)
+                backend, position = self._try_acquire(ticket, priority, backend)
+        except BaseException:
+            self._release(backend, ticket)
+            raise
+        self._acquired(started, first_position)
+        try:
+            yield
+        finally:
+            self._release(backend, ticket)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """slot() 的非同步版本；Redis 操作在執行緒中進行，排隊時不佔用事件迴圈"""
+        loop = asyncio.get_running_loop()
+        ticket = uuid.uuid4().hex
+        started = time.monotonic()
+        backend, position = await loop.run_in_executor(None, self._try_acquire, ticket)
+        first_position = position
+        try:
+            while position:
+                self._waited(started, position, None)
+                await asyncio.sleep(POLL_INTERVAL)
+                backend, position = await loop.run_in_executor(None, self._try_acquire, ticket, None, backend)
+        except BaseException:
+            await loop.run_in_executor(None, self._release, backend, ticket)
+            raise
+        self._acquired(started, first_position)
+        try:
+            yield
+        finally:
+            await loop.run_in_executor(None, self._release, backend, ticket)
+
+    def _release(self, backend, ticket):
+        try:
+            backend.release(ticket)
+        except Exception as e:
+            # 名額會在保留時間後自動釋放
+            logger.warning(f"釋放模型呼叫名額失敗: {str(e)}")
+
+    def depth(self):
+        """(排隊中的呼叫數, 進行中的呼叫數)；短時間內重複查詢時沿用上次結果"""
+        cached = self._depth
+        if cached is not None and time.monotonic() - cached[0] < DEPTH_CACHE_SECONDS:
+            return cached[1]
+        _, result = self._call('depth')
+        self._depth = (time.monotonic(), result)
+        return result
+
+
+controller = AdmissionController(clients.redis_client)
+
+metrics.gauge('admission_queue_depth', '等待模型呼叫名額的請求數', callback=lambda: controller.depth()[0])
+metrics.gauge('admission_slots_in_use', '使用中的模型呼叫名額', callback=lambda: controller.depth()[1])
+
+
+def model_slot(held=False):
+    """with admission.model_slot(): ... 取得模型呼叫名額；停用時或呼叫端已持有名額（held）時不做事"""
+    if not ADMISSION_ENABLED or held:
+        return _NULL_CONTEXT
+    return controller.slot()
+
+
+def reserve_user(user_id):
+    """為使用者預約一次處理，回傳需延後的秒數；停用時回傳 0"""
+    if not ADMISSION_ENABLED:
+        return 0.0
+    return controller.reserve_user(user_id)
+
+
+def amodel_slot(held=False):
+    if not ADMISSION_ENABLED or held:
+        return _ASYNC_NULL_CONTEXT
+    return controller.aslot()
+
+
+class _AsyncNullContext:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+_ASYNC_NULL_CONTEXT = _AsyncNullContext()
@@ -1,63 +1,93 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 import traceback
-import tempfile
-from pydub import AudioSegment
-from openai import OpenAI
-import json
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage,
     AudioMessage, AudioSendMessage,
-    RichMenu, RichMenuArea, RichMenuBounds, RichMenuSize,
     PostbackAction, MessageAction, URIAction,
     QuickReply, QuickReplyButton,
     FlexSendMessage
 )
-from flask import Flask, request, abort, jsonify
-from PIL import Image, ImageDraw, ImageFont
-import requests
-import numpy as np
+from flask import Flask, Blueprint, Response, request, abort, jsonify
 from dotenv import load_dotenv
-import redis
+import clients
+from logging_setup import configure_logging, init_flask
+import openai_client
+import metrics
+import tracing
+import admission
+from job_queue import JobQueue, JobDeferred, select_backend
+from audio_ingest import ingest_stream
+from result_cache import file_sha256, transcription_key, report_key
+# 轉錄設定、切段轉錄器與結果快取（重送相同音訊或 webhook 重試時不再重複呼叫 API）與網頁版共用
+from whisper_service import WHISPER_MODEL, WHISPER_LANGUAGE, transcriber, result_cache
+from idempotency import IdempotencyGuard, event_key
+from rich_menu_assets import image_cache, MAIN_MENU_BUTTONS, VIEW_RECORDS_MENU_BUTTONS
+from rich_menu_registry import RichMenuRegistry, MENU_MAIN, MENU_VIEW_RECORDS
+from health import HealthMonitor
+from record_store import RecordStore, RECORD_SCOPE
+from search_index import SearchIndex, results_to_flex, parse_search_command
+from patient_index import PatientIndex, format_timeline, parse_bed_command
 
 # 載入環境變數
 load_dotenv()
 
-# 確認環境變數是否正確載入
-print("LINE_CHANNEL_ACCESS_TOKEN:", os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
-print("LINE_CHANNEL_SECRET:", os.getenv('LINE_CHANNEL_SECRET'))
+# 外部服務客戶端（第一次使用時才建立，不在匯入時連線）
+redis_client = clients.redis_client
+client = clients.openai_client
+line_bot_api = clients.line_bot_api
 
-# Redis 連線
-redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
-redis_client = redis.from_url(redis_url)
-
-# 使用環境變數
-client = OpenAI(
-    api_key=os.getenv('OPENAI_API_KEY')
-)
-
-# 設定日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# 設定日誌（背景執行緒寫檔、JSON 格式、自動輪替）
+configure_logging()
+tracing.configure_tracing()
 logger = logging.getLogger(__name__)
 
-# 設定 Line Bot API
-line_bot_api = LineBotApi(os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
+# 設定 Line Bot webhook
 handler = WebhookHandler(os.getenv('LINE_CHANNEL_SECRET'))
 
-app = Flask(__name__)
+bot = Blueprint('line_bot', __name__)
+
+# 照護記錄儲存（SQLite 索引 + append-only 音訊檔）
+record_store = RecordStore()
+
+# 全文搜尋索引（與記錄共用資料庫，保存時增量更新）
+search_index = SearchIndex(record_store)
+
+# 依床號的交接歷程索引（從報告擷取床號與重點標記）
+patient_index = PatientIndex(record_store)
+
+
+# webhook 事件去重（LINE 重送時不重複處理）
+event_guard = IdempotencyGuard(redis_client)
+
+# Rich Menu 註冊表（選單於部署時建立，執行期間只做快取查詢）
+rich_menu_registry = RichMenuRegistry(line_bot_api, redis_client)
+
+# 背景工作佇列：webhook 只負責排入工作，下載、轉錄、報告與儲存由 worker 執行
+# （佇列後端在 worker 第一次取工作時才決定，不在啟動時連線 Redis）
+# 是否在 web 程序內執行 worker；設為 0 時由 worker.py 處理，Redis 無法連線時不可改用程序內佇列
+JOB_WORKERS_IN_PROCESS = os.getenv('JOB_WORKERS_IN_PROCESS', '1') == '1'
+job_queue = JobQueue(lambda: select_backend(redis_client, allow_local=JOB_WORKERS_IN_PROCESS))
+
+# 相依服務健康檢查（背景並行執行，/status 只讀取結果）
+health_monitor = HealthMonitor({
+    # 檢查 Line Bot API Token
+    'line_bot': lambda: line_bot_api.get_bot_info(),
+    # 檢查 OpenAI API Key（只查詢單一模型，不列出全部模型）
+    'openai': lambda: client.models.retrieve("whisper-1"),
+    # 檢查 Redis 連線
+    'redis': lambda: redis_client.ping()
+})
+
+# 輸出 /metrics 時才讀取的即時數值
+metrics.gauge('job_queue_depth', '背景工作佇列中等待的工作數', callback=lambda: job_queue.size())
+metrics.gauge('openai_in_flight', '進行中的 OpenAI API 請求數', callback=lambda: openai_client.pool_stats()['in_flight'])
 
 # 健康檢查路由
-@app.route("/callback", methods=['GET'])
+@bot.route("/callback", methods=['GET'])
 def health_check():
     try:
         return jsonify({
@@ -72,26 +102,18 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@app.route("/status", methods=['GET'])
+@bot.route("/status", methods=['GET'])
 def status_check():
-    """詳細的狀態檢查"""
+    """詳細的狀態檢查（回傳背景檢查的快取結果，不在請求中呼叫外部服務）"""
     try:
-        # 檢查 Line Bot API Token
-        line_bot_api.get_bot_info()
-        # 檢查 OpenAI API Key
-        client.models.list()
-        # 檢查 Redis 連線
-        redis_client.ping()
-        
+        health = health_monitor.snapshot()
         return jsonify({
-            "status": "healthy",
-            "services": {
-                "line_bot": "connected",
-                "openai": "connected",
-                "redis": "connected"
-            },
+            "status": health['status'],
+            "services": health['services'],
+            "cache": result_cache.stats(),
+            "openai_pool": openai_client.pool_stats(),
             "timestamp": datetime.now().isoformat()
-        }), 200
+        }), 500 if health['status'] == 'unhealthy' else 200
     except Exception as e:
         logger.error(f"狀態檢查失敗: {str(e)}")
         return jsonify({
@@ -100,14 +122,21 @@ def status_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@app.route("/", methods=['GET'])
+@bot.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 格式的處理延遲與用量指標（METRICS_ENABLED=0 時停用）"""
+    if not metrics.METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bot.route("/", methods=['GET'])
 def root():
     return jsonify({
         "status": "ok",
         "message": "Service is running"
     }), 200
 
-@app.route("/callback", methods=['POST'])
+@bot.route("/callback", methods=['POST'])
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
@@ -117,81 +146,60 @@ def callback():
         abort(400)
     return 'OK'
 
-def transcribe_audio(audio_file_path):
-    """使用 OpenAI Whisper API 將音訊檔案轉換為文字"""
+def transcribe_audio(audio):
+    """使用 OpenAI Whisper API 將音訊轉換為文字
+
+    audio 可為檔案路徑或 SpooledAudio 緩衝區。
+    """
     try:
-        logger.info(f"開始處理音訊檔案: {audio_file_path}")
-        
-        if not os.path.exists(audio_file_path):
-            raise FileNotFoundError(f"找不到音訊檔案: {audio_file_path}")
-            
-        file_size = os.path.getsize(audio_file_path)
+        if isinstance(audio, str):
+            logger.info(f"開始處理音訊檔案: {audio}")
+            if not os.path.exists(audio):
+                raise FileNotFoundError(f"找不到音訊檔案: {audio}")
+            file_size = os.path.getsize(audio)
+            audio_hash = file_sha256(audio)
+        else:
+            logger.info("開始處理音訊緩衝區")
+            file_size = audio.size
+            audio_hash = audio.sha256
         logger.info(f"音訊檔案大小: {file_size} bytes")
         
-        with open(audio_file_path, "rb") as audio_file:
-            logger.info("開始呼叫 Whisper API")
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="zh"
-            )
+        text = result_cache.get_or_compute(
+            transcription_key(audio_hash, WHISPER_MODEL, WHISPER_LANGUAGE),
+            lambda: transcriber.transcribe(audio)
+        )
             
         logger.info("語音轉文字成功完成")
-        return response.text
+        return text
 
+    except admission.AdmissionBusy:
+        raise
     except Exception as e:
         logger.error(f"語音轉文字失敗: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
-def save_transcription_log(log_data, audio_file_path):
-    """保存轉錄記錄和語音檔案"""
+def save_transcription_log(log_data, audio):
+    """保存轉錄記錄和語音檔案
+
+    audio 為 SpooledAudio 緩衝區，音訊只附加寫入音訊檔一次。
+    """
     try:
-        timestamp = log_data['timestamp']
-        
-        # 建立主要儲存目錄
-        base_folder = os.path.join(os.getcwd(), 'records')
-        os.makedirs(base_folder, exist_ok=True)
-        
-        # 建立以日期為名的子目錄
-        date_folder = os.path.join(base_folder, timestamp[:8])  # YYYYMMDD
-        os.makedirs(date_folder, exist_ok=True)
-        
-        # 建立此次記錄的目錄
-        record_folder = os.path.join(date_folder, timestamp[9:])  # HHMMSS
-        os.makedirs(record_folder, exist_ok=True)
-        
-        # 保存音訊檔案
-        audio_extension = os.path.splitext(audio_file_path)[1]
-        new_audio_path = os.path.join(record_folder, f'audio{audio_extension}')
-        import shutil
-        shutil.copy2(audio_file_path, new_audio_path)
-        logger.info(f"音訊檔案已保存: {new_audio_path}")
-        
-        # 保存原始文字
-        raw_text_path = os.path.join(record_folder, 'raw_text.txt')
-        with open(raw_text_path, 'w', encoding='utf-8') as f:
-            f.write(log_data['raw_transcription'])
-        logger.info(f"原始文字已保存: {raw_text_path}")
-        
-        # 保存整理後的報告
-        report_path = os.path.join(record_folder, 'report.md')
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(log_data['formatted_report'])
-        logger.info(f"整理後報告已保存: {report_path}")
-        
-        # 保存完整記錄
-        log_path = os.path.join(record_folder, 'record.json')
-        with open(log_path, 'w', encoding='utf-8') as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
-        logger.info(f"完整記錄已保存: {log_path}")
+        with metrics.track('record_save'), tracing.span('record_save'):
+            record_id = record_store.add(log_data, audio=audio)
+        logger.info(f"記錄已保存，記錄ID: {record_id}")
         
-        return {
-            'audio_file': new_audio_path,
-            'raw_text': raw_text_path,
-            'report': report_path,
-            'record': log_path
-        }
+        # 更新搜尋索引
+        search_index.index_record(
+            record_id, log_data['raw_transcription'], log_data['formatted_report']
+        )
+
+        # 擷取床號與重點標記
+        beds = patient_index.index_record(
+            record_id, log_data['timestamp'], log_data['raw_transcription'], log_data['formatted_report']
+        )
+        logger.info(f"已擷取 {beds} 床的交接重點")
+        return {'record_id': record_id}
             
     except Exception as e:
         logger.error(f"記錄保存失敗: {str(e)}")
@@ -200,79 +208,243 @@ def save_transcription_log(log_data, audio_file_path):
 
 @handler.add(MessageEvent, message=AudioMessage)
 def handle_audio_message(event):
-    """處理音訊訊息"""
+    """處理音訊訊息：排入背景工作後立即返回，讓 webhook 能即時回應"""
+    dedup_key = event_key(event)
+    if not event_guard.claim(dedup_key):
+        logger.info(f"略過重複的 webhook 事件: {dedup_key}")
+        return
+
     try:
-        logger.info("開始處理音訊訊息")
-        
-        # 取得音訊內容
-        message_content = line_bot_api.get_message_content(event.message.id)
-        logger.info(f"已取得音訊內容，訊息ID: {event.message.id}")
-        
-        # 建立臨時檔案
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.m4a') as tf:
-            for chunk in message_content.iter_content():
-                tf.write(chunk)
-            audio_path = tf.name
-        logger.info(f"已儲存音訊檔案至: {audio_path}")
-        
-        # 轉換音訊
-        raw_text = transcribe_audio(audio_path)
-        logger.info("音訊轉換完成")
-        
-        # 使用 ChatGPT 處理
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        with tracing.span('enqueue_audio_job', **{'line.message_id': event.message.id}):
+            job_id = job_queue.enqueue(
+                'audio_message',
+                message_id=event.message.id,
+                line_user_id=event.source.user_id,
+                duration_ms=event.message.duration
+            )
+        logger.info(f"音訊訊息已排入背景處理，訊息ID: {event.message.id}，工作ID: {job_id}")
+    except Exception as e:
+        logger.error(f"排入音訊工作時發生錯誤: {str(e)}")
+        logger.error(traceback.format_exc())
+        event_guard.release(dedup_key)
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text=f"處理音訊時發生錯誤，請稍後再試。\n錯誤訊息：{str(e)}")
+        )
+
+def download_audio(message_id, duration_ms=None):
+    """串流下載 LINE 音訊內容，小檔案保留在記憶體中"""
+    with metrics.track('download'), tracing.span('download', **{'line.message_id': message_id}):
+        message_content = line_bot_api.get_message_content(message_id)
+        logger.info(f"已取得音訊內容，訊息ID: {message_id}")
+        return ingest_stream(message_content.iter_content(), suffix='.m4a', duration_ms=duration_ms)
+
+REPORT_MODEL = "gpt-3.5-turbo"
+REPORT_SYSTEM_PROMPT = """你是一位專業的護理紀錄轉換助手。
+請將輸入的口語記錄轉換為正式的護理交接報告。"""
+
+def generate_handover_report(raw_text):
+    """使用 ChatGPT 將口語記錄整理為交接報告"""
+    def create_report():
+        response = openai_client.chat(
+            model=REPORT_MODEL,
             messages=[
-                {"role": "system", "content": """你是一位專業的護理紀錄轉換助手。
-請將輸入的口語記錄轉換為正式的護理交接報告。"""},
+                {"role": "system", "content": REPORT_SYSTEM_PROMPT},
                 {"role": "user", "content": raw_text}
             ],
             temperature=0.3
         )
-        
-        formatted_report = response.choices[0].message.content
+        return response.choices[0].message.content
+
+    return result_cache.get_or_compute(
+        report_key(raw_text, REPORT_MODEL, REPORT_SYSTEM_PROMPT),
+        create_report
+    )
+
+@job_queue.handler('audio_message')
+def process_audio_job(data):
+    """背景處理音訊訊息：下載 → 轉錄 → 報告 → 儲存，再以 push_message 回傳"""
+    user_id = data['line_user_id']
+    if not data.get('admitted'):
+        # 同一位使用者短時間內送出過多語音時延後處理，不佔用 worker
+        wait = admission.reserve_user(user_id)
+        if wait > 0:
+            # 通知失敗時仍須延後工作，已預約的名額不能浪費、語音也不能遺失
+            try:
+                line_bot_api.push_message(
+                    user_id, TextSendMessage(text=f"您送出的語音較多，將於約 {max(1, round(wait))} 秒後自動開始處理")
+                )
+            except Exception as e:
+                logger.error(f"推送延後處理通知失敗: {str(e)}")
+            raise JobDeferred(wait, admitted=True)
+
+    # 名額不足而延後重新執行時沿用的進度，避免重複通知與重複推送轉錄結果
+    progress = {
+        'queue_notified': data.get('queue_notified', False),
+        'transcript_sent': data.get('transcript_sent', False)
+    }
+    # 延後次數達上限後不再延後，改在 worker 內排隊等待名額
+    deferrals = data.get('deferrals', 0)
+    defer_after = admission.ADMISSION_DEFER_AFTER
+    if deferrals >= admission.ADMISSION_MAX_DEFERRALS:
+        logger.warning(f"工作已延後 {deferrals} 次，改在 worker 內等待模型呼叫名額")
+        defer_after = None
+
+    def notify_queued(position):
+        if progress['queue_notified']:
+            return
+        progress['queue_notified'] = True
+        line_bot_api.push_message(
+            user_id, TextSendMessage(text=f"目前使用人數較多，已排入處理佇列（第 {position} 位），輪到時會自動開始處理")
+        )
+
+    try:
+        logger.info(f"開始處理音訊訊息，訊息ID: {data['message_id']}")
+
+        # 取得音訊內容
+        audio = download_audio(data['message_id'], data.get('duration_ms'))
+
+        # 轉換音訊（模型呼叫名額不足時排隊，並通知使用者排隊位置）
+        # 重新執行時沿用第一次排隊的順位
+        with admission.queue_notifications(notify_queued, defer_after=defer_after,
+                                           priority=data.get('admission_priority')):
+            with metrics.track('transcribe'), tracing.span('transcribe'):
+                raw_text = transcribe_audio(audio)
+            logger.info("音訊轉換完成")
+
+            # 報告生成需要較久，先推送轉錄結果
+            if not progress['transcript_sent']:
+                line_bot_api.push_message(user_id, TextSendMessage(text="原始轉錄文字：\n" + raw_text))
+                progress['transcript_sent'] = True
+
+            # 使用 ChatGPT 處理
+            with metrics.track('report'), tracing.span('report'):
+                formatted_report = generate_handover_report(raw_text)
         logger.info("報告生成完成")
-        
+
         # 儲存記錄
         log_data = {
             'timestamp': datetime.now().strftime('%Y%m%d_%H%M%S'),
-            'audio_file': audio_path,
             'raw_transcription': raw_text,
             'formatted_report': formatted_report,
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'line_user_id': event.source.user_id
+            'line_user_id': user_id
         }
-        
-        save_paths = save_transcription_log(log_data, audio_path)
+
+        save_paths = save_transcription_log(log_data, audio)
         logger.info(f"記錄已儲存: {save_paths}")
-        
-        # 回傳處理結果
-        messages = [
-            TextSendMessage(text="原始轉錄文字：\n" + raw_text),
-            TextSendMessage(text="整理後報告：\n" + formatted_report)
-        ]
-        line_bot_api.reply_message(event.reply_token, messages)
-        logger.info("已回傳處理結果")
-        
+
+        # 回傳處理結果（reply token 已過期，改用 push_message）
+        line_bot_api.push_message(
+            user_id, TextSendMessage(text="整理後報告：\n" + formatted_report)
+        )
+        logger.info("已推送處理結果")
+
+    except admission.AdmissionBusy as e:
+        # 不佔用 worker 空等名額，整個工作稍後重新執行（轉錄與報告結果已快取的部分不會重新呼叫模型）
+        logger.info(f"{str(e)}，工作延後 {e.retry_after} 秒重新執行")
+        raise JobDeferred(e.retry_after, admitted=True, deferrals=deferrals + 1,
+                          admission_priority=e.priority, **progress)
     except Exception as e:
         logger.error(f"處理音訊訊息時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
-        line_bot_api.reply_message(
-            event.reply_token,
+        line_bot_api.push_message(
+            user_id,
             TextSendMessage(text=f"處理音訊時發生錯誤，請稍後再試。\n錯誤訊息：{str(e)}")
         )
     finally:
-        # 清理臨時檔案
-        if 'audio_path' in locals():
-            try:
-                os.remove(audio_path)
-                logger.info(f"已清理臨時檔案: {audio_path}")
-            except Exception as e:
-                logger.error(f"清理臨時檔案時發生錯誤: {str(e)}")
+        # 釋放音訊緩衝區
+        if 'audio' in locals():
+            audio.close()
+
+RECORD_QUERIES = {
+    '查看今日記錄': '今日記錄',
+    '查看本週記錄': '本週記錄',
+    '查看全部記錄': '全部記錄'
+}
+RECORD_LIST_LIMIT = 10
+
+def record_owner(event):
+    """查詢記錄時限定的使用者；RECORD_SCOPE=ward 時全病房共用，不限定"""
+    if RECORD_SCOPE == 'ward':
+        return None
+    return event.source.user_id
+
+def format_record_list(title, since=None, line_user_id=None):
+    """以索引查詢記錄並整理成文字訊息"""
+    total = record_store.count(since=since, line_user_id=line_user_id)
+    records = record_store.list_records(since=since, line_user_id=line_user_id, limit=RECORD_LIST_LIMIT)
+    if not records:
+        return f"{title}：目前沒有記錄"
+
+    lines = [f"{title}（共 {total} 筆，顯示最新 {len(records)} 筆）"]
+    for record in records:
+        summary = record['formatted_report'].strip().splitlines()
+        summary = summary[0][:40] if summary else ''
+        lines.append(f"• {record['created_at']}  {summary}")
+    return "\n".join(lines)
+
+def reply_search_results(event, query, page):
+    """回傳搜尋結果的 Flex 訊息"""
+    results, total = search_index.search(query, page=page, line_user_id=record_owner(event))
+    if not results:
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text=f"找不到與「{query}」相關的記錄")
+        )
+        return
+    line_bot_api.reply_message(
+        event.reply_token,
+        FlexSendMessage(
+            alt_text=f"「{query}」的搜尋結果（共 {total} 筆）",
+            contents=results_to_flex(query, results, page, total)
+        )
+    )
 
 @handler.add(MessageEvent, message=TextMessage)
 def handle_text_message(event):
     text = event.message.text
+    if text == '搜尋記錄':
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text="請輸入「搜尋 關鍵字」，例如：搜尋 壓傷")
+        )
+        return
+    search_command = parse_search_command(text)
+    if search_command:
+        reply_search_results(event, *search_command)
+        return
+    bed_command = parse_bed_command(text)
+    if bed_command:
+        bed, flag = bed_command
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text=format_timeline(
+                bed, patient_index.timeline(bed, flag=flag, line_user_id=record_owner(event))
+            ))
+        )
+        return
+    if text in RECORD_QUERIES:
+        now = datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        since = {
+            '查看今日記錄': today,
+            '查看本週記錄': today - timedelta(days=today.weekday()),
+            '查看全部記錄': None
+        }[text]
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text=format_record_list(RECORD_QUERIES[text], since, record_owner(event)))
+        )
+        return
+    if text == '查看記錄':
+        send_response_with_rich_menu(
+            event, TextSendMessage(text="請從下方選單選擇要查看的記錄"), MENU_VIEW_RECORDS
+        )
+        return
+    if text == '返回主選單':
+        send_response_with_rich_menu(event, TextSendMessage(text="已返回主選單"), MENU_MAIN)
+        return
     line_bot_api.reply_message(
         event.reply_token,
         TextSendMessage(text=f"收到訊息：{text}")
@@ -296,176 +468,30 @@ def delete_all_rich_menu():
 def create_rich_menu():
     """建立主選單"""
     try:
-        rich_menu_to_create = RichMenu(
-            size=RichMenuSize(width=2500, height=1686),
-            selected=True,
-            name="主選單",
-            chat_bar_text="開啟選單",
-            areas=[
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=0, y=0, width=833, height=843),
-                    action=MessageAction(label='使用說明', text='使用說明')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=833, y=0, width=833, height=843),
-                    action=MessageAction(label='上傳資料', text='上傳資料')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=1666, y=0, width=834, height=843),
-                    action=MessageAction(label='查看記錄', text='查看記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=0, y=843, width=833, height=843),
-                    action=MessageAction(label='文字記錄', text='文字記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=833, y=843, width=833, height=843),
-                    action=MessageAction(label='語音記錄', text='語音記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=1666, y=843, width=834, height=843),
-                    action=MessageAction(label='設定', text='設定')
-                )
-            ]
-        )
-        
-        rich_menu_id = line_bot_api.create_rich_menu(rich_menu=rich_menu_to_create)
-        
-        # 生成並上傳圖片
-        image_path = create_rich_menu_image()  # 使用原本的主選單圖片生成函數
-        with open(image_path, 'rb') as f:
-            line_bot_api.set_rich_menu_image(rich_menu_id, "image/png", f)
-        
-        return rich_menu_id
-        
+        return rich_menu_registry.create_menu(MENU_MAIN)
     except Exception as e:
         logger.error(f"建立主選單時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
 def create_rich_menu_image():
-    """生成 Rich Menu 圖片"""
+    """取得主選單 Rich Menu 圖片路徑（同一版面只生成一次）"""
     try:
-        logger.info("開始生成 Rich Menu 圖片")
-        
-        # 建立目錄
-        os.makedirs('static/images', exist_ok=True)
-        
-        # 定義按鈕資訊
-        buttons = [
-            {
-                'text': '使用說明',
-                'color': '#FF6B6B'  # 溫暖的紅色
-            },
-            {
-                'text': '上傳資料',
-                'color': '#4ECDC4'  # 清新的藍綠色
-            },
-            {
-                'text': '查看記錄',
-                'color': '#45B7D1'  # 天空藍
-            },
-            {
-                'text': '文字記錄',
-                'color': '#96CEB4'  # 薄荷綠
-            },
-            {
-                'text': '語音記錄',
-                'color': '#FF8B94'  # 粉紅色
-            },
-            {
-                'text': '設定',
-                'color': '#7C8DA5'  # 灰藍色
-            }
-        ]
-        
-        # 創建主圖片
-        width = 2500
-        height = 1686
-        image = Image.new('RGB', (width, height), '#FFFFFF')
-        draw = ImageDraw.Draw(image)
-        
-        # 繪製圓形按鈕
-        for i in range(6):
-            row = i // 3
-            col = i % 3
-            
-            center_x = 416 + (col * 833)
-            center_y = 421 + (row * 843)
-            radius = 300
-            
-            # 繪製主圓形
-            circle_bbox = [
-                center_x - radius,
-                center_y - radius,
-                center_x + radius,
-                center_y + radius
-            ]
-            draw.ellipse(circle_bbox, fill=buttons[i]['color'])
-            
-            try:
-                font = ImageFont.truetype("simsun.ttc", 100)
-            except:
-                try:
-                    font = ImageFont.truetype("NotoSansCJK-Regular.ttc", 100)
-                except:
-                    font = ImageFont.load_default()
-            
-            # 繪製文字
-            text = buttons[i]['text']
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            
-            # 將文字位置上移
-            text_y = center_y - 30  # 上移文字位置
-            
-            # 文字外框
-            outline_color = '#000000'
-            outline_width = 4
-            for offset_x, offset_y in [(x,y) for x in range(-outline_width, outline_width+1) 
-                                            for y in range(-outline_width, outline_width+1)]:
-                draw.text(
-                    (center_x - text_width/2 + offset_x, text_y + offset_y),
-                    text,
-                    font=font,
-                    fill=outline_color
-                )
-            
-            # 主要文字
-            draw.text(
-                (center_x - text_width/2, text_y),
-                text,
-                font=font,
-                fill='#FFFFFF'
-            )
-        
-        # 保存圖片
-        image_path = 'static/images/rich_menu.png'
-        image.save(image_path, 'PNG')
-        logger.info(f"Rich Menu 圖片已生成: {image_path}")
-        
-        return image_path
-        
+        return image_cache.get_path(MAIN_MENU_BUTTONS)
     except Exception as e:
         logger.error(f"生成 Rich Menu 圖片時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
-def send_response_with_rich_menu(event, messages):
+def send_response_with_rich_menu(event, messages, menu=MENU_MAIN):
     """發送回應並確保顯示 Rich Menu"""
     try:
         # 發送訊息
         line_bot_api.reply_message(event.reply_token, messages)
         
-        # 確保 Rich Menu 顯示
-        user_id = event.source.user_id
+        # 主選單為預設選單，只有切換選單時才需要呼叫 API（連結狀態已快取）
         try:
-            # 檢查是否已有 Rich Menu
-            current_rich_menu = line_bot_api.get_rich_menu_id_of_user(user_id)
-            if not current_rich_menu:
-                # 如果沒有，重新設定 Rich Menu
-                rich_menu_id = create_rich_menu()
-                line_bot_api.link_rich_menu_to_user(user_id, rich_menu_id)
+            rich_menu_registry.link(event.source.user_id, menu)
         except Exception as e:
             logger.error(f"設定 Rich Menu 時發生錯誤: {str(e)}")
             
@@ -476,169 +502,45 @@ def send_response_with_rich_menu(event, messages):
 def create_view_records_rich_menu():
     """建立查看記錄的 Rich Menu"""
     try:
-        rich_menu_to_create = RichMenu(
-            size=RichMenuSize(width=2500, height=1686),
-            selected=True,
-            name="查看記錄選單",
-            chat_bar_text="查看記錄選單",
-            areas=[
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=0, y=0, width=833, height=843),
-                    action=MessageAction(label='今日記錄', text='查看今日記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=833, y=0, width=833, height=843),
-                    action=MessageAction(label='本週記錄', text='查看本週記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=1666, y=0, width=834, height=843),
-                    action=MessageAction(label='搜尋記錄', text='搜尋記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=0, y=843, width=833, height=843),
-                    action=MessageAction(label='全部記錄', text='查看全部記錄')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=833, y=843, width=833, height=843),
-                    action=MessageAction(label='返回主選單', text='返回主選單')
-                ),
-                RichMenuArea(
-                    bounds=RichMenuBounds(x=1666, y=843, width=834, height=843),
-                    action=MessageAction(label='新增記錄', text='文字記錄')
-                )
-            ]
-        )
-        
-        rich_menu_id = line_bot_api.create_rich_menu(rich_menu=rich_menu_to_create)
-        
-        # 生成並上傳圖片
-        image_path = create_view_records_rich_menu_image()
-        with open(image_path, 'rb') as f:
-            line_bot_api.set_rich_menu_image(rich_menu_id, "image/png", f)
-            
-        return rich_menu_id
-        
+        return rich_menu_registry.create_menu(MENU_VIEW_RECORDS)
     except Exception as e:
         logger.error(f"建立查看記錄 Rich Menu 時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
 def create_view_records_rich_menu_image():
-    """生成查看記錄的 Rich Menu 圖片"""
+    """取得查看記錄 Rich Menu 圖片路徑（同一版面只生成一次）"""
     try:
-        # 建立目錄
-        os.makedirs('static/images', exist_ok=True)
-        
-        # 定義按鈕資訊
-        buttons = [
-            {
-                'text': '今日記錄',
-                'color': '#4ECDC4'  # 青綠色
-            },
-            {
-                'text': '本週記錄',
-                'color': '#45B7D1'  # 天空藍
-            },
-            {
-                'text': '搜尋記錄',
-                'color': '#96CEB4'  # 薄荷綠
-            },
-            {
-                'text': '全部記錄',
-                'color': '#FF8B94'  # 粉紅色
-            },
-            {
-                'text': '返回主選單',
-                'color': '#7C8DA5'  # 灰藍色
-            },
-            {
-                'text': '新增記錄',
-                'color': '#FF6B6B'  # 溫暖的紅色
-            }
-        ]
-        
-        # 創建主圖片
-        width = 2500
-        height = 1686
-        image = Image.new('RGB', (width, height), '#FFFFFF')
-        draw = ImageDraw.Draw(image)
-        
-        # 繪製按鈕
-        for i in range(6):
-            row = i // 3
-            col = i % 3
-            
-            center_x = 416 + (col * 833)
-            center_y = 421 + (row * 843)
-            radius = 300
-            
-            # 繪製主圓形
-            circle_bbox = [
-                center_x - radius,
-                center_y - radius,
-                center_x + radius,
-                center_y + radius
-            ]
-            draw.ellipse(circle_bbox, fill=buttons[i]['color'])
-            
-            try:
-                font = ImageFont.truetype("simsun.ttc", 100)
-            except:
-                try:
-                    font = ImageFont.truetype("NotoSansCJK-Regular.ttc", 100)
-                except:
-                    font = ImageFont.load_default()
-            
-            # 繪製文字
-            text = buttons[i]['text']
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            
-            # 將文字位置上移
-            text_y = center_y - 30
-            
-            # 文字外框
-            outline_color = '#000000'
-            outline_width = 4
-            for offset_x, offset_y in [(x,y) for x in range(-outline_width, outline_width+1) 
-                                            for y in range(-outline_width, outline_width+1)]:
-                draw.text(
-                    (center_x - text_width/2 + offset_x, text_y + offset_y),
-                    text,
-                    font=font,
-                    fill=outline_color
-                )
-            
-            # 主要文字
-            draw.text(
-                (center_x - text_width/2, text_y),
-                text,
-                font=font,
-                fill='#FFFFFF'
-            )
-        
-        # 保存圖片
-        image_path = 'static/images/view_records_rich_menu.png'
-        image.save(image_path, 'PNG')
-        
-        return image_path
-        
+        return image_cache.get_path(VIEW_RECORDS_MENU_BUTTONS)
     except Exception as e:
         logger.error(f"生成查看記錄 Rich Menu 圖片時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
+def create_app():
+    """建立 Flask 應用程式"""
+    app = Flask(__name__)
+    init_flask(app)
+    tracing.init_flask(app)
+    app.register_blueprint(bot)
+
+    # 網頁版照護記錄（錄音上傳、串流報告）
+    from blueprints.care_record import care_record
+    app.register_blueprint(care_record)
+
+    # 在 web 程序內啟動 worker；設定 JOB_WORKERS_IN_PROCESS=0 時改由 worker.py 獨立處理
+    if JOB_WORKERS_IN_PROCESS:
+        job_queue.start()
+
+    # 背景健康檢查在收到第一個請求時才啟動，匯入與啟動程序時不連線外部服務
+    app.before_request(health_monitor.start)
+
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     # 確保使用環境變數中的 PORT
     port = int(os.environ.get("PORT", 5000))
     logger.info(f"Starting server on port {port}")
     app.run(host='0.0.0.0', port=port)
-
-# 檢查 Rich Menu 狀態
-rich_menu_list = line_bot_api.get_rich_menu_list()
-for menu in rich_menu_list:
-    logger.info(f"Found Rich Menu: {menu.rich_menu_id}")
-
-# 檢查預設 Rich Menu
-default_menu = line_bot_api.get_default_rich_menu()
-logger.info(f"Default Rich Menu: {default_menu}") 
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""非同步（ASGI）服務入口
+
+語音上傳在等待 Whisper 與 GPT 回應時不佔用執行緒，單一程序即可同時處理數百個上傳：
+- /care-record/upload 與 /care-record/upload/stream 由 Starlette 以 AsyncOpenAI 非同步處理
+- 其餘路徑（LINE webhook、狀態檢查、網頁）轉交原本的 Flask app
+
+啟動方式：
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+import logging
+import traceback
+
+import anyio
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import openai_client
+import tracing
+import whisper_service
+from logging_setup import RequestIdMiddleware
+from audio_normalize import normalize_audio
+from app import app as flask_app
+from blueprints.care_record import sse_event, upload_filename, speech_to_text as stt
+from result_cache import file_sha256, transcription_key
+from workspace import JobWorkspace, WorkspaceQuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def traced(handler):
+    """非同步路由的 server span；接續請求標頭中的 traceparent"""
+    async def run(request):
+        with tracing.span(f"{request.method} {request.url.path}", parent=request.headers.get('traceparent'),
+                          kind='server', **{'http.method': request.method, 'http.target': request.url.path}):
+            return await handler(request)
+    return run
+
+
+async def save_upload(upload):
+    """建立獨立的工作目錄並以非同步檔案 I/O 寫入音訊，回傳 (工作目錄, 檔案路徑)"""
+    workspace = await anyio.to_thread.run_sync(JobWorkspace().open)
+    path = workspace.file_path(upload_filename(upload.filename))
+    try:
+        async with await anyio.open_file(path, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                workspace.reserve(len(chunk))
+                await f.write(chunk)
+    except Exception:
+        await anyio.to_thread.run_sync(workspace.cleanup)
+        raise
+    return workspace, path
+
+
+async def remove_upload(path):
+    try:
+        await anyio.Path(path).unlink()
+        logger.info("暫存檔案已清理")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"清理暫存檔案時發生錯誤: {str(e)}")
+
+
+async def transcribe(path, workspace):
+    """轉錄音訊；切段與剪除靜音的規則與同步路徑相同，解碼與切段在執行緒中進行，各段非同步上傳"""
+    audio_sha256 = await anyio.to_thread.run_sync(file_sha256, path)
+    cache_key = transcription_key(audio_sha256, whisper_service.WHISPER_MODEL, whisper_service.WHISPER_LANGUAGE)
+    cached_text = await anyio.to_thread.run_sync(whisper_service.result_cache.get, cache_key)
+    if cached_text is not None:
+        return cached_text
+
+    # Whisper 支援的格式直接上傳，其他格式才以 FFmpeg 轉檔
+    upload_path, transcoded = await anyio.to_thread.run_sync(normalize_audio, path, workspace.path)
+    try:
+        if transcoded:
+            workspace.track(upload_path)
+        text = await whisper_service.transcriber.atranscribe(upload_path)
+    finally:
+        if transcoded:
+            await remove_upload(upload_path)
+    await anyio.to_thread.run_sync(whisper_service.result_cache.set, cache_key, text)
+    return text
+
+
+async def generate_care_report(transcribed_text):
+    """非同步生成照護報告（與 blueprint 共用提示詞與快取）"""
+    cache_key = stt.care_report_cache_key(transcribed_text)
+    cached_report = await anyio.to_thread.run_sync(whisper_service.result_cache.get, cache_key)
+    if cached_report is not None:
+        return cached_report
+
+    response = await openai_client.achat(
+        stt.care_report_messages(transcribed_text),
+        stt.CARE_REPORT_MODEL,
+        temperature=0.7
+    )
+    care_report = response.choices[0].message.content
+    await anyio.to_thread.run_sync(whisper_service.result_cache.set, cache_key, care_report)
+    return care_report
+
+
+async def generate_care_report_stream(transcribed_text):
+    """以串流方式生成照護報告，完整報告產生後寫入快取"""
+    cache_key = stt.care_report_cache_key(transcribed_text)
+    cached_report = await anyio.to_thread.run_sync(whisper_service.result_cache.get, cache_key)
+    if cached_report is not None:
+        yield cached_report
+        return
+
+    parts = []
+    async for delta in openai_client.achat_stream(
+        stt.care_report_messages(transcribed_text),
+        stt.CARE_REPORT_MODEL,
+        temperature=0.7
+    ):
+        parts.append(delta)
+        yield delta
+    await anyio.to_thread.run_sync(whisper_service.result_cache.set, cache_key, ''.join(parts))
+
+
+async def read_audio_upload(request):
+    """讀取表單並儲存音訊，回傳 (工作目錄, 暫存檔路徑, 錯誤回應)"""
+    async with request.form() as form:
+        file = form.get('audio')
+        if file is None or isinstance(file, str):
+            logger.error("沒有收到音訊檔案")
+            return None, None, JSONResponse({'error': '沒有收到音訊檔案'}, status_code=400)
+        if not file.filename:
+            logger.error("沒有選擇檔案")
+            return None, None, JSONResponse({'error': '沒有選擇檔案'}, status_code=400)
+        try:
+            with tracing.span('save_upload'):
+                workspace, path = await save_upload(file)
+        except WorkspaceQuotaExceeded as e:
+            logger.error(f"暫存空間不足: {str(e)}")
+            return None, None, JSONResponse({'error': f"暫存空間不足: {str(e)}"}, status_code=507)
+        return workspace, path, None
+
+
+async def upload_file(request):
+    try:
+        logger.info("開始處理檔案上傳請求（非同步）")
+        workspace, filepath, error_response = await read_audio_upload(request)
+        if error_response is not None:
+            return error_response
+
+        try:
+            with tracing.span('transcribe'):
+                transcribed_text = await transcribe(filepath, workspace)
+            logger.info("語音辨識完成")
+
+            with tracing.span('report'):
+                care_report = await generate_care_report(transcribed_text)
+            logger.info("照護報告生成完成")
+
+            return JSONResponse({
+                'success': True,
+                'transcription': transcribed_text,
+                'report': care_report
+            })
+
+        except Exception as e:
+            logger.error(f"處理過程中發生錯誤: {str(e)}")
+            logger.error(traceback.format_exc())
+            return JSONResponse({'error': f"處理過程中發生錯誤: {str(e)}"}, status_code=500)
+
+        finally:
+            await anyio.to_thread.run_sync(workspace.cleanup)
+
+    except Exception as e:
+        logger.error(f"上傳處理過程中發生錯誤: {str(e)}")
+        return JSONResponse({'error': f"上傳處理過程中發生錯誤: {str(e)}"}, status_code=500)
+
+
+async def upload_file_stream(request):
+    logger.info("開始處理串流上傳請求（非同步）")
+    workspace, filepath, error_response = await read_audio_upload(request)
+    if error_response is not None:
+        return error_response
+    # 回應在路由函數返回後才開始串流，串流階段的 span 另外接續本請求的 trace
+    traceparent = tracing.current_traceparent()
+
+    async def generate():
+        with tracing.span('stream_response', parent=traceparent) as span:
+            try:
+                yield sse_event('status', {'stage': 'transcribing', 'message': '語音辨識中...'})
+                with tracing.span('transcribe'):
+                    transcribed_text = await transcribe(filepath, workspace)
+                logger.info("語音辨識完成")
+                yield sse_event('transcription', {'text': transcribed_text})
+
+                yield sse_event('status', {'stage': 'reporting', 'message': '生成照護報告中...'})
+                with tracing.span('report'):
+                    async for delta in generate_care_report_stream(transcribed_text):
+                        yield sse_event('report', {'text': delta})
+                logger.info("照護報告生成完成")
+                yield sse_event('done', {'success': True})
+
+            except Exception as e:
+                logger.error(f"串流處理過程中發生錯誤: {str(e)}")
+                if span is not None:
+                    span.record_exception(e)
+                yield sse_event('error', {'error': f"處理過程中發生錯誤: {str(e)}"})
+
+            finally:
+                await anyio.to_thread.run_sync(workspace.cleanup)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+app = Starlette(middleware=[Middleware(RequestIdMiddleware)], routes=[
+    Route('/care-record/upload', traced(upload_file), methods=['POST']),
+    Route('/care-record/upload/stream', traced(upload_file_stream), methods=['POST']),
+    Mount('/', app=WSGIMiddleware(flask_app))
+])
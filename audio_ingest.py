@@ -0,0 +1,89 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# 超過此大小才寫入磁碟，一般語音訊息全程留在記憶體
+SPOOL_MAX_BYTES = int(os.getenv('AUDIO_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+
+
+class SpooledAudio:
+    """串流寫入的音訊緩衝區
+
+    小檔案保留在記憶體中，超過門檻才溢寫到暫存檔；同一份緩衝區同時提供給
+    轉錄與記錄保存使用，並在寫入時順便計算 SHA-256。
+    """
+
+    def __init__(self, suffix='.m4a', max_memory=SPOOL_MAX_BYTES, duration_ms=None):
+        self.suffix = suffix
+        self.size = 0
+        # 已知的音訊長度（例如 LINE 音訊訊息附帶的 duration），短錄音可不解碼直接上傳
+        self.duration_ms = duration_ms
+        self._hash = hashlib.sha256()
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory, suffix=suffix)
+
+    @property
+    def format(self):
+        return self.suffix.lstrip('.')
+
+    @property
+    def filename(self):
+        return f"audio{self.suffix}"
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    @property
+    def in_memory(self):
+        return not self._file._rolled
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def reader(self):
+        """回到開頭並回傳可讀取的檔案物件"""
+        self._file.seek(0)
+        return self._file
+
+    def upload_file(self):
+        """回傳 OpenAI API 可接受的 (檔名, 檔案物件)"""
+        return (self.filename, self.reader())
+
+    def read_bytes(self):
+        return self.reader().read()
+
+    def save_to(self, path):
+        """將緩衝區內容寫入指定路徑（唯一一次落地）"""
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(self.reader(), f)
+        return path
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def ingest_stream(chunks, suffix='.m4a', max_memory=SPOOL_MAX_BYTES, duration_ms=None):
+    """將下載中的資料區塊寫入 SpooledAudio"""
+    audio = SpooledAudio(suffix=suffix, max_memory=max_memory, duration_ms=duration_ms)
+    try:
+        for chunk in chunks:
+            if chunk:
+                audio.write(chunk)
+    except Exception:
+        audio.close()
+        raise
+    location = '記憶體' if audio.in_memory else '暫存檔'
+    logger.info(f"已接收音訊 {audio.size} bytes（{location}）")
+    return audio
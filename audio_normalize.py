@@ -0,0 +1,109 @@
+"""上傳 Whisper 前的音訊正規化
+
+Whisper 可直接接受的容器格式（且未超過上傳上限）以原檔上傳，不再解碼；
+其他格式或過大的檔案才以 FFmpeg 轉為單聲道 16 kHz 的 Opus（FFmpeg 不支援時改用 MP3），
+不再轉成體積約大十倍的未壓縮 WAV。
+"""
+import os
+import re
+import uuid
+import shutil
+import logging
+import tempfile
+import subprocess
+
+import metrics
+from transcription import MAX_UPLOAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Whisper API 支援的副檔名
+WHISPER_FORMATS = {'flac', 'm4a', 'mp3', 'mp4', 'mpeg', 'mpga', 'oga', 'ogg', 'wav', 'webm'}
+
+TARGET_SAMPLE_RATE = 16000
+# 依序嘗試的編碼設定：(副檔名, 編碼器參數)
+# Opus 壓縮等級 0 的編碼速度約為預設值（10）的 4 倍，檔案僅大約 6%
+TRANSCODE_PROFILES = [
+    ('ogg', ['-c:a', 'libopus', '-b:a', os.getenv('AUDIO_OPUS_BITRATE', '24k'),
+             '-compression_level', os.getenv('AUDIO_OPUS_COMPRESSION_LEVEL', '0')]),
+    ('mp3', ['-c:a', 'libmp3lame', '-b:a', os.getenv('AUDIO_MP3_BITRATE', '32k')])
+]
+
+_DURATION_PATTERN = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+def ffmpeg_binary():
+    """FFmpeg 執行檔路徑，可由 FFMPEG_BINARY 指定"""
+    binary = shutil.which(os.getenv('FFMPEG_BINARY', 'ffmpeg'))
+    if binary is None:
+        raise RuntimeError("找不到 FFmpeg，請安裝 FFmpeg 或設定 FFMPEG_BINARY")
+    return binary
+
+
+def ffmpeg_available():
+    """是否可使用 FFmpeg（解碼、切段與剪除靜音都需要）"""
+    return shutil.which(os.getenv('FFMPEG_BINARY', 'ffmpeg')) is not None
+
+
+def probe_duration_ms(path):
+    """讀取容器標頭中的長度（毫秒），不解碼音訊；讀不到時回傳 None"""
+    result = subprocess.run(
+        [ffmpeg_binary(), '-hide_banner', '-nostdin', '-i', path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    match = _DURATION_PATTERN.search(result.stderr.decode('utf-8', 'replace'))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int((int(hours) * 3600 + int(minutes) * 60 + float(seconds)) * 1000)
+
+
+def audio_format(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def needs_transcode(path):
+    """Whisper 不支援的格式或超過上傳上限時才需要轉檔"""
+    return audio_format(path) not in WHISPER_FORMATS or os.path.getsize(path) > MAX_UPLOAD_BYTES
+
+
+def transcode(path, output_dir=None):
+    """轉為單聲道 16 kHz 的壓縮音訊，回傳輸出檔路徑"""
+    with metrics.track('transcode'):
+        return _transcode(path, output_dir or tempfile.gettempdir())
+
+
+def _transcode(path, output_dir):
+    errors = []
+    for extension, codec_args in TRANSCODE_PROFILES:
+        output_path = os.path.join(output_dir, f"normalized_{uuid.uuid4().hex}.{extension}")
+        result = subprocess.run(
+            [ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error', '-y',
+             '-i', path, '-vn', '-ac', '1', '-ar', str(TARGET_SAMPLE_RATE)] + codec_args + [output_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        if result.returncode == 0:
+            return output_path
+        errors.append(f"{codec_args[1]}: {result.stderr.decode('utf-8', 'replace').strip()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    raise RuntimeError(f"音訊轉檔失敗：{'; '.join(errors)}")
+
+
+def normalize_audio(path, output_dir=None):
+    """回傳 (要上傳的檔案路徑, 是否為新產生的暫存檔)
+
+    呼叫端在 transcoded 為 True 時負責刪除暫存檔。
+    """
+    if not needs_transcode(path):
+        logger.info(f"{audio_format(path)} 格式可直接上傳，略過轉檔")
+        return path, False
+
+    output_path = transcode(path, output_dir)
+    logger.info(
+        f"音訊已轉檔：{os.path.getsize(path) / 1024:.0f} KB → "
+        f"{os.path.getsize(output_path) / 1024:.0f} KB（{audio_format(output_path)}）"
+    )
+    return output_path, True
@@ -0,0 +1,210 @@
+"""批次處理整個資料夾的錄音
+
+    python speech_to_text.py "D:/病房錄音/*.m4a" --workers 4 --output-dir reports
+
+- 多個檔案同時處理，每個檔案使用獨立的工作目錄
+- 每完成一個檔案就寫入 manifest.jsonl；中斷後以相同的 --output-dir 重新執行即可接續
+- 以檔案內容的 SHA-256 判斷是否已處理，改名或重複複製的檔案不會再送一次 API
+- 結束時輸出 summary.csv，列出每個檔案的狀態與各階段耗時
+"""
+import os
+import csv
+import glob
+import json
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import speech_to_text as stt
+from audio_normalize import WHISPER_FORMATS
+from result_cache import file_sha256
+from workspace import JobWorkspace
+
+# 資料夾模式收集的副檔名（Whisper 不支援的格式會自動轉檔）
+AUDIO_EXTENSIONS = WHISPER_FORMATS | {'aac', 'amr', '3gp', 'caf', 'wma'}
+
+MANIFEST_NAME = 'manifest.jsonl'
+SUMMARY_NAME = 'summary.csv'
+SUMMARY_FIELDS = [
+    'file', 'sha256', 'status', 'pipelined', 'audio_seconds',
+    'transcribe_seconds', 'report_seconds', 'total_seconds', 'output', 'error'
+]
+
+
+def collect_recordings(source, recursive=False):
+    """資料夾回傳其中的音訊檔，其他情況視為萬用字元路徑"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '**', '*') if recursive else os.path.join(source, '*')
+        paths = [
+            path for path in glob.glob(pattern, recursive=recursive)
+            if os.path.splitext(path)[1].lstrip('.').lower() in AUDIO_EXTENSIONS
+        ]
+    else:
+        paths = glob.glob(source, recursive=recursive)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def load_manifest(path):
+    """讀取先前的進度，回傳 {sha256: 最後一筆紀錄}；中斷時寫到一半的行略過"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry['sha256']] = entry
+    return entries
+
+
+def _seconds(value):
+    return '' if value is None else f"{value:.2f}"
+
+
+class BatchRunner:
+    def __init__(self, output_dir, workers=stt.BATCH_WORKERS, pipelined=None):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.pipelined = pipelined
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.summary_path = os.path.join(output_dir, SUMMARY_NAME)
+        self._lock = threading.Lock()
+        self._completed = {}
+        self._claimed = set()
+
+    def _record(self, entry):
+        """完成一個檔案就寫入 manifest，程式中斷時已完成的進度不會遺失"""
+        with self._lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+            if entry['status'] == 'ok':
+                self._completed[entry['sha256']] = entry
+
+    def _claim(self, sha256):
+        """同一份內容只處理一次；已完成或其他執行緒處理中時回傳 False"""
+        with self._lock:
+            if sha256 in self._completed or sha256 in self._claimed:
+                return False
+            self._claimed.add(sha256)
+            return True
+
+    def process(self, path):
+        row = {'file': path, 'status': 'ok', 'error': ''}
+        sha256 = file_sha256(path)
+        row['sha256'] = sha256
+        if not self._claim(sha256):
+            previous = self._completed.get(sha256)
+            # 沒有完成紀錄代表相同內容的檔案正在本次批次中處理
+            row['status'] = 'skipped' if previous else 'duplicate'
+            row['output'] = previous['output'] if previous else ''
+            return row
+
+        entry = {'file': path, 'sha256': sha256}
+        try:
+            with JobWorkspace() as workspace:
+                duration_ms = stt.probe_duration_ms(path)
+                transcribed_text, care_report, timings = stt.process_recording(
+                    path, workspace, self.pipelined
+                )
+            # 報告檔名取自原始檔名與內容雜湊，重新執行時覆寫同一個檔案
+            name = os.path.splitext(os.path.basename(path))[0]
+            output = stt.write_report_file(
+                os.path.join(self.output_dir, f"照護報告_{name}_{sha256[:8]}.txt"),
+                path, transcribed_text, care_report, timings['total']
+            )
+            entry.update({
+                'status': 'ok',
+                'output': output,
+                'pipelined': timings['pipelined'],
+                'audio_seconds': duration_ms / 1000 if duration_ms is not None else None,
+                'transcribe_seconds': timings['transcribe'],
+                'report_seconds': timings['report'],
+                'total_seconds': timings['total'],
+                'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            })
+        except Exception as e:
+            entry.update({'status': 'error', 'error': f"{type(e).__name__}: {str(e)}"})
+            print(f"\n{path} 處理失敗：{str(e)}")
+            print(traceback.format_exc())
+        self._record(entry)
+        with self._lock:
+            self._claimed.discard(sha256)
+
+        row.update(entry)
+        return row
+
+    def write_summary(self, rows):
+        # utf-8-sig 讓 Excel 正確顯示中文路徑
+        with open(self.summary_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(
+                    row,
+                    pipelined='' if row.get('pipelined') is None else ('是' if row['pipelined'] else '否'),
+                    audio_seconds=_seconds(row.get('audio_seconds')),
+                    transcribe_seconds=_seconds(row.get('transcribe_seconds')),
+                    report_seconds=_seconds(row.get('report_seconds')),
+                    total_seconds=_seconds(row.get('total_seconds'))
+                ))
+
+    def run(self, paths):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._completed = {
+            sha256: entry for sha256, entry in load_manifest(self.manifest_path).items()
+            if entry['status'] == 'ok'
+        }
+        if self._completed:
+            print(f"已從 {self.manifest_path} 載入 {len(self._completed)} 筆完成紀錄")
+
+        rows = []
+        started = time.time()
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix='batch')
+        futures = {executor.submit(self.process, path): path for path in paths}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                row = future.result()
+                rows.append(row)
+                label = {
+                    'ok': '完成', 'skipped': '已處理過，略過',
+                    'duplicate': '與其他檔案內容相同，略過', 'error': '失敗'
+                }[row['status']]
+                elapsed = f"（{row['total_seconds']:.1f} 秒）" if row.get('total_seconds') else ''
+                print(f"[{done}/{len(paths)}] {row['file']} {label}{elapsed}")
+        except KeyboardInterrupt:
+            print("\n已中斷：等待處理中的檔案完成，未開始的檔案下次執行時繼續")
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            rows.sort(key=lambda row: row['file'])
+            self.write_summary(rows)
+
+        summary = {
+            'total': len(paths),
+            'processed': sum(1 for row in rows if row['status'] == 'ok'),
+            'skipped': sum(1 for row in rows if row['status'] in ('skipped', 'duplicate')),
+            'failed': sum(1 for row in rows if row['status'] == 'error'),
+            'seconds': time.time() - started
+        }
+        print("\n=== 批次處理完成 ===")
+        print(f"共 {summary['total']} 個檔案：完成 {summary['processed']}，略過 {summary['skipped']}，"
+              f"失敗 {summary['failed']}，耗時 {summary['seconds']:.1f} 秒")
+        if stt.VAD_ENABLED:
+            vad_totals = stt.vad_totals()
+            print(f"剪除靜音 {vad_totals['saved_seconds']:.1f} 秒"
+                  f"（原始音訊 {vad_totals['original_seconds']:.1f} 秒）")
+        print(f"摘要已儲存至：{os.path.abspath(self.summary_path)}")
+        return summary
+
+
+def run_batch(source, output_dir, workers=stt.BATCH_WORKERS, recursive=False, pipelined=None):
+    paths = collect_recordings(source, recursive)
+    print(f"\n找到 {len(paths)} 個錄音檔，同時處理 {workers} 個")
+    stt.ProgressAnimation.enabled = False
+    return BatchRunner(output_dir, workers, pipelined).run(paths)
@@ -0,0 +1,89 @@
+"""音訊正規化基準測試
+
+以 FFmpeg 合成不同長度的 m4a（AAC 128k、44.1 kHz 雙聲道，與手機錄音相近），比較：
+- 舊流程：整段解碼後匯出未壓縮 WAV 再上傳
+- 新流程：Whisper 支援的格式直接上傳；不支援的格式（以 .caf 模擬）轉為 16 kHz 單聲道 Opus
+上傳時間以 --uplink-mbps 估算。
+
+執行方式（於專案根目錄，需要 FFmpeg）：
+    python benchmarks/audio_normalize_benchmark.py --minutes 1 5 20
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_normalize import ffmpeg_binary, normalize_audio
+
+
+def synthetic_recording(path, minutes):
+    """合成含雜訊的雙聲道錄音，避免編碼器對純音過度壓縮"""
+    subprocess.run(
+        [ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error', '-y',
+         '-f', 'lavfi', '-i', f"anoisesrc=color=pink:amplitude=0.3:sample_rate=44100:duration={minutes * 60}",
+         '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={minutes * 60}",
+         '-filter_complex', 'amix=inputs=2,pan=stereo|c0=c0|c1=c0',
+         '-c:a', 'aac', '-b:a', '128k', path],
+        check=True
+    )
+
+
+def legacy_wav(path, output_dir):
+    """舊的 convert_m4a_to_wav：以原取樣率與聲道數匯出 WAV"""
+    output_path = os.path.join(output_dir, 'temp_audio.wav')
+    subprocess.run(
+        [ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', '-i', path, output_path],
+        check=True
+    )
+    return output_path
+
+
+def measure(convert, path, output_dir):
+    start = time.perf_counter()
+    output_path = convert(path, output_dir)
+    elapsed = time.perf_counter() - start
+    return os.path.getsize(output_path), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 WAV 轉檔與音訊正規化的上傳大小及耗時')
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 5, 20], help='錄音長度（分鐘）')
+    parser.add_argument('--uplink-mbps', type=float, default=20, help='估算上傳時間用的上行頻寬（Mbps）')
+    args = parser.parse_args()
+
+    def upload_seconds(size):
+        return size * 8 / (args.uplink_mbps * 1000 * 1000)
+
+    work_dir = tempfile.mkdtemp(prefix='audio_normalize_benchmark_')
+    try:
+        print(f"上行頻寬 {args.uplink_mbps:.0f} Mbps")
+        for minutes in args.minutes:
+            source = os.path.join(work_dir, f"recording_{minutes:g}.m4a")
+            synthetic_recording(source, minutes)
+            # 副檔名不在 Whisper 支援清單內，強制走轉檔路徑
+            unsupported = os.path.join(work_dir, f"recording_{minutes:g}.caf")
+            shutil.copyfile(source, unsupported)
+
+            wav_size, wav_time = measure(legacy_wav, source, work_dir)
+            passthrough_size, passthrough_time = measure(lambda p, d: normalize_audio(p, d)[0], source, work_dir)
+            opus_size, opus_time = measure(lambda p, d: normalize_audio(p, d)[0], unsupported, work_dir)
+
+            print(f"\n錄音 {minutes:g} 分鐘（m4a {os.path.getsize(source) / 1024 / 1024:.1f} MB）")
+            for label, size, elapsed in [
+                ('舊流程 WAV', wav_size, wav_time),
+                ('直接上傳 m4a', passthrough_size, passthrough_time),
+                ('轉檔 Opus', opus_size, opus_time),
+            ]:
+                print(f"  {label:<12} 上傳 {size / 1024 / 1024:7.2f} MB，轉檔 {elapsed:5.2f} 秒，"
+                      f"估計上傳 {upload_seconds(size):6.1f} 秒，合計 {elapsed + upload_seconds(size):6.1f} 秒")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
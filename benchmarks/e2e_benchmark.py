@@ -0,0 +1,535 @@
+"""端對端基準測試
+
+啟動假 LINE 與假 OpenAI 伺服器（可設定延遲與錯誤比例），再以實際的服務程序執行各情境，
+輸出每個情境的吞吐量、p50 / p95 / p99 延遲與尖峰記憶體（RSS）：
+
+- webhook_audio：簽章正確的 LINE 音訊 webhook。分別統計 webhook 回應時間，
+  以及從送出 webhook 到假 LINE 收到「整理後報告」push 的完整處理時間
+- webhook_menu：「查看記錄」/「返回主選單」文字訊息（Rich Menu 切換 + reply）
+- upload：/care-record/upload 網頁上傳
+- cli：speech_to_text.py 批次模式（每個檔案的處理時間取自 summary.csv）
+
+每個情境重新啟動服務程序，尖峰 RSS 為該情境中服務程序（含 gunicorn worker）VmHWM 的總和，
+只在 Linux 上提供。每個請求使用內容不同的錄音（同一段錄音以不同的 metadata 重新封裝），
+不會命中結果快取；錄音產生與服務端解碼都需要 FFmpeg。
+
+執行方式（於專案根目錄）：
+    python benchmarks/e2e_benchmark.py --requests 50 --concurrency 10
+    python benchmarks/e2e_benchmark.py --scenarios webhook_audio --target wsgi --workers 2 \\
+        --openai-error-rate 0.05 --line-error-rate 0.02 --json e2e.json
+"""
+import os
+import sys
+import csv
+import hmac
+import json
+import time
+import uuid
+import base64
+import shutil
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from upload_load_test import percentile, wait_ready
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+
+FAKE_OPENAI_PORT = 8900
+SERVER_PORT = 8901
+FAKE_LINE_PORT = 8902
+CHANNEL_SECRET = 'benchmark'
+SCENARIOS = ['webhook_audio', 'webhook_menu', 'upload', 'cli']
+MENU_TEXTS = ['查看記錄', '返回主選單']
+REPORT_PREFIX = '整理後報告'
+ERROR_PREFIX = '處理音訊時發生錯誤'
+PLACEHOLDER_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+def synthesize_recording(path, seconds):
+    """產生類似交班錄音的 m4a：數段有音量起伏的多頻音，之間穿插停頓與背景噪音"""
+    from pydub import AudioSegment
+    from pydub.generators import Sine, WhiteNoise
+    from audio_normalize import ffmpeg_binary
+
+    speech = AudioSegment.silent(duration=4000, frame_rate=16000)
+    for frequency in (180, 420, 900):
+        speech = speech.overlay(Sine(frequency, sample_rate=16000).to_audio_segment(duration=4000) - 12)
+    audio = AudioSegment.silent(duration=0, frame_rate=16000)
+    while len(audio) < seconds * 1000:
+        audio += speech + AudioSegment.silent(duration=1500, frame_rate=16000)
+    audio = audio[:seconds * 1000]
+    audio = audio.overlay(WhiteNoise(sample_rate=16000).to_audio_segment(duration=len(audio), volume=-45))
+    wav_path = path + '.wav'
+    audio.set_channels(1).export(wav_path, format='wav')
+    subprocess.run(
+        [ffmpeg_binary(), '-y', '-loglevel', 'error', '-i', wav_path, '-c:a', 'aac', '-b:a', '48k', path],
+        check=True
+    )
+    os.remove(wav_path)
+
+
+def make_unique_copies(base, directory, names):
+    """以不同的 metadata 重新封裝（不重新編碼），每個檔案的雜湊都不同"""
+    from audio_normalize import ffmpeg_binary
+
+    os.makedirs(directory, exist_ok=True)
+    ffmpeg = ffmpeg_binary()
+
+    def remux(name):
+        path = os.path.join(directory, f"{name}.m4a")
+        subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-i', base, '-c', 'copy', '-metadata', f"comment={name}", path],
+            check=True
+        )
+        return path
+
+    with ThreadPoolExecutor(8) as executor:
+        return list(executor.map(remux, names))
+
+
+def process_tree(pid):
+    """pid 與其所有子程序（讀取 /proc）"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree = [pid]
+    for current in tree:
+        tree.extend(children.get(current, []))
+    return tree
+
+
+def peak_rss_kb(pid):
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+class RssMonitor:
+    """定期讀取程序樹的 VmHWM，保留最大值（程序結束後無法再讀取）"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self.supported = os.path.exists('/proc/self/status')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        if self.supported:
+            self.peak_kb = max(self.peak_kb, peak_rss_kb(self.pid))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.sample()
+        self._stop.set()
+        self._thread.join()
+        return self.peak_kb / 1024 if self.supported else None
+
+
+def service_env(args, work_dir):
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{FAKE_OPENAI_PORT}/v1",
+        'OPENAI_API_KEY': 'benchmark',
+        'LINE_API_ENDPOINT': f"http://127.0.0.1:{FAKE_LINE_PORT}",
+        'LINE_API_DATA_ENDPOINT': f"http://127.0.0.1:{FAKE_LINE_PORT}",
+        'LINE_CHANNEL_ACCESS_TOKEN': 'benchmark',
+        'LINE_CHANNEL_SECRET': CHANNEL_SECRET,
+        'REDIS_URL': 'redis://127.0.0.1:1',
+        'JOB_WORKERS_IN_PROCESS': '1',
+        'JOB_WORKERS': str(args.job_workers),
+        'HEALTH_PROBE_INTERVAL': '3600',
+        'CACHE_DIR': os.path.join(work_dir, 'cache'),
+        'RECORDS_DIR': os.path.join(work_dir, 'records'),
+        'WORKSPACE_ROOT': os.path.join(work_dir, 'jobs'),
+        'LOG_FILE': os.path.join(work_dir, 'logs', 'app-{pid}.log'),
+        'TRACE_EXPORTER': 'file',
+        'TRACE_FILE': os.path.join(work_dir, 'traces', 'traces-{pid}.jsonl'),
+        'PYTHONPATH': ROOT,
+    })
+    return env
+
+
+def start_fakes(args, audio_dir, env):
+    fake_openai = subprocess.Popen(
+        [sys.executable, 'benchmarks/fake_openai.py', '--port', str(FAKE_OPENAI_PORT),
+         '--transcribe-latency', str(args.transcribe_latency), '--chat-latency', str(args.chat_latency),
+         '--error-rate', str(args.openai_error_rate)],
+        cwd=ROOT, env=env
+    )
+    fake_line = subprocess.Popen(
+        [sys.executable, 'benchmarks/fake_line.py', '--port', str(FAKE_LINE_PORT),
+         '--latency', str(args.line_latency), '--content-latency', str(args.content_latency),
+         '--error-rate', str(args.line_error_rate), '--audio-dir', audio_dir],
+        cwd=ROOT, env=env
+    )
+    return [fake_openai, fake_line]
+
+
+def start_server(args, env):
+    if args.target == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(SERVER_PORT),
+                   '--log-level', 'warning', '--limit-concurrency', '10000']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+                   '-b', f"127.0.0.1:{SERVER_PORT}", '--timeout', '600', 'app:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_ready(f"http://127.0.0.1:{SERVER_PORT}/callback", timeout=60)
+    return server
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def signed_webhook(events):
+    body = json.dumps({'destination': 'Ubenchmark', 'events': events}, ensure_ascii=False).encode('utf-8')
+    digest = hmac.new(CHANNEL_SECRET.encode('utf-8'), body, hashlib.sha256).digest()
+    return body, {'Content-Type': 'application/json', 'X-Line-Signature': base64.b64encode(digest).decode()}
+
+
+def message_event(user_id, message):
+    return {
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': uuid.uuid4().hex.upper()[:26],
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': uuid.uuid4().hex,
+        'message': message,
+    }
+
+
+def result(name, latencies, errors, elapsed, peak_rss_mb):
+    row = {
+        'scenario': name,
+        'ok': len(latencies),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb,
+        'error_samples': sorted(set(errors))[:5],
+    }
+    for pct in (50, 95, 99):
+        row[f"p{pct}"] = percentile(latencies, pct) if latencies else None
+    return row
+
+
+async def send_webhooks(client, bodies, concurrency):
+    """送出 webhook，回傳 (送出時間, 回應延遲或 None, 錯誤) 列表"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(body, headers):
+        async with semaphore:
+            sent_at = time.time()
+            start = time.perf_counter()
+            try:
+                response = await client.post('/callback', content=body, headers=headers)
+            except httpx.HTTPError as e:
+                return sent_at, None, type(e).__name__
+            if response.status_code != 200:
+                return sent_at, None, f"HTTP {response.status_code}"
+            return sent_at, time.perf_counter() - start, None
+
+    return await asyncio.gather(*(send(body, headers) for body, headers in bodies))
+
+
+def line_messages_offset():
+    return httpx.get(f"http://127.0.0.1:{FAKE_LINE_PORT}/_bench/messages?offset=1000000000").json()['next']
+
+
+async def wait_for_reports(user_ids, offset, timeout):
+    """等待每位使用者收到最終 push，回傳 {user_id: (收到時間, 錯誤訊息或 None)}"""
+    pending = set(user_ids)
+    finished = {}
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{FAKE_LINE_PORT}") as client:
+        while pending and time.time() < deadline:
+            data = (await client.get('/_bench/messages', params={'offset': offset})).json()
+            offset = data['next']
+            for message in data['messages']:
+                if message['type'] != 'push' or message['to'] not in pending:
+                    continue
+                if message['text'].startswith(REPORT_PREFIX) or message['text'].startswith(ERROR_PREFIX):
+                    error = message['text'].splitlines()[-1] if message['text'].startswith(ERROR_PREFIX) else None
+                    finished[message['to']] = (message['time'], error)
+                    pending.discard(message['to'])
+            await asyncio.sleep(0.2)
+    return finished
+
+
+async def scenario_webhook_audio(args, names):
+    run = uuid.uuid4().hex[:8]
+    user_ids = [f"U{run}{i:05d}" for i in range(len(names))]
+    bodies = [
+        signed_webhook([message_event(user_id, {
+            'type': 'audio', 'id': name, 'duration': args.audio_seconds * 1000,
+            'contentProvider': {'type': 'line'}
+        })])
+        for user_id, name in zip(user_ids, names)
+    ]
+    offset = line_messages_offset()
+    started = time.time()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{SERVER_PORT}", timeout=600) as client:
+        sent = await send_webhooks(client, bodies, args.concurrency)
+    ack_elapsed = time.time() - started
+    finished = await wait_for_reports(
+        [user_id for user_id, (_, latency, _) in zip(user_ids, sent) if latency is not None],
+        offset, args.timeout
+    )
+    done_elapsed = (max(at for at, _ in finished.values()) - started) if finished else 0.0
+
+    ack_latencies = [latency for _, latency, _ in sent if latency is not None]
+    ack_errors = [error for _, _, error in sent if error]
+    latencies = []
+    errors = list(ack_errors)
+    for user_id, (sent_at, latency, _) in zip(user_ids, sent):
+        if latency is None:
+            continue
+        if user_id not in finished:
+            errors.append('timeout')
+        elif finished[user_id][1]:
+            errors.append(finished[user_id][1])
+        else:
+            latencies.append(finished[user_id][0] - sent_at)
+    return [
+        ('webhook_audio (回應)', ack_latencies, ack_errors, ack_elapsed),
+        ('webhook_audio (完成)', latencies, errors, done_elapsed),
+    ]
+
+
+async def scenario_webhook_menu(args, names):
+    run = uuid.uuid4().hex[:8]
+    bodies = [
+        # 每位使用者切換兩次選單，第二次回到主選單
+        signed_webhook([message_event(f"U{run}{i // 2:05d}", {
+            'type': 'text', 'id': f"{run}{i}", 'text': MENU_TEXTS[i % 2]
+        })])
+        for i in range(len(names))
+    ]
+    started = time.time()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{SERVER_PORT}", timeout=600) as client:
+        sent = await send_webhooks(client, bodies, args.concurrency)
+    elapsed = time.time() - started
+    latencies = [latency for _, latency, _ in sent if latency is not None]
+    errors = [error for _, _, error in sent if error]
+    return [('webhook_menu', latencies, errors, elapsed)]
+
+
+async def scenario_upload(args, paths):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = []
+
+    async def upload(client, path):
+        with open(path, 'rb') as f:
+            audio = f.read()
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    '/care-record/upload', files={'audio': (os.path.basename(path), audio, 'audio/mp4')}
+                )
+                if response.status_code == 200 and response.json().get('success'):
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors.append(f"HTTP {response.status_code}")
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+
+    started = time.time()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{SERVER_PORT}", timeout=600) as client:
+        await asyncio.gather(*(upload(client, path) for path in paths))
+    return [('upload', latencies, errors, time.time() - started)]
+
+
+def scenario_cli(args, audio_dir, env, work_dir):
+    output_dir = os.path.join(work_dir, 'cli_reports')
+    started = time.time()
+    process = subprocess.Popen(
+        [sys.executable, 'speech_to_text.py', audio_dir, '--batch', '--workers', str(args.concurrency),
+         '--output-dir', output_dir],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    monitor = RssMonitor(process.pid).start()
+    process.wait()
+    peak = monitor.stop()
+    elapsed = time.time() - started
+
+    latencies = []
+    errors = []
+    summary_path = os.path.join(output_dir, 'summary.csv')
+    if os.path.exists(summary_path):
+        with open(summary_path, encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                if row['status'] == 'ok':
+                    latencies.append(float(row['total_seconds']))
+                elif row['status'] == 'error':
+                    errors.append(row['error'] or 'error')
+    else:
+        errors.append(f"exit {process.returncode}")
+    return [result('cli', latencies, errors, elapsed, peak)]
+
+
+def run_server_scenario(args, env, coroutine):
+    server = start_server(args, env)
+    monitor = RssMonitor(server.pid).start()
+    try:
+        rows = asyncio.run(coroutine)
+    finally:
+        peak = monitor.stop()
+        stop([server])
+    return [result(name, latencies, errors, elapsed, peak) for name, latencies, errors, elapsed in rows]
+
+
+def provision_rich_menus():
+    """在假 LINE 上建立 Rich Menu，選單切換情境才有選單可連結
+
+    選單圖片以 1x1 PNG 代替，不需要中文字型；服務端依選單名稱找到這些選單。
+    """
+    from linebot import LineBotApi
+    from rich_menu_registry import MENU_DEFINITIONS, build_rich_menu
+
+    endpoint = f"http://127.0.0.1:{FAKE_LINE_PORT}"
+    line_bot_api = LineBotApi('benchmark', endpoint=endpoint, data_endpoint=endpoint)
+    existing = {menu.name for menu in line_bot_api.get_rich_menu_list()}
+    for key, definition in MENU_DEFINITIONS.items():
+        if definition['name'] in existing:
+            continue
+        menu_id = line_bot_api.create_rich_menu(rich_menu=build_rich_menu(key))
+        line_bot_api.set_rich_menu_image(menu_id, 'image/png', PLACEHOLDER_PNG)
+
+
+def format_seconds(value):
+    return '-' if value is None else f"{value:.2f}"
+
+
+def print_results(rows, args):
+    target = 'ASGI (uvicorn)' if args.target == 'asgi' else f"gunicorn {args.workers}x{args.threads}"
+    print(f"\n服務：{target}，每情境 {args.requests} 個請求，同時 {args.concurrency} 個，"
+          f"錄音 {args.audio_seconds} 秒")
+    print(f"模擬延遲：Whisper {args.transcribe_latency}s，Chat {args.chat_latency}s，LINE {args.line_latency}s；"
+          f"錯誤比例：OpenAI {args.openai_error_rate:.0%}，LINE {args.line_error_rate:.0%}\n")
+    header = f"{'情境':<22}{'成功':>6}{'失敗':>6}{'吞吐量/s':>10}{'p50':>8}{'p95':>8}{'p99':>8}{'尖峰RSS(MB)':>13}"
+    print(header)
+    print('-' * len(header.encode('utf-8')))
+    for row in rows:
+        rss = '-' if row['peak_rss_mb'] is None else f"{row['peak_rss_mb']:.0f}"
+        print(f"{row['scenario']:<22}{row['ok']:>6}{row['errors']:>6}{row['throughput']:>10.2f}"
+              f"{format_seconds(row['p50']):>8}{format_seconds(row['p95']):>8}{format_seconds(row['p99']):>8}{rss:>13}")
+    for row in rows:
+        if row['error_samples']:
+            print(f"{row['scenario']} 錯誤範例：{', '.join(row['error_samples'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以假 LINE 與假 OpenAI 伺服器進行端對端基準測試')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--target', choices=['asgi', 'wsgi'], default='asgi')
+    parser.add_argument('--workers', type=int, default=2, help='wsgi 模式的 gunicorn worker 數')
+    parser.add_argument('--threads', type=int, default=8, help='wsgi 模式每個 worker 的執行緒數')
+    parser.add_argument('--job-workers', type=int, default=4, help='每個服務程序的背景工作執行緒數')
+    parser.add_argument('--requests', type=int, default=40, help='每個情境的請求數')
+    parser.add_argument('--concurrency', type=int, default=10, help='同時進行的請求數（cli 情境為 --workers）')
+    parser.add_argument('--audio-seconds', type=int, default=30, help='合成錄音長度（秒）')
+    parser.add_argument('--audio', help='改用指定的錄音檔（m4a）')
+    parser.add_argument('--transcribe-latency', type=float, default=1.0)
+    parser.add_argument('--chat-latency', type=float, default=1.5)
+    parser.add_argument('--openai-error-rate', type=float, default=0.0)
+    parser.add_argument('--line-latency', type=float, default=0.05)
+    parser.add_argument('--content-latency', type=float, default=0.1)
+    parser.add_argument('--line-error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=300, help='等待音訊處理完成的最長秒數')
+    parser.add_argument('--json', help='另將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='e2e_benchmark_')
+    env = service_env(args, work_dir)
+    audio_dir = os.path.join(work_dir, 'audio')
+    base = args.audio
+    if base is None:
+        base = os.path.join(work_dir, 'base.m4a')
+        synthesize_recording(base, args.audio_seconds)
+
+    fakes = start_fakes(args, audio_dir, env)
+    rows = []
+    try:
+        wait_ready(f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats")
+        wait_ready(f"http://127.0.0.1:{FAKE_LINE_PORT}/_bench/stats")
+        for scenario in args.scenarios:
+            # 每個情境使用各自的錄音，不會命中前一個情境留下的快取
+            names = [f"{scenario}-{i:05d}" for i in range(args.requests)]
+            print(f"執行 {scenario} ...")
+            if scenario == 'webhook_audio':
+                make_unique_copies(base, audio_dir, names)
+                rows.extend(run_server_scenario(args, env, scenario_webhook_audio(args, names)))
+            elif scenario == 'webhook_menu':
+                provision_rich_menus()
+                rows.extend(run_server_scenario(args, env, scenario_webhook_menu(args, names)))
+            elif scenario == 'upload':
+                paths = make_unique_copies(base, os.path.join(work_dir, 'upload'), names)
+                rows.extend(run_server_scenario(args, env, scenario_upload(args, paths)))
+            else:
+                cli_dir = os.path.join(work_dir, 'cli')
+                make_unique_copies(base, cli_dir, names)
+                rows.extend(scenario_cli(args, cli_dir, env, work_dir))
+        line_stats = httpx.get(f"http://127.0.0.1:{FAKE_LINE_PORT}/_bench/stats").json()
+        openai_stats = httpx.get(f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats").json()
+    finally:
+        stop(fakes)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(rows, args)
+    print(f"\n假 LINE：{line_stats['requests']} 個請求（注入錯誤 {line_stats['errors']}），"
+          f"各 API：{line_stats['by_endpoint']}")
+    print(f"假 OpenAI：{openai_stats['requests']} 個請求（注入錯誤 {openai_stats['errors']}），"
+          f"同時處理最多 {openai_stats['peak_in_flight']} 個")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': rows}, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入：{args.json}")
+
+
+if __name__ == "__main__":
+    main()
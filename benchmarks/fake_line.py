@@ -0,0 +1,220 @@
+"""本機假 LINE Messaging API 伺服器
+
+模擬音訊內容下載、reply、push 與 Rich Menu 相關 API 的回應延遲與隨機錯誤，
+讓端對端基準測試不需要真的連到 LINE。將 LINE_API_ENDPOINT 與 LINE_API_DATA_ENDPOINT 指向此伺服器即可：
+    python benchmarks/fake_line.py --port 8902 --audio-dir /tmp/line_audio --latency 0.05
+    LINE_API_ENDPOINT=http://127.0.0.1:8902 LINE_API_DATA_ENDPOINT=http://127.0.0.1:8902 uvicorn asgi:app
+
+音訊內容讀取 --audio-dir 中的「訊息ID.m4a」，找不到時使用 --audio 指定的檔案。
+送出的 reply / push 訊息記錄在記憶體中，可由 GET /_bench/messages?offset=N 取得（含收到的時間），
+基準測試以此判斷每個 webhook 何時收到最終回覆。
+"""
+import os
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse
+from starlette.routing import Route
+
+settings = {'latency': 0.05, 'content_latency': 0.1, 'error_rate': 0.0, 'audio_dir': None, 'audio': None}
+stats = {'requests': 0, 'errors': 0, 'in_flight': 0, 'peak_in_flight': 0, 'by_endpoint': {}}
+messages = []
+rich_menus = {}
+state = {'default_rich_menu': None, 'links': {}}
+
+
+class track:
+    """統計請求數與同時處理中的請求數"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+        stats['by_endpoint'][self.endpoint] = stats['by_endpoint'].get(self.endpoint, 0) + 1
+
+    def __exit__(self, *exc):
+        stats['in_flight'] -= 1
+
+
+def injected_error():
+    if random.random() >= settings['error_rate']:
+        return None
+    stats['errors'] += 1
+    return JSONResponse({'message': 'injected error'}, status_code=500)
+
+
+def api(endpoint, latency_key='latency'):
+    """包裝 API 處理函數：加上延遲、錯誤注入與統計"""
+    def decorator(func):
+        async def handler(request):
+            with track(endpoint):
+                await asyncio.sleep(settings[latency_key])
+                error = injected_error()
+                if error is not None:
+                    return error
+                return await func(request)
+        return handler
+    return decorator
+
+
+def _first_text(payload):
+    for message in payload.get('messages', []):
+        if message.get('type') == 'text':
+            return message['text']
+        if message.get('type') == 'flex':
+            return message.get('altText', '')
+    return ''
+
+
+@api('reply')
+async def reply(request):
+    payload = await request.json()
+    messages.append({
+        'type': 'reply', 'to': payload.get('replyToken'),
+        'text': _first_text(payload), 'time': time.time()
+    })
+    return JSONResponse({})
+
+
+@api('push')
+async def push(request):
+    payload = await request.json()
+    messages.append({
+        'type': 'push', 'to': payload.get('to'),
+        'text': _first_text(payload), 'time': time.time()
+    })
+    return JSONResponse({})
+
+
+@api('content', latency_key='content_latency')
+async def content(request):
+    message_id = request.path_params['message_id']
+    path = None
+    if settings['audio_dir']:
+        path = os.path.join(settings['audio_dir'], f"{message_id}.m4a")
+    if path is None or not os.path.exists(path):
+        path = settings['audio']
+    if not path or not os.path.exists(path):
+        return JSONResponse({'message': 'Not found'}, status_code=404)
+    return FileResponse(path, media_type='audio/x-m4a')
+
+
+@api('bot_info')
+async def bot_info(request):
+    return JSONResponse({
+        'userId': 'Ubenchmark', 'basicId': '@benchmark', 'displayName': 'benchmark',
+        'chatMode': 'bot', 'markAsReadMode': 'auto'
+    })
+
+
+@api('rich_menu')
+async def create_rich_menu(request):
+    payload = await request.json()
+    menu_id = f"richmenu-{uuid.uuid4().hex}"
+    rich_menus[menu_id] = dict(payload, richMenuId=menu_id)
+    return JSONResponse({'richMenuId': menu_id})
+
+
+@api('rich_menu')
+async def list_rich_menus(request):
+    return JSONResponse({'richmenus': list(rich_menus.values())})
+
+
+@api('rich_menu')
+async def rich_menu(request):
+    menu_id = request.path_params['menu_id']
+    if menu_id not in rich_menus:
+        return JSONResponse({'message': 'Not found'}, status_code=404)
+    if request.method == 'DELETE':
+        del rich_menus[menu_id]
+        return JSONResponse({})
+    return JSONResponse(rich_menus[menu_id])
+
+
+@api('rich_menu_image')
+async def rich_menu_image(request):
+    await request.body()
+    return JSONResponse({})
+
+
+@api('rich_menu')
+async def default_rich_menu(request):
+    if request.method == 'POST':
+        state['default_rich_menu'] = request.path_params['menu_id']
+        return JSONResponse({})
+    if request.method == 'DELETE':
+        state['default_rich_menu'] = None
+        return JSONResponse({})
+    if state['default_rich_menu'] is None:
+        return JSONResponse({'message': 'Not found'}, status_code=404)
+    return JSONResponse({'richMenuId': state['default_rich_menu']})
+
+
+@api('rich_menu_link')
+async def user_rich_menu(request):
+    user_id = request.path_params['user_id']
+    if request.method == 'DELETE':
+        state['links'].pop(user_id, None)
+    else:
+        state['links'][user_id] = request.path_params['menu_id']
+    return JSONResponse({})
+
+
+async def get_messages(request):
+    offset = int(request.query_params.get('offset', '0'))
+    return JSONResponse({'messages': messages[offset:], 'next': len(messages)})
+
+
+async def get_stats(request):
+    return JSONResponse(dict(stats, rich_menus=len(rich_menus), linked_users=len(state['links'])))
+
+
+app = Starlette(routes=[
+    Route('/v2/bot/message/reply', reply, methods=['POST']),
+    Route('/v2/bot/message/push', push, methods=['POST']),
+    Route('/v2/bot/message/{message_id}/content', content),
+    Route('/v2/bot/info', bot_info),
+    Route('/v2/bot/richmenu', create_rich_menu, methods=['POST']),
+    Route('/v2/bot/richmenu/list', list_rich_menus),
+    Route('/v2/bot/richmenu/{menu_id}', rich_menu, methods=['GET', 'DELETE']),
+    Route('/v2/bot/richmenu/{menu_id}/content', rich_menu_image, methods=['POST']),
+    Route('/v2/bot/user/all/richmenu', default_rich_menu, methods=['GET', 'DELETE']),
+    Route('/v2/bot/user/all/richmenu/{menu_id}', default_rich_menu, methods=['POST']),
+    Route('/v2/bot/user/{user_id}/richmenu', user_rich_menu, methods=['DELETE']),
+    Route('/v2/bot/user/{user_id}/richmenu/{menu_id}', user_rich_menu, methods=['POST']),
+    Route('/_bench/messages', get_messages),
+    Route('/_bench/stats', get_stats),
+])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='模擬 LINE Messaging API 的本機伺服器')
+    parser.add_argument('--port', type=int, default=8902)
+    parser.add_argument('--latency', type=float, default=0.05, help='一般 API 回應延遲（秒）')
+    parser.add_argument('--content-latency', type=float, default=0.1, help='音訊內容下載延遲（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='隨機回傳 500 的比例（0～1）')
+    parser.add_argument('--audio-dir', help='音訊內容目錄，檔名為「訊息ID.m4a」')
+    parser.add_argument('--audio', help='找不到對應檔案時回傳的音訊')
+    args = parser.parse_args()
+
+    settings.update({
+        'latency': args.latency,
+        'content_latency': args.content_latency,
+        'error_rate': args.error_rate,
+        'audio_dir': args.audio_dir,
+        'audio': args.audio,
+    })
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""本機假 OpenAI 伺服器
+
+模擬 Whisper 與 Chat Completions 的回應延遲（含 stream=True）與隨機錯誤，
+讓負載測試不需要真的呼叫 OpenAI。將 OPENAI_BASE_URL 指向此伺服器即可：
+    python benchmarks/fake_openai.py --port 8900 --transcribe-latency 2 --chat-latency 3 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 uvicorn asgi:app
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+TRANSCRIPT = "052爺爺今天腹瀉四次，今晚NPO。162氧氣開到3，血糖一天測兩次。172爺爺手腳約束，預備明天出院。"
+REPORT_SECTIONS = [
+    "# 照護紀錄報告\n",
+    "## 一、基本資訊\n記錄護理師：未指明\n",
+    "## 二、病患狀況摘要\n- 052：腹瀉四次，今晚 NPO\n",
+    "## 三、照護執行紀錄\n- 162：氧氣 3L，血糖每日兩次\n",
+    "## 四、特殊觀察重點\n- 172：約束中，預防拔管\n",
+    "## 五、後續照護建議\n- 172：準備出院\n"
+]
+
+settings = {'transcribe_latency': 2.0, 'chat_latency': 3.0, 'error_rate': 0.0, 'error_status': 503}
+stats = {'in_flight': 0, 'peak_in_flight': 0, 'requests': 0, 'errors': 0}
+
+
+class track:
+    """統計同時處理中的請求數"""
+
+    def __enter__(self):
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+
+    def __exit__(self, *exc):
+        stats['in_flight'] -= 1
+
+
+def injected_error():
+    """依 error_rate 隨機回傳錯誤（503 與 429 會觸發客戶端重試）"""
+    if random.random() >= settings['error_rate']:
+        return None
+    stats['errors'] += 1
+    return JSONResponse(
+        {'error': {'message': 'injected error', 'type': 'server_error', 'code': None}},
+        status_code=settings['error_status']
+    )
+
+
+async def transcriptions(request):
+    await request.body()
+    error = injected_error()
+    if error is not None:
+        return error
+    with track():
+        await asyncio.sleep(settings['transcribe_latency'])
+        return JSONResponse({'text': TRANSCRIPT})
+
+
+def _completion(content=None, delta=None):
+    body = {
+        'id': 'chatcmpl-fake',
+        'created': int(time.time()),
+        'model': 'fake',
+    }
+    if delta is None:
+        body['object'] = 'chat.completion'
+        body['choices'] = [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content}
+        }]
+    else:
+        body['object'] = 'chat.completion.chunk'
+        body['choices'] = [{'index': 0, 'finish_reason': None, 'delta': {'content': delta}}]
+    return body
+
+
+async def chat_completions(request):
+    payload = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+    if not payload.get('stream'):
+        with track():
+            await asyncio.sleep(settings['chat_latency'])
+            return JSONResponse(_completion(content=''.join(REPORT_SECTIONS)))
+
+    async def generate():
+        # 串流時將總延遲平均分配到各段落
+        with track():
+            interval = settings['chat_latency'] / len(REPORT_SECTIONS)
+            for section in REPORT_SECTIONS:
+                await asyncio.sleep(interval)
+                yield f"data: {json.dumps(_completion(delta=section), ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type='text/event-stream')
+
+
+async def retrieve_model(request):
+    return JSONResponse({'id': request.path_params['model'], 'object': 'model', 'owned_by': 'fake'})
+
+
+async def get_stats(request):
+    return JSONResponse(stats)
+
+
+app = Starlette(routes=[
+    Route('/v1/audio/transcriptions', transcriptions, methods=['POST']),
+    Route('/v1/chat/completions', chat_completions, methods=['POST']),
+    Route('/v1/models/{model}', retrieve_model),
+    Route('/stats', get_stats)
+])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='模擬 OpenAI API 的本機伺服器')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--transcribe-latency', type=float, default=2.0, help='Whisper 回應延遲（秒）')
+    parser.add_argument('--chat-latency', type=float, default=3.0, help='報告生成延遲（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='隨機回傳錯誤的比例（0～1）')
+    parser.add_argument('--error-status', type=int, default=503, help='注入錯誤的 HTTP 狀態碼')
+    args = parser.parse_args()
+
+    settings['transcribe_latency'] = args.transcribe_latency
+    settings['chat_latency'] = args.chat_latency
+    settings['error_rate'] = args.error_rate
+    settings['error_status'] = args.error_status
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
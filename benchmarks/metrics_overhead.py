@@ -0,0 +1,73 @@
+"""指標記錄的額外負擔
+
+分別以 METRICS_ENABLED=1 與 0 啟動子程序，量測 metrics.track() 與 counter.inc() 每次呼叫的耗時，
+並輸出啟用時 /metrics 的內容範例。
+
+執行方式（於專案根目錄）：
+    python benchmarks/metrics_overhead.py --iterations 200000
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = r'''
+import sys, json, time
+sys.path.insert(0, sys.argv[1])
+import metrics
+
+iterations = int(sys.argv[2])
+start = time.perf_counter()
+for _ in range(iterations):
+    pass
+baseline = time.perf_counter() - start
+
+start = time.perf_counter()
+for _ in range(iterations):
+    with metrics.track('whisper'):
+        pass
+track_seconds = time.perf_counter() - start
+
+start = time.perf_counter()
+for _ in range(iterations):
+    metrics.AUDIO_SECONDS.inc(1.5)
+inc_seconds = time.perf_counter() - start
+
+print(json.dumps({
+    'track_ns': (track_seconds - baseline) / iterations * 1e9,
+    'inc_ns': (inc_seconds - baseline) / iterations * 1e9,
+    'sample': metrics.render(),
+}))
+'''
+
+
+def measure(enabled, iterations):
+    env = dict(os.environ, METRICS_ENABLED='1' if enabled else '0')
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE, ROOT, str(iterations)],
+        env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指標啟用與停用時的每次呼叫耗時')
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    enabled = measure(True, args.iterations)
+    disabled = measure(False, args.iterations)
+    print(f"{'':<12}{'track()':>12}{'counter.inc()':>16}")
+    for label, result in (('啟用', enabled), ('停用', disabled)):
+        print(f"{label:<12}{result['track_ns']:>10.0f}ns{result['inc_ns']:>14.0f}ns")
+    print("\n啟用時 /metrics 輸出範例（節錄）：")
+    for line in enabled['sample'].splitlines():
+        if 'whisper' in line or line.startswith('care_sch_audio_seconds'):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
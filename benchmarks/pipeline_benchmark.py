@@ -0,0 +1,78 @@
+"""管線化報告基準測試
+
+以合成的長錄音（語音段之間穿插靜音）與模擬延遲的轉錄、摘要、報告函數，比較：
+- 依序處理：全部片段轉錄完成後，再以整份轉錄生成報告
+- 管線化：每段轉錄完成即開始摘要，最後合併
+模擬延遲可用參數調整；片段匯出使用 WAV，不需要 FFmpeg。
+
+執行方式（於專案根目錄）：
+    python benchmarks/pipeline_benchmark.py --minutes 20
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from transcription import ChunkedTranscriber
+from report_pipeline import PipelinedReporter
+
+
+def synthetic_recording(minutes):
+    """每 20 秒語音後接 1 秒靜音，讓切段落在靜音處"""
+    speech = Sine(440, sample_rate=8000).to_audio_segment(duration=20 * 1000).set_channels(1)
+    pause = AudioSegment.silent(duration=1000, frame_rate=8000)
+    audio = AudioSegment.empty()
+    while len(audio) < minutes * 60 * 1000:
+        audio += speech + pause
+    return audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較依序與管線化的轉錄報告流程')
+    parser.add_argument('--minutes', type=float, default=20, help='錄音長度（分鐘）')
+    parser.add_argument('--workers', type=int, default=4, help='同時轉錄的片段數')
+    # 預設值約為實際 API 延遲的 1/10：Whisper 每段約 8 秒、片段摘要約 10 秒、
+    # 合併報告約 30 秒、以整份長轉錄生成報告約 50 秒
+    parser.add_argument('--transcribe-latency', type=float, default=0.8, help='每段轉錄延遲（秒）')
+    parser.add_argument('--summary-latency', type=float, default=1.0, help='每段摘要延遲（秒）')
+    parser.add_argument('--merge-latency', type=float, default=3.0, help='合併摘要延遲（秒）')
+    parser.add_argument('--report-latency', type=float, default=5.0, help='整份轉錄生成報告的延遲（秒）')
+    args = parser.parse_args()
+
+    def fake_transcribe(audio_file):
+        time.sleep(args.transcribe_latency)
+        return f"{audio_file.name} 的轉錄內容"
+
+    def fake_summarize(index, text):
+        time.sleep(args.summary_latency)
+        return f"第 {index + 1} 段摘要"
+
+    def fake_merge(summaries):
+        time.sleep(args.merge_latency)
+        return "\n".join(summaries)
+
+    audio = synthetic_recording(args.minutes)
+    transcriber = ChunkedTranscriber(fake_transcribe, max_workers=args.workers, export_format='wav')
+
+    start = time.perf_counter()
+    transcriber.transcribe_segment_audio(audio)
+    transcribed = time.perf_counter() - start
+    time.sleep(args.report_latency)
+    sequential = time.perf_counter() - start
+
+    reporter = PipelinedReporter(transcriber, fake_summarize, fake_merge, summary_workers=args.workers)
+    _, _, timings = reporter.run(audio)
+
+    print(f"錄音 {args.minutes:.0f} 分鐘，切為 {timings['segments']} 段，同時轉錄 {args.workers} 段")
+    print(f"依序處理：{sequential:.1f} 秒（切段與轉錄 {transcribed:.1f} 秒，報告 {args.report_latency:.1f} 秒）")
+    print(f"管線化：{timings['total']:.1f} 秒（{timings['first_segment']:.1f} 秒開始轉錄，"
+          f"切段 {timings['split']:.1f} 秒、轉錄 {timings['transcribe']:.1f} 秒完成，"
+          f"之後摘要 {timings['summarize_tail']:.1f} 秒，合併 {timings['merge']:.1f} 秒）")
+
+if __name__ == "__main__":
+    main()
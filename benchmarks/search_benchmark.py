@@ -0,0 +1,107 @@
+"""全文搜尋基準測試
+
+以合成的交班記錄建立資料庫與倒排索引，量測索引速度與查詢延遲，
+並與逐筆 LIKE 掃描比較。
+
+執行方式（於專案根目錄）：
+    python benchmarks/search_benchmark.py --records 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from record_store import RecordStore
+from search_index import SearchIndex
+
+PHRASES = [
+    '今天腹瀉四次已經跟護理師講過了', '今天晚上NPO明天早上預備要做檢查', '尿布不夠已經有跟家屬說要買了',
+    '屁股那邊有個壓傷兩公分', '要記得要翻身排泄要確實', '氧氣開到三', '血糖一天要測兩次',
+    '其他沒有什麼特別就一般的照顧', '要預防拔管所以手腳要確實的約束', '預備明天出院',
+    '管灌一天六餐餐間水是100cc', '生命徵象穩定', '夜間睡眠品質不佳', '家屬明天會來探視',
+    '傷口換藥一天一次', '體溫三十七點八度持續觀察', '食慾差只吃半碗粥', '下午有跌倒風險評估'
+]
+QUERIES = ['壓傷', '血糖', 'NPO', '約束 出院', '跌倒風險', '052', '氧氣', '家屬探視']
+
+
+def synthetic_record(i, rng):
+    beds = [f"{rng.randint(1, 300):03d}" for _ in range(3)]
+    raw = ' '.join(f"{bed}爺爺{rng.choice(PHRASES)}" for bed in beds)
+    report = '\n'.join(f"- **病人編號：{bed}** {rng.choice(PHRASES)}" for bed in beds)
+    timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(1700000000 + i * 60))
+    return {
+        'timestamp': timestamp,
+        'created_at': f"{timestamp[:4]}-{timestamp[4:6]}-{timestamp[6:8]} {timestamp[9:11]}:{timestamp[11:13]}:{timestamp[13:]}",
+        'raw_transcription': raw,
+        'formatted_report': report,
+        'line_user_id': f"U{i % 20:04d}"
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全文搜尋基準測試')
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20, help='每個查詢重複次數')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RecordStore(tmp)
+        index = SearchIndex(store)
+
+        # 大量匯入記錄後一次重建索引
+        rows = [synthetic_record(i, rng) for i in range(args.records)]
+        with store.conn as conn:
+            conn.executemany(
+                "INSERT INTO records (timestamp, created_at, line_user_id, raw_transcription, formatted_report) "
+                "VALUES (:timestamp, :created_at, :line_user_id, :raw_transcription, :formatted_report)",
+                rows
+            )
+        start = time.perf_counter()
+        index.reindex()
+        elapsed = time.perf_counter() - start
+        print(f"重建 {args.records} 筆索引：{elapsed:.1f} 秒（{args.records / elapsed:.0f} 筆/秒）")
+        print(f"資料庫大小：{os.path.getsize(store.db_path) / 1024 / 1024:.1f} MB")
+
+        # 模擬 save_transcription_log 的增量寫入
+        incremental = []
+        for i in range(args.records, args.records + 50):
+            log_data = synthetic_record(i, rng)
+            t = time.perf_counter()
+            record_id = store.add(log_data)
+            index.index_record(record_id, log_data['raw_transcription'], log_data['formatted_report'])
+            incremental.append(time.perf_counter() - t)
+        print(f"單筆保存＋增量索引：p50 {percentile(incremental, 50) * 1000:.1f} ms")
+
+        latencies = []
+        for query in QUERIES:
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                results, total = index.search(query)
+                latencies.append(time.perf_counter() - t)
+            print(f"  「{query}」：{total} 筆命中")
+        print(f"索引查詢延遲：p50 {percentile(latencies, 50) * 1000:.1f} ms，p95 {percentile(latencies, 95) * 1000:.1f} ms")
+
+        scans = []
+        for query in QUERIES:
+            t = time.perf_counter()
+            # 排序與計算總筆數都需要掃描全部記錄
+            store.conn.execute(
+                "SELECT COUNT(*) FROM records WHERE raw_transcription LIKE ? OR formatted_report LIKE ?",
+                (f"%{query}%", f"%{query}%")
+            ).fetchone()
+            scans.append(time.perf_counter() - t)
+        print(f"LIKE 全表掃描（對照）：p50 {percentile(scans, 50) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
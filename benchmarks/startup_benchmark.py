@@ -0,0 +1,86 @@
+"""啟動時間基準測試
+
+在全新的直譯器中匯入 app，量測建立應用程式所需時間、健康檢查延遲，
+並確認重量級套件沒有在啟動時被載入。外部服務皆指向無法連線的位址，
+以確認啟動不依賴 LINE、OpenAI 與 Redis。
+
+執行方式（於專案根目錄）：
+    python benchmarks/startup_benchmark.py --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['numpy', 'PIL', 'pydub', 'openai', 'redis']
+
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+boot = time.perf_counter() - start
+# 只檢查匯入後的狀態；健康檢查在第一個請求時才啟動並載入用戶端
+heavy_modules = [name for name in {heavy} if name in sys.modules]
+
+client = app.app.test_client()
+latencies = []
+for _ in range({requests}):
+    t = time.perf_counter()
+    response = client.get('/callback')
+    latencies.append(time.perf_counter() - t)
+    assert response.status_code == 200
+
+print(json.dumps({{
+    'boot': boot,
+    'health_latencies': latencies,
+    'heavy_modules': heavy_modules
+}}))
+'''
+
+
+def run_once(requests):
+    env = dict(os.environ)
+    env.update({
+        'JOB_WORKERS_IN_PROCESS': '0',
+        'LINE_CHANNEL_ACCESS_TOKEN': 'benchmark',
+        'LINE_CHANNEL_SECRET': 'benchmark',
+        'OPENAI_API_KEY': 'benchmark',
+        'REDIS_URL': 'redis://127.0.0.1:1',
+    })
+    code = PROBE.format(requests=requests, heavy=repr(HEAVY_MODULES))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='量測 app 啟動時間與健康檢查延遲')
+    parser.add_argument('--runs', type=int, default=5, help='啟動次數')
+    parser.add_argument('--requests', type=int, default=200, help='每次啟動後的健康檢查次數')
+    args = parser.parse_args()
+
+    boots = []
+    latencies = []
+    heavy = set()
+    for _ in range(args.runs):
+        result = run_once(args.requests)
+        boots.append(result['boot'])
+        latencies.extend(result['health_latencies'])
+        heavy.update(result['heavy_modules'])
+
+    print(f"啟動時間（{args.runs} 次）: 最小 {min(boots) * 1000:.1f} ms，中位數 {statistics.median(boots) * 1000:.1f} ms")
+    print(f"健康檢查延遲: p50 {percentile(latencies, 50) * 1000:.2f} ms，p99 {percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"啟動時載入的重量級套件: {', '.join(sorted(heavy)) or '無'}")
+
+
+if __name__ == "__main__":
+    main()
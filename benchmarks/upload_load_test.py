@@ -0,0 +1,157 @@
+"""語音上傳負載測試
+
+啟動假 OpenAI 伺服器與待測服務，同時送出大量 /care-record/upload 請求，
+比較非同步 ASGI 路徑（uvicorn asgi:app，單一程序）與同步 gunicorn worker 的吞吐量。
+每個請求上傳不同的隨機雜訊 WAV，避免命中結果快取（wsgi 模式會以 pydub 解碼，需要 FFmpeg）。
+
+執行方式（於專案根目錄）：
+    python benchmarks/upload_load_test.py --target asgi --concurrency 200 --requests 400
+    python benchmarks/upload_load_test.py --target wsgi --workers 4 --concurrency 200 --requests 40
+"""
+import os
+import sys
+import io
+import time
+import wave
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+FAKE_OPENAI_PORT = 8900
+SERVER_PORT = 8901
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def noise_wav(size_kb):
+    """產生指定大小的 16kHz 單聲道隨機雜訊 WAV"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(os.urandom(size_kb * 1024))
+    return buffer.getvalue()
+
+
+def start_servers(args, cache_dir):
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{FAKE_OPENAI_PORT}/v1",
+        'OPENAI_API_KEY': 'benchmark',
+        'LINE_CHANNEL_ACCESS_TOKEN': 'benchmark',
+        'LINE_CHANNEL_SECRET': 'benchmark',
+        'REDIS_URL': 'redis://127.0.0.1:1',
+        'JOB_WORKERS_IN_PROCESS': '0',
+        'HEALTH_PROBE_INTERVAL': '3600',
+        'CACHE_DIR': cache_dir,
+    })
+    fake = subprocess.Popen(
+        [sys.executable, 'benchmarks/fake_openai.py', '--port', str(FAKE_OPENAI_PORT),
+         '--transcribe-latency', str(args.transcribe_latency),
+         '--chat-latency', str(args.chat_latency)],
+        cwd=ROOT, env=env
+    )
+    if args.target == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(SERVER_PORT),
+                   '--log-level', 'warning', '--limit-concurrency', '10000']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-b',
+                   f"127.0.0.1:{SERVER_PORT}", '--timeout', '600', 'app:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return fake, server
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服務未在 {timeout} 秒內啟動: {url}")
+
+
+async def run_load(args):
+    base_url = f"http://127.0.0.1:{SERVER_PORT}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = []
+
+    async def upload(client, i):
+        audio = noise_wav(args.audio_kb)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    '/care-record/upload',
+                    files={'audio': (f"recording_{i}.wav", audio, 'audio/wav')}
+                )
+                if response.status_code == 200 and response.json().get('success'):
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors.append(f"HTTP {response.status_code}")
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(client, i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+        peak = httpx.get(f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats").json()['peak_in_flight']
+    return latencies, errors, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同時上傳語音的負載測試')
+    parser.add_argument('--target', choices=['asgi', 'wsgi'], default='asgi')
+    parser.add_argument('--workers', type=int, default=4, help='wsgi 模式的 gunicorn worker 數')
+    parser.add_argument('--concurrency', type=int, default=200, help='同時進行的上傳數')
+    parser.add_argument('--requests', type=int, default=400, help='總上傳數')
+    parser.add_argument('--audio-kb', type=int, default=256, help='每個上傳的大小（KB）')
+    parser.add_argument('--transcribe-latency', type=float, default=2.0)
+    parser.add_argument('--chat-latency', type=float, default=3.0)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='upload_load_test_')
+    fake, server = start_servers(args, cache_dir)
+    try:
+        wait_ready(f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats")
+        wait_ready(f"http://127.0.0.1:{SERVER_PORT}/callback")
+        latencies, errors, elapsed, peak = asyncio.run(run_load(args))
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    mode = '單一程序 ASGI' if args.target == 'asgi' else f"gunicorn 同步 worker x {args.workers}"
+    print(f"{mode}：{args.requests} 個上傳，同時 {args.concurrency} 個，"
+          f"模型延遲 {args.transcribe_latency + args.chat_latency:.1f} 秒")
+    print(f"完成 {len(latencies)} 個，失敗 {len(errors)} 個，總時間 {elapsed:.1f} 秒，"
+          f"吞吐量 {len(latencies) / elapsed:.1f} 個/秒")
+    if latencies:
+        print(f"延遲：p50 {percentile(latencies, 50):.1f} 秒，p95 {percentile(latencies, 95):.1f} 秒，"
+              f"最大 {max(latencies):.1f} 秒")
+    print(f"模型伺服器同時處理的最大請求數：{peak}")
+    if errors:
+        print(f"錯誤範例：{', '.join(sorted(set(errors))[:5])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""靜音剪除基準測試
+
+合成交班錄音：2～8 秒的「語音」（調幅的多頻音）之間穿插 0.5～12 秒停頓，
+全程疊加病房背景噪音。檢查：
+- 每一段語音都完整保留（含前後保留的靜音）
+- 短於 VAD_MIN_SILENCE_MS 的停頓不剪除
+並列出剪除的秒數、比例與處理耗時。
+
+執行方式（於專案根目錄，不需要 FFmpeg）：
+    python benchmarks/vad_benchmark.py --minutes 5 20 --noise-db -45
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydub import AudioSegment
+from pydub.generators import Sine, WhiteNoise
+
+from vad import VAD_KEEP_SILENCE_MS, VAD_MIN_SILENCE_MS, speech_ranges, trim_silence
+
+SAMPLE_RATE = 16000
+
+
+def speech_like(duration_ms, rng):
+    """以數個頻率疊加並每 200 毫秒改變音量，模擬語音的能量起伏"""
+    tone = AudioSegment.silent(duration=duration_ms, frame_rate=SAMPLE_RATE)
+    for frequency in (180, 420, 900):
+        tone = tone.overlay(Sine(frequency, sample_rate=SAMPLE_RATE).to_audio_segment(duration=duration_ms) - 12)
+    syllables = AudioSegment.empty()
+    for start in range(0, duration_ms, 200):
+        syllables += tone[start:start + 200] - rng.uniform(0, 8)
+    return syllables
+
+
+def synthetic_handover(minutes, noise_db, seed):
+    """回傳 (錄音, 語音區段列表, 短停頓區段列表)"""
+    rng = random.Random(seed)
+    speech = []
+    short_pauses = []
+    audio = AudioSegment.silent(duration=rng.randint(1000, 5000), frame_rate=SAMPLE_RATE)
+    while len(audio) < minutes * 60 * 1000:
+        duration_ms = rng.randint(2000, 8000)
+        speech.append((len(audio), len(audio) + duration_ms))
+        audio += speech_like(duration_ms, rng)
+        pause_ms = rng.choice([500, 800, 1000, 3000, 6000, 12000])
+        if pause_ms < VAD_MIN_SILENCE_MS:
+            short_pauses.append((len(audio), len(audio) + pause_ms))
+        audio += AudioSegment.silent(duration=pause_ms, frame_rate=SAMPLE_RATE)
+    noise = WhiteNoise(sample_rate=SAMPLE_RATE).to_audio_segment(duration=len(audio), volume=noise_db)
+    return audio.overlay(noise), speech, short_pauses
+
+
+def covered(ranges, start, end):
+    return any(kept_start <= start and end <= kept_end for kept_start, kept_end in ranges)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成錄音上的靜音剪除驗證與耗時')
+    parser.add_argument('--minutes', type=float, nargs='+', default=[5, 20], help='錄音長度（分鐘）')
+    parser.add_argument('--noise-db', type=float, default=-45, help='背景噪音音量（dBFS）')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    failed = False
+    for minutes in args.minutes:
+        audio, speech, short_pauses = synthetic_handover(minutes, args.noise_db, args.seed)
+        start = time.perf_counter()
+        ranges = speech_ranges(audio)
+        trimmed, saved_ms = trim_silence(audio)
+        elapsed = time.perf_counter() - start
+
+        lost = [s for s in speech if not covered(ranges, s[0], s[1])]
+        # 短停頓需完整留在同一個保留區段內
+        cut_short = [p for p in short_pauses if not covered(ranges, p[0], p[1])]
+        silence_ms = len(audio) - sum(end - start for start, end in speech)
+        print(f"\n錄音 {minutes:g} 分鐘，背景噪音 {args.noise_db:g} dBFS，"
+              f"{len(speech)} 段語音，靜音共 {silence_ms / 1000:.0f} 秒")
+        print(f"剪除 {saved_ms / 1000:.1f} 秒（{saved_ms / len(audio):.0%}），"
+              f"{len(audio) / 1000:.0f} 秒 → {len(trimmed) / 1000:.0f} 秒，處理 {elapsed:.2f} 秒")
+        print(f"語音完整保留：{len(speech) - len(lost)}/{len(speech)}，"
+              f"短停頓保留：{len(short_pauses) - len(cut_short)}/{len(short_pauses)}"
+              f"（每段前後保留 {VAD_KEEP_SILENCE_MS} 毫秒）")
+        if lost or cut_short:
+            failed = True
+            print(f"錯誤：遺失語音 {lost[:5]}，被剪除的短停頓 {cut_short[:5]}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context
 import os
+import json
 from datetime import datetime
 import logging
-from werkzeug.utils import secure_filename
+import tracing
+from workspace import JobWorkspace, WorkspaceQuotaExceeded
 from . import speech_to_text as stt
 
-# 設定日誌
-logging.basicConfig(level=logging.DEBUG)
+# 日誌等級由 logging_setup 統一設定（LOG_LEVELS=blueprints.care_record=DEBUG 可個別調整）
 logger = logging.getLogger(__name__)
 
 # 創建 Blueprint
@@ -15,9 +16,22 @@ care_record = Blueprint('care_record', __name__,
                        static_folder='static',
                        url_prefix='/care-record')
 
-# 確保上傳目錄存在
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+def upload_filename(original_name):
+    """暫存檔名保留上傳檔案的副檔名，讓 Whisper 依實際格式處理"""
+    extension = os.path.splitext(original_name or '')[1].lower() or '.webm'
+    return f"recording{extension}"
+
+def save_upload(file):
+    """為上傳建立獨立的工作目錄並寫入音訊，回傳 (工作目錄, 檔案路徑)"""
+    with tracing.span('save_upload'):
+        workspace = JobWorkspace().open()
+        try:
+            filepath = workspace.save_stream(file.stream, upload_filename(file.filename))
+        except Exception:
+            workspace.cleanup()
+            raise
+    logger.info(f"儲存檔案至: {filepath}")
+    return workspace, filepath
 
 @care_record.route('/')
 def index():
@@ -37,21 +51,20 @@ def upload_file():
             logger.error("沒有選擇檔案")
             return jsonify({'error': '沒有選擇檔案'}), 400
         
-        # 儲存音訊檔案
-        filename = secure_filename(f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        logger.info(f"儲存檔案至: {filepath}")
-        file.save(filepath)
+        # 儲存音訊檔案（每個上傳使用獨立的工作目錄）
+        workspace, filepath = save_upload(file)
         
         try:
             # 進行語音辨識
             logger.info("開始進行語音辨識")
-            transcribed_text = stt.transcribe_with_whisper(filepath)
+            with tracing.span('transcribe'):
+                transcribed_text = stt.transcribe_with_whisper(filepath, workspace)
             logger.info("語音辨識完成")
             
             # 生成照護報告
             logger.info("開始生成照護報告")
-            care_report = stt.generate_care_report(transcribed_text)
+            with tracing.span('report'):
+                care_report = stt.generate_care_report(transcribed_text)
             logger.info("照護報告生成完成")
             
             return jsonify({
@@ -65,18 +78,74 @@ def upload_file():
             return jsonify({'error': f"處理過程中發生錯誤: {str(e)}"}), 500
             
         finally:
-            # 清理暫存檔案
-            try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    logger.info("暫存檔案已清理")
-            except Exception as e:
-                logger.error(f"清理暫存檔案時發生錯誤: {str(e)}")
+            # 清理工作目錄
+            workspace.cleanup()
                 
+    except WorkspaceQuotaExceeded as e:
+        logger.error(f"暫存空間不足: {str(e)}")
+        return jsonify({'error': f"暫存空間不足: {str(e)}"}), 507
     except Exception as e:
         logger.error(f"上傳處理過程中發生錯誤: {str(e)}")
         return jsonify({'error': f"上傳處理過程中發生錯誤: {str(e)}"}), 500
 
+def sse_event(event, data):
+    """組成一筆 Server-Sent Events 訊息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@care_record.route('/upload/stream', methods=['POST'])
+def upload_file_stream():
+    """上傳音訊後以 Server-Sent Events 依序回傳轉錄結果與逐段生成的報告"""
+    logger.info("開始處理串流上傳請求")
+    
+    if 'audio' not in request.files:
+        logger.error("沒有收到音訊檔案")
+        return jsonify({'error': '沒有收到音訊檔案'}), 400
+    
+    file = request.files['audio']
+    if file.filename == '':
+        logger.error("沒有選擇檔案")
+        return jsonify({'error': '沒有選擇檔案'}), 400
+    
+    # 回應開始前先儲存檔案，串流過程不再讀取請求內容
+    try:
+        workspace, filepath = save_upload(file)
+    except WorkspaceQuotaExceeded as e:
+        logger.error(f"暫存空間不足: {str(e)}")
+        return jsonify({'error': f"暫存空間不足: {str(e)}"}), 507
+    
+    def generate():
+        try:
+            yield sse_event('status', {'stage': 'transcribing', 'message': '語音辨識中...'})
+            with tracing.span('transcribe'):
+                transcribed_text = stt.transcribe_with_whisper(filepath, workspace)
+            logger.info("語音辨識完成")
+            yield sse_event('transcription', {'text': transcribed_text})
+            
+            yield sse_event('status', {'stage': 'reporting', 'message': '生成照護報告中...'})
+            with tracing.span('report'):
+                for delta in stt.generate_care_report_stream(transcribed_text):
+                    yield sse_event('report', {'text': delta})
+            logger.info("照護報告生成完成")
+            yield sse_event('done', {'success': True})
+            
+        except Exception as e:
+            logger.error(f"串流處理過程中發生錯誤: {str(e)}")
+            yield sse_event('error', {'error': f"處理過程中發生錯誤: {str(e)}"})
+            
+        finally:
+            # 清理工作目錄
+            workspace.cleanup()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # 避免反向代理緩衝整個回應
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @care_record.route('/send_email', methods=['POST'])
 def send_email():
     try:
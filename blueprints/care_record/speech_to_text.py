@@ -1,28 +1,21 @@
-import speech_recognition as sr
-from pydub import AudioSegment
 import os
 import time
 import sys
 from datetime import datetime
-from openai import OpenAI
-import httpx
 import threading
 import itertools
 from dotenv import load_dotenv
+# 使用共用的 OpenAI 客戶端（連線池、逾時與重試設定統一管理）
+import openai_client
+from openai_client import get_openai_client
+from workspace import JobWorkspace
+from result_cache import report_key
+# 轉錄與結果快取（Redis）與 LINE Bot 共用，/status 的快取統計包含網頁版
+from whisper_service import result_cache, transcribe_with_whisper
 
 # 載入環境變數
 load_dotenv()
 
-# 使用環境變數
-client = OpenAI(
-    api_key=os.getenv('OPENAI_API_KEY'),
-    http_client=httpx.Client(
-        timeout=httpx.Timeout(300.0, connect=60.0),  # 增加超時時間到 300 秒
-        follow_redirects=True,
-        transport=httpx.HTTPTransport(retries=3)  # 使用正確的重試機制
-    )
-)
-
 # 進度動畫類
 class ProgressAnimation:
     def __init__(self, description="處理中"):
@@ -60,7 +53,7 @@ def check_dependencies():
         print("FFmpeg 檢查通過")
         
         # 檢查 OpenAI API Key
-        if not client.api_key:
+        if not get_openai_client().api_key:
             print("錯誤：找不到 OpenAI API Key")
             return False
         print("OpenAI API Key 檢查通過")
@@ -70,82 +63,9 @@ def check_dependencies():
         print(f"環境檢查時發生錯誤：{str(e)}")
         return False
 
-def convert_m4a_to_wav(m4a_path):
-    print("\n=== 開始進行音訊檔案轉換 ===")
-    print(f"原始檔案：{m4a_path}")
-    
-    # 檢查檔案是否存在
-    if not os.path.exists(m4a_path):
-        raise FileNotFoundError(f"找不到音訊檔案：{m4a_path}")
-    
-    try:
-        progress = ProgressAnimation("正在讀取音訊檔案")
-        progress.start()
-        
-        # 讀取M4A檔案
-        audio = AudioSegment.from_file(m4a_path, format="m4a")
-        
-        progress.stop()
-        print(f"\n音訊檔案資訊：")
-        duration_seconds = len(audio) / 1000
-        print(f"- 時長：{duration_seconds:.2f} 秒")
-        print(f"- 聲道數：{audio.channels}")
-        print(f"- 取樣率：{audio.frame_rate} Hz")
-        
-        # 轉換為WAV格式
-        progress = ProgressAnimation("正在轉換為WAV格式")
-        progress.start()
-        
-        wav_path = "temp_audio.wav"
-        audio.export(wav_path, format="wav")
-        
-        progress.stop()
-        print(f"\nWAV檔案已儲存至：{wav_path}")
-        
-        return wav_path
-        
-    except Exception as e:
-        if 'progress' in locals():
-            progress.stop()
-        print(f"\n音訊轉換過程中發生錯誤：{str(e)}")
-        print("可能原因：")
-        print("1. FFmpeg 未正確安裝")
-        print("2. 音訊檔案格式不正確或已損壞")
-        print("3. 系統權限不足")
-        raise
-
-def transcribe_with_whisper(audio_path):
-    """使用 OpenAI Whisper 模型進行語音辨識"""
-    try:
-        with open(audio_path, "rb") as audio_file:
-            progress = ProgressAnimation("正在使用 OpenAI Whisper 進行語音辨識")
-            progress.start()
-            
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="zh"
-            )
-            
-            progress.stop()
-            return response.text
-    except Exception as e:
-        if 'progress' in locals():
-            progress.stop()
-        print(f"\nWhisper 辨識錯誤：{str(e)}")
-        raise
-
-def generate_care_report(transcribed_text):
-    """使用 OpenAI 生成照護報告"""
-    max_retries = 3
-    retry_delay = 5  # 重試延遲時間（秒）
-    
-    for attempt in range(max_retries):
-        try:
-            progress = ProgressAnimation("正在生成照護報告")
-            progress.start()
-            
-            prompt = f"""
+CARE_REPORT_MODEL = "gpt-4-turbo-preview"
+CARE_REPORT_SYSTEM_PROMPT = "你是一位專業的醫療照護報告撰寫者，擅長將口語記錄整理成結構化的照護報告。你會確保報告的專業性、完整性和可讀性。"
+CARE_REPORT_PROMPT = """
 請根據以下的語音轉錄內容，生成一份結構完整的照護報告。
 
 報告格式要求：
@@ -201,42 +121,78 @@ def generate_care_report(transcribed_text):
 
 請以專業的醫療照護報告格式輸出，使用繁體中文，確保內容清晰易讀，重點明確。如果某些資訊未在轉錄內容中提及，請標註「未提供相關資訊」。
 """
-            response = client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": "你是一位專業的醫療照護報告撰寫者，擅長將口語記錄整理成結構化的照護報告。你會確保報告的專業性、完整性和可讀性。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                timeout=300  # 設定 API 調用超時時間為 300 秒
-            )
-            
-            progress.stop()
-            return response.choices[0].message.content
-            
-        except Exception as e:
+
+def care_report_cache_key(transcribed_text):
+    return report_key(transcribed_text, CARE_REPORT_MODEL, CARE_REPORT_SYSTEM_PROMPT + CARE_REPORT_PROMPT)
+
+def care_report_messages(transcribed_text):
+    prompt = CARE_REPORT_PROMPT.format(transcribed_text=transcribed_text)
+    return [
+        {"role": "system", "content": CARE_REPORT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_care_report(transcribed_text):
+    """使用 OpenAI 生成照護報告"""
+    cache_key = care_report_cache_key(transcribed_text)
+    cached_report = result_cache.get(cache_key)
+    if cached_report is not None:
+        print("\n使用快取的照護報告")
+        return cached_report
+
+    try:
+        progress = ProgressAnimation("正在生成照護報告")
+        progress.start()
+        
+        # 逾時與 429/5xx 重試由共用客戶端處理
+        response = openai_client.chat(
+            model=CARE_REPORT_MODEL,
+            messages=care_report_messages(transcribed_text),
+            temperature=0.7
+        )
+        
+        progress.stop()
+        care_report = response.choices[0].message.content
+        result_cache.set(cache_key, care_report)
+        return care_report
+        
+    except Exception as e:
+        if 'progress' in locals():
             progress.stop()
-            print(f"\n第 {attempt + 1} 次嘗試生成報告失敗：{str(e)}")
-            if attempt < max_retries - 1:
-                print(f"等待 {retry_delay} 秒後重試...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # 指數退避
-            else:
-                print("\n已達到最大重試次數，生成報告失敗")
-                raise
+        print(f"\n生成報告失敗：{str(e)}")
+        raise
+
+def generate_care_report_stream(transcribed_text):
+    """以串流方式生成照護報告，逐段產生文字；完整報告產生後寫入快取"""
+    cache_key = care_report_cache_key(transcribed_text)
+    cached_report = result_cache.get(cache_key)
+    if cached_report is not None:
+        yield cached_report
+        return
+
+    parts = []
+    for delta in openai_client.chat_stream(
+        care_report_messages(transcribed_text),
+        CARE_REPORT_MODEL,
+        temperature=0.7
+    ):
+        parts.append(delta)
+        yield delta
+    result_cache.set(cache_key, ''.join(parts))
 
 def speech_to_text(audio_path):
+    # 中間檔寫入獨立的工作目錄，同時執行多個轉換也不會互相覆蓋
+    workspace = JobWorkspace()
     try:
+        workspace.open()
         print("\n=== 開始進行語音轉文字 ===")
-        
-        # 將M4A轉換為WAV檔案
-        wav_path = convert_m4a_to_wav(audio_path)
+        print(f"原始檔案：{audio_path}")
         
         print("\n開始進行語音辨識...")
         start_time = time.time()
         
-        # 使用 Whisper 進行辨識
-        transcribed_text = transcribe_with_whisper(wav_path)
+        # 使用 Whisper 進行辨識（支援的格式直接上傳原檔）
+        transcribed_text = transcribe_with_whisper(audio_path, workspace)
         
         print("\n=== 語音辨識完成 ===")
         print("\n原始轉換結果：")
@@ -264,7 +220,7 @@ def speech_to_text(audio_path):
         progress = ProgressAnimation("正在儲存報告")
         progress.start()
         
-        output_text_file = f"照護報告_{timestamp}.txt"
+        output_text_file = f"照護報告_{timestamp}_{workspace.job_id[:8]}.txt"
         with open(output_text_file, "w", encoding="utf-8") as f:
             f.write(f"原始檔案：{audio_path}\n")
             f.write(f"處理時間：{processing_time:.2f} 秒\n")
@@ -284,12 +240,7 @@ def speech_to_text(audio_path):
         print("詳細錯誤訊息：")
         print(traceback.format_exc())
     finally:
-        # 清理暫時檔案
-        progress = ProgressAnimation("正在清理暫時檔案")
-        progress.start()
-        if os.path.exists(wav_path):
-            os.remove(wav_path)
-        progress.stop()
+        workspace.cleanup()
         print("\n處理完成！")
 
 if __name__ == "__main__":
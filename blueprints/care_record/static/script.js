@@ -177,13 +177,35 @@ function stopRecording() {
     }
 }
 
-// 上傳音訊檔案
+// 解析 Server-Sent Events 文字，回傳完整事件與尚未完成的剩餘字串
+function parseSSE(buffer) {
+    const events = [];
+    const blocks = buffer.split('\n\n');
+    const rest = blocks.pop();
+    for (const block of blocks) {
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        }
+        if (data) {
+            events.push({ event, data: JSON.parse(data) });
+        }
+    }
+    return { events, rest };
+}
+
+// 上傳音訊檔案（以串流接收轉錄結果與逐段生成的報告）
 async function uploadAudio(audioBlob) {
     const formData = new FormData();
     formData.append('audio', audioBlob, 'recording.webm');
     
     try {
-        const response = await fetch('/care-record/upload', {
+        const response = await fetch('/care-record/upload/stream', {
             method: 'POST',
             body: formData
         });
@@ -192,16 +214,51 @@ async function uploadAudio(audioBlob) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let report = '';
+        let renderPending = false;
         
-        if (data.success) {
-            // 使用新的格式化函數處理報告
-            const formattedReport = await formatReport(data.report);
-            reportResult.innerHTML = formattedReport;
+        // 合併同一畫面更新週期內收到的片段，避免每個 token 都重新轉換 Markdown
+        const renderReport = () => {
+            if (renderPending) {
+                return;
+            }
+            renderPending = true;
+            requestAnimationFrame(async () => {
+                renderPending = false;
+                reportResult.innerHTML = await formatReport(report);
+            });
+        };
+        
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            const parsed = parseSSE(buffer);
+            buffer = parsed.rest;
             
-            recordingStatus.textContent = '準備就緒';
-        } else {
-            throw new Error(data.error);
+            for (const { event, data } of parsed.events) {
+                if (event === 'status') {
+                    recordingStatus.textContent = data.message;
+                } else if (event === 'report') {
+                    if (!report) {
+                        // 收到第一段報告即可隱藏處理中提示
+                        processingStatus.classList.add('d-none');
+                        progressBar.classList.add('d-none');
+                    }
+                    report += data.text;
+                    renderReport();
+                } else if (event === 'error') {
+                    throw new Error(data.error);
+                } else if (event === 'done') {
+                    reportResult.innerHTML = await formatReport(report);
+                    recordingStatus.textContent = '準備就緒';
+                }
+            }
         }
     } catch (error) {
         console.error('上傳錯誤：', error);
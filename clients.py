@@ -0,0 +1,113 @@
+"""外部服務客戶端
+
+所有客戶端都在第一次使用時才建立（連同其較重的套件匯入），
+讓 worker 啟動與健康檢查不需要等待或依賴 LINE、OpenAI、Redis。
+"""
+import os
+import threading
+
+# LINE Messaging API 位址（基準測試時指向本機的假伺服器）
+LINE_API_ENDPOINT = os.getenv('LINE_API_ENDPOINT', 'https://api.line.me')
+LINE_API_DATA_ENDPOINT = os.getenv('LINE_API_DATA_ENDPOINT', 'https://api-data.line.me')
+# Redis 連線與讀寫逾時（秒），Redis 無回應時盡快改用備援，不讓 webhook 卡住；
+# 讀寫逾時須大於工作佇列 BLMOVE 的等待時間
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', '2'))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '5'))
+
+
+class LazyClient:
+    """第一次存取屬性時才呼叫 factory 建立實體的代理物件"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _create_redis():
+    import redis
+    return redis.from_url(
+        os.getenv('REDIS_URL', 'redis://localhost:6379'),
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT
+    )
+
+
+def _create_openai():
+    from openai_client import get_openai_client
+    return get_openai_client()
+
+
+# LINE API 路徑對應的指標階段名稱
+LINE_API_STAGES = (
+    ('/message/reply', 'line_reply'),
+    ('/message/push', 'line_push'),
+    ('/content', 'line_content'),
+)
+
+
+def line_api_stage(url):
+    for suffix, stage in LINE_API_STAGES:
+        if url.rstrip('/').endswith(suffix):
+            return stage
+    return 'line_api'
+
+
+def _create_line_bot_api():
+    from linebot import LineBotApi
+    from linebot.http_client import RequestsHttpClient
+    import metrics
+    import tracing
+
+    class InstrumentedHttpClient(RequestsHttpClient):
+        """記錄每個 LINE API 呼叫的耗時；HTTP 錯誤狀態也計入失敗次數"""
+
+        def _timed(self, send, url, *args, **kwargs):
+            stage = line_api_stage(url)
+            with metrics.track(stage), tracing.child_span(stage, kind='client') as span:
+                response = send(url, *args, **kwargs)
+                if span is not None:
+                    span.set_attribute('http.status_code', response.status_code)
+                    if response.status_code >= 400:
+                        span.status = 'ERROR'
+            if response.status_code >= 400:
+                metrics.STAGE_ERRORS.inc(stage=stage)
+            return response
+
+        def get(self, url, *args, **kwargs):
+            return self._timed(super().get, url, *args, **kwargs)
+
+        def post(self, url, *args, **kwargs):
+            return self._timed(super().post, url, *args, **kwargs)
+
+        def put(self, url, *args, **kwargs):
+            return self._timed(super().put, url, *args, **kwargs)
+
+        def delete(self, url, *args, **kwargs):
+            return self._timed(super().delete, url, *args, **kwargs)
+
+    return LineBotApi(
+        os.getenv('LINE_CHANNEL_ACCESS_TOKEN'),
+        endpoint=LINE_API_ENDPOINT,
+        data_endpoint=LINE_API_DATA_ENDPOINT,
+        http_client=InstrumentedHttpClient
+    )
+
+
+redis_client = LazyClient(_create_redis)
+openai_client = LazyClient(_create_openai)
+line_bot_api = LazyClient(_create_line_bot_api)
@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# 健康檢查設定
+PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '30'))
+PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', '5'))
+LATENCY_HISTORY = 100
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class ServiceHealth:
+    """單一相依服務的檢查結果與延遲紀錄"""
+
+    def __init__(self, name):
+        self.name = name
+        self.status = 'unknown'
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.last_latency = None
+        self.last_success = None
+        self.last_error = None
+        self.checked_at = None
+
+    def record(self, ok, latency, error=None):
+        self.checked_at = time.time()
+        self.last_latency = latency
+        if ok:
+            self.status = 'up'
+            self.latencies.append(latency)
+            self.last_success = self.checked_at
+            self.last_error = None
+        else:
+            self.status = 'timeout' if error == 'timeout' else 'down'
+            self.last_error = error
+
+    def snapshot(self):
+        latencies = list(self.latencies)
+        result = {
+            'status': self.status,
+            'last_latency_ms': round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            'last_success': _isoformat(self.last_success),
+            'checked_at': _isoformat(self.checked_at),
+            'error': self.last_error
+        }
+        if latencies:
+            result['latency_ms'] = {
+                'p50': round(_percentile(latencies, 50) * 1000, 1),
+                'p95': round(_percentile(latencies, 95) * 1000, 1),
+                'p99': round(_percentile(latencies, 99) * 1000, 1)
+            }
+        return result
+
+
+class HealthMonitor:
+    """在背景定期、並行檢查相依服務，/status 只讀取快取結果"""
+
+    def __init__(self, probes, interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT):
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.services = {name: ServiceHealth(name) for name in probes}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(probes) * 2, thread_name_prefix='health-probe'
+        )
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def _timed_probe(self, probe):
+        """執行檢查並回傳 (成功與否, 延遲秒數, 錯誤訊息)"""
+        start = time.perf_counter()
+        try:
+            probe()
+            return True, time.perf_counter() - start, None
+        except Exception as e:
+            return False, time.perf_counter() - start, str(e)
+
+    def run_once(self):
+        """並行執行所有檢查；逾時的檢查不等待，下一輪仍在執行時不重複送出"""
+        started = time.perf_counter()
+        futures = {}
+        for name, probe in self.probes.items():
+            previous = self._pending.get(name)
+            if previous is not None and not previous.done():
+                self.services[name].record(False, time.perf_counter() - started, 'timeout')
+                continue
+            future = self._executor.submit(self._timed_probe, probe)
+            self._pending[name] = future
+            futures[future] = name
+
+        done, _ = wait(futures, timeout=self.timeout)
+        with self._lock:
+            for future, name in futures.items():
+                service = self.services[name]
+                if future not in done:
+                    service.record(False, self.timeout, 'timeout')
+                    logger.warning(f"健康檢查逾時: {name}")
+                    continue
+                ok, latency, error = future.result()
+                service.record(ok, latency, error)
+                if not ok:
+                    logger.error(f"健康檢查失敗 {name}: {error}")
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"健康檢查執行錯誤: {str(e)}")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """啟動背景檢查執行緒（可重複呼叫，只啟動一次）"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def snapshot(self):
+        """回傳最近一次的檢查結果"""
+        with self._lock:
+            services = {name: service.snapshot() for name, service in self.services.items()}
+        statuses = {service['status'] for service in services.values()}
+        if statuses == {'up'}:
+            status = 'healthy'
+        elif 'unknown' in statuses and statuses <= {'unknown', 'up'}:
+            status = 'starting'
+        else:
+            status = 'unhealthy'
+        return {'status': status, 'services': services}
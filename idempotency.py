@@ -0,0 +1,78 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 事件去重設定
+DEDUP_TTL = int(os.getenv('WEBHOOK_DEDUP_TTL', str(24 * 3600)))
+LOCAL_MAX_KEYS = int(os.getenv('WEBHOOK_DEDUP_LOCAL_MAX', '10000'))
+REDIS_PREFIX = 'care_sch:event:'
+REDIS_RETRY_INTERVAL = 30  # Redis 失敗後暫停使用的秒數
+
+
+class IdempotencyGuard:
+    """以 Redis SET NX 判斷事件是否已處理過，Redis 無法使用時改用本地有上限的集合"""
+
+    def __init__(self, redis_client=None, ttl=DEDUP_TTL, local_max=LOCAL_MAX_KEYS):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local_max = local_max
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_retry_at = 0
+
+    def _redis_available(self):
+        return self.redis is not None and time.time() >= self._redis_retry_at
+
+    def _redis_failed(self, e):
+        logger.warning(f"Redis 去重暫時無法使用，{REDIS_RETRY_INTERVAL} 秒內改用本地記錄: {str(e)}")
+        self._redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+
+    def _seen_local(self, key):
+        with self._lock:
+            expires_at = self._local.get(key)
+            return expires_at is not None and expires_at > time.time()
+
+    def _claim_local(self, key):
+        now = time.time()
+        with self._lock:
+            expires_at = self._local.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._local[key] = now + self.ttl
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max:
+                self._local.popitem(last=False)
+            return True
+
+    def claim(self, key):
+        """第一次看到 key 時回傳 True，重複時回傳 False"""
+        if self._redis_available():
+            try:
+                claimed = bool(self.redis.set(REDIS_PREFIX + key, 1, nx=True, ex=self.ttl))
+                # Redis 中斷期間已在本地處理過的事件，恢復後的重送仍視為重複
+                return claimed and not self._seen_local(key)
+            except Exception as e:
+                self._redis_failed(e)
+        return self._claim_local(key)
+
+    def release(self, key):
+        """處理失敗時釋放 key，讓之後的重送可以再處理一次"""
+        if self._redis_available():
+            try:
+                self.redis.delete(REDIS_PREFIX + key)
+            except Exception as e:
+                self._redis_failed(e)
+        with self._lock:
+            self._local.pop(key, None)
+
+
+def event_key(event):
+    """取得 webhook 事件的去重鍵：優先使用 webhookEventId，否則使用訊息 ID"""
+    webhook_event_id = getattr(event, 'webhook_event_id', None)
+    if webhook_event_id:
+        return f"webhook:{webhook_event_id}"
+    return f"message:{event.message.id}"
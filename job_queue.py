@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import queue
+import socket
+import logging
+import threading
+import traceback
+
+import tracing
+from logging_setup import log_context, request_id_var
+
+logger = logging.getLogger(__name__)
+
+# 佇列設定
+DEFAULT_QUEUE_NAME = os.getenv('JOB_QUEUE_NAME', 'care_sch:jobs')
+DEFAULT_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+POLL_TIMEOUT = 1  # 秒，worker 等待新工作的逾時時間
+PROMOTE_INTERVAL = 1  # 秒，檢查延後工作是否到期的間隔
+PROMOTE_BATCH = 100  # 每次最多移回佇列的到期工作數
+HEARTBEAT_INTERVAL = 10  # 秒，worker 程序回報存活的間隔
+CONSUMER_TIMEOUT = 60  # 秒，超過此時間未回報的程序，其執行中的工作移回佇列
+BACKEND_RETRY_SECONDS = 30  # 秒，改用程序內佇列後重新嘗試 Redis 的間隔
+
+# 將到期的延後工作移回佇列；在 Redis 內一次完成，程序中途結束也不會遺失工作
+PROMOTE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('LPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+
+class JobDeferred(Exception):
+    """由處理函數拋出，工作在 delay 秒後重新執行；data 中的欄位會更新到工作資料"""
+
+    def __init__(self, delay, **data):
+        super().__init__(f"延後 {delay:.1f} 秒")
+        self.delay = delay
+        self.data = data
+
+
+def consumer_id():
+    """目前程序的識別碼（gunicorn fork 後各 worker 不同）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LocalBackend:
+    """程序內佇列（Redis 無法使用時的備援）
+
+    fallback 為 True 表示是 Redis 無法連線時的暫時備援，稍後會重新嘗試 Redis。
+    """
+
+    name = 'local'
+
+    def __init__(self, fallback=False):
+        self.fallback = fallback
+        self._queue = queue.Queue()
+        self._delayed = []
+        self._delayed_lock = threading.Lock()
+
+    def push(self, payload):
+        self._queue.put(payload)
+
+    def schedule(self, payload, not_before):
+        with self._delayed_lock:
+            heapq.heappush(self._delayed, (not_before, payload))
+
+    def promote_due(self, now):
+        """將到期的延後工作移回佇列，回傳移回的數量"""
+        due = []
+        with self._delayed_lock:
+            while self._delayed and self._delayed[0][0] <= now:
+                due.append(heapq.heappop(self._delayed)[1])
+        for payload in due:
+            self._queue.put(payload)
+        return len(due)
+
+    def pop(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, payload):
+        pass
+
+    def heartbeat(self, now):
+        pass
+
+    def recover(self, now):
+        return 0
+
+    def close(self):
+        pass
+
+    def drain(self):
+        """取出所有尚未執行的工作，回傳 (payload, not_before) 清單；立即執行的工作 not_before 為 None"""
+        items = []
+        while True:
+            try:
+                items.append((self._queue.get_nowait(), None))
+            except queue.Empty:
+                break
+        with self._delayed_lock:
+            items.extend((payload, not_before) for not_before, payload in sorted(self._delayed))
+            self._delayed = []
+        return items
+
+    def size(self):
+        return self._queue.qsize()
+
+
+class RedisBackend:
+    """以 Redis list 實作的佇列，多個 gunicorn worker 或獨立 worker 程序可共用
+
+    取出的工作以 BLMOVE 移到各程序自己的執行中 list，處理完才 ack 移除；
+    程序中途結束時，其他程序發現它超過 CONSUMER_TIMEOUT 未回報，就把工作移回佇列。
+    """
+
+    name = 'redis'
+
+    def __init__(self, redis_client, queue_name):
+        self.redis = redis_client
+        self.queue_name = queue_name
+        # 延後的工作存放在以執行時間為分數的 sorted set，到期才移回 list
+        self.delayed_name = f"{queue_name}:delayed"
+        self.consumers_name = f"{queue_name}:consumers"
+        self._promote = None
+        self._last_heartbeat = 0
+
+    def processing_name(self, consumer=None):
+        return f"{self.queue_name}:processing:{consumer or consumer_id()}"
+
+    def push(self, payload):
+        self.redis.lpush(self.queue_name, payload)
+
+    def schedule(self, payload, not_before):
+        self.redis.zadd(self.delayed_name, {payload: not_before})
+
+    def promote_due(self, now):
+        if self._promote is None:
+            self._promote = self.redis.register_script(PROMOTE_SCRIPT)
+        return int(self._promote(keys=[self.delayed_name, self.queue_name], args=[now, PROMOTE_BATCH]))
+
+    def pop(self, timeout):
+        # 先登記本程序，執行中 list 才會在程序結束後被回收
+        if time.time() - self._last_heartbeat >= HEARTBEAT_INTERVAL:
+            self.heartbeat(time.time())
+        return self.redis.blmove(self.queue_name, self.processing_name(), timeout, 'RIGHT', 'LEFT')
+
+    def ack(self, payload):
+        self.redis.lrem(self.processing_name(), 1, payload)
+
+    def heartbeat(self, now):
+        self.redis.hset(self.consumers_name, consumer_id(), now)
+        self._last_heartbeat = now
+
+    def _requeue(self, consumer):
+        """將程序執行中的工作移回佇列最前面，回傳移回的數量"""
+        processing = self.processing_name(consumer)
+        count = 0
+        while self.redis.lmove(processing, self.queue_name, 'LEFT', 'RIGHT') is not None:
+            count += 1
+        return count
+
+    def recover(self, now):
+        """將逾時未回報的程序執行中的工作移回佇列"""
+        count = 0
+        for consumer, seen in self.redis.hgetall(self.consumers_name).items():
+            if float(seen) >= now - CONSUMER_TIMEOUT:
+                continue
+            if isinstance(consumer, bytes):
+                consumer = consumer.decode('utf-8')
+            # HDEL 成功的程序才負責回收，避免多個程序重複移回
+            if self.redis.hdel(self.consumers_name, consumer):
+                moved = self._requeue(consumer)
+                if moved:
+                    logger.warning(f"程序 {consumer} 已逾時，{moved} 筆執行中的工作移回佇列")
+                count += moved
+        return count
+
+    def close(self):
+        """停止時將本程序未完成的工作移回佇列"""
+        self.redis.hdel(self.consumers_name, consumer_id())
+        return self._requeue(consumer_id())
+
+    def size(self):
+        return self.redis.llen(self.queue_name)
+
+
+def select_backend(redis_client=None, queue_name=DEFAULT_QUEUE_NAME, allow_local=True):
+    """Redis 可連線時使用 Redis，否則退回程序內佇列
+
+    allow_local 為 False 時（本程序不執行 worker）不退回程序內佇列，直接拋出例外，
+    否則工作會排進沒有人處理的佇列。
+    """
+    if redis_client is None:
+        return LocalBackend()
+    try:
+        redis_client.ping()
+        logger.info(f"工作佇列使用 Redis: {queue_name}")
+        return RedisBackend(redis_client, queue_name)
+    except Exception as e:
+        if not allow_local:
+            raise
+        logger.warning(f"Redis 無法連線，{BACKEND_RETRY_SECONDS} 秒內工作佇列改用程序內佇列: {str(e)}")
+        return LocalBackend(fallback=True)
+
+
+class JobQueue:
+    """背景工作佇列
+
+    工作以 dict 表示並序列化為 JSON，依 `type` 分派給已註冊的處理函數。
+    backend 可傳入佇列實體，或回傳佇列實體的函數（第一次使用時才建立；
+    佇列出錯或暫時改用程序內佇列時，會再呼叫一次重新選擇）。
+    """
+
+    def __init__(self, backend, workers=DEFAULT_WORKERS):
+        if callable(backend):
+            self._backend = None
+            self._backend_factory = backend
+        else:
+            self._backend = backend
+            self._backend_factory = None
+        self._backend_lock = threading.Lock()
+        self.workers = workers
+        self.handlers = {}
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._next_promote = 0
+        self._reselect_at = 0
+
+    @property
+    def backend(self):
+        backend = self._backend
+        if backend is None or (getattr(backend, 'fallback', False) and time.time() >= self._reselect_at):
+            with self._backend_lock:
+                if self._backend is backend:
+                    self._reselect(backend)
+        return self._backend
+
+    def _reselect(self, previous):
+        """重新選擇佇列；從程序內備援換回 Redis 時，把尚未執行的工作搬過去"""
+        backend = self._backend_factory()
+        if getattr(backend, 'fallback', False):
+            self._reselect_at = time.time() + BACKEND_RETRY_SECONDS
+        if previous is not None and previous is not backend and getattr(previous, 'fallback', False):
+            pending = previous.drain()
+            for payload, not_before in pending:
+                if not_before is None:
+                    backend.push(payload)
+                else:
+                    backend.schedule(payload, not_before)
+            if pending:
+                logger.info(f"已將 {len(pending)} 筆程序內工作移到 {backend.name} 佇列")
+        self._backend = backend
+
+    def _backend_failed(self, backend):
+        """佇列出錯時捨棄目前的選擇，下次使用時重新連線"""
+        if self._backend_factory is None:
+            return
+        with self._backend_lock:
+            if self._backend is backend and not getattr(backend, 'fallback', False):
+                self._backend = None
+
+    def register(self, job_type, func):
+        """註冊工作處理函數"""
+        self.handlers[job_type] = func
+
+    def handler(self, job_type):
+        """以裝飾器形式註冊工作處理函數"""
+        def decorator(func):
+            self.register(job_type, func)
+            return func
+        return decorator
+
+    def enqueue(self, job_type, **data):
+        """加入工作並立即回傳工作 ID"""
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'enqueued_at': time.time(),
+            # 工作日誌沿用加入工作時的請求 ID，可與 webhook 請求對應
+            'request_id': request_id_var.get(),
+            # worker 以相同的 trace 接續記錄各階段 span
+            'traceparent': tracing.current_traceparent(),
+            'data': data
+        }
+        payload = json.dumps(job, ensure_ascii=False)
+        backend = self.backend
+        try:
+            backend.push(payload)
+        except Exception as e:
+            if self._backend_factory is None:
+                raise
+            # 例如 Redis 斷線：重新選擇佇列再試一次（不允許程序內佇列時會拋出例外）
+            logger.warning(f"工作佇列寫入失敗，重新選擇佇列: {str(e)}")
+            self._backend_failed(backend)
+            self.backend.push(payload)
+        logger.info(f"已加入工作 {job['id']} ({job_type})，佇列長度: {self.size()}")
+        return job['id']
+
+    def size(self):
+        try:
+            return self.backend.size()
+        except Exception:
+            return -1
+
+    def _promote_due(self):
+        """每 PROMOTE_INTERVAL 秒最多檢查一次延後工作，不必每取一筆工作就查詢"""
+        now = time.time()
+        if now < self._next_promote:
+            return
+        self._next_promote = now + PROMOTE_INTERVAL
+        count = self.backend.promote_due(now)
+        if count:
+            logger.info(f"{count} 筆延後的工作已到執行時間，移回佇列")
+
+    def process_one(self, timeout=POLL_TIMEOUT):
+        """取出並執行一筆工作，沒有工作時回傳 False
+
+        工作執行完（包含失敗或延後）才 ack；程序中途結束時工作會由其他程序移回佇列，
+        因此同一筆工作可能執行超過一次。
+        """
+        self._promote_due()
+        backend = self.backend
+        raw = backend.pop(timeout)
+        if raw is None:
+            return False
+        try:
+            self._run(backend, raw)
+        finally:
+            backend.ack(raw)
+        return True
+
+    def _run(self, backend, raw):
+        payload = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        job = json.loads(payload)
+
+        # 尚未到執行時間的工作（例如舊版放回 list 的延後工作）改存回延後區
+        if job.get('not_before', 0) > time.time():
+            backend.schedule(payload, job['not_before'])
+            return
+
+        func = self.handlers.get(job['type'])
+        if func is None:
+            logger.error(f"找不到工作類型的處理函數: {job['type']}")
+            return
+
+        with log_context(request_id=job.get('request_id'), job_id=job['id']):
+            wait_time = time.time() - job.get('enqueued_at', time.time())
+            logger.info(f"開始執行工作 {job['id']} ({job['type']})，等待時間 {wait_time:.2f} 秒")
+            with tracing.span(f"job {job['type']}", parent=job.get('traceparent'), kind='consumer',
+                              **{'job.wait_seconds': round(wait_time, 3)}):
+                try:
+                    func(job['data'])
+                    logger.info(f"工作 {job['id']} 完成")
+                except JobDeferred as e:
+                    self._defer(backend, job, e)
+                except Exception as e:
+                    tracing.record_exception(e)
+                    logger.error(f"工作 {job['id']} 執行失敗: {str(e)}")
+                    logger.error(traceback.format_exc())
+
+    def _defer(self, backend, job, deferred):
+        job['data'].update(deferred.data)
+        job['not_before'] = time.time() + deferred.delay
+        backend.schedule(json.dumps(job, ensure_ascii=False), job['not_before'])
+        logger.info(f"工作 {job['id']} 延後 {deferred.delay:.1f} 秒執行")
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            backend = self._backend
+            try:
+                self.process_one()
+            except Exception as e:
+                # 佇列本身出錯（例如 Redis 暫時斷線）時稍待再試，並重新選擇佇列
+                logger.error(f"工作佇列讀取失敗: {str(e)}")
+                self._backend_failed(backend)
+                time.sleep(POLL_TIMEOUT)
+
+    def _heartbeat_loop(self):
+        """定期回報本程序存活，並回收逾時程序未完成的工作"""
+        while not self._stop_event.wait(HEARTBEAT_INTERVAL):
+            try:
+                backend = self.backend
+                now = time.time()
+                backend.heartbeat(now)
+                backend.recover(now)
+            except Exception as e:
+                logger.warning(f"工作佇列存活回報失敗: {str(e)}")
+
+    def start(self):
+        """啟動背景 worker 執行緒"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"job-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"已啟動 {self.workers} 個工作執行緒")
+
+    def stop(self, timeout=None):
+        """停止背景 worker 執行緒"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        try:
+            self.backend.close()
+        except Exception as e:
+            logger.warning(f"無法將未完成的工作移回佇列: {str(e)}")
+
+    def run_forever(self):
+        """在前景執行 worker（供獨立 worker 程序使用）"""
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("收到中斷訊號，停止工作執行緒")
+            self.stop()
@@ -0,0 +1,275 @@
+"""非阻塞、可輪替的結構化日誌
+
+- 各執行緒只把紀錄放進記憶體佇列（QueueHandler），由背景的 QueueListener 寫入檔案與主控台，
+  處理請求的執行緒不會因磁碟 I/O 而阻塞
+- 日誌檔為每行一筆 JSON，附上 request_id / job_id；超過 LOG_MAX_BYTES 或跨日時輪替，
+  舊檔以 gzip 壓縮，保留 LOG_BACKUP_COUNT 份
+- 各 logger 的等級由 LOG_LEVELS 個別設定（例如 "blueprints.care_record=DEBUG,httpx=WARNING"），
+  不再以 basicConfig 改動整個程序的等級
+
+使用方式：
+    from logging_setup import configure_logging
+    configure_logging()
+"""
+import os
+import gzip
+import json
+import time
+import uuid
+import queue
+import atexit
+import shutil
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# 日誌檔路徑，{pid} 代入程序 ID：多個 gunicorn worker 各寫一個檔案，避免同時輪替同一個檔案；設為空字串則只輸出到主控台
+LOG_FILE = os.getenv('LOG_FILE', 'app.{pid}.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '14'))
+# 主控台輸出格式：text（人工閱讀）或 json（交給日誌收集服務）
+LOG_CONSOLE_FORMAT = os.getenv('LOG_CONSOLE_FORMAT', 'text')
+
+# 第三方套件每個 HTTP 請求都會記一筆 INFO，預設調高門檻
+DEFAULT_LOGGER_LEVELS = {
+    'httpx': 'WARNING',
+    'httpcore': 'WARNING',
+    'urllib3': 'WARNING',
+}
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(context)s%(message)s'
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+job_id_var = contextvars.ContextVar('job_id', default=None)
+
+_listener = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(request_id=None, job_id=None):
+    """在此區塊內記錄的日誌附上 request_id / job_id"""
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if job_id is not None:
+        tokens.append((job_id_var, job_id_var.set(job_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """在產生紀錄的執行緒中取出 request_id / job_id，寫入後才離開該執行緒的 context"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.job_id = job_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄輸出為一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for field in ('request_id', 'job_id'):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """沿用原本的文字格式，有 request_id / job_id 時附在訊息前"""
+
+    def format(self, record):
+        ids = [value for value in (getattr(record, 'request_id', None), getattr(record, 'job_id', None)) if value]
+        record.context = f"[{' '.join(ids)}] " if ids else ''
+        return super().format(record)
+
+
+class ContextQueueHandler(QueueHandler):
+    """放入佇列前先展開訊息與例外文字
+
+    預設的 QueueHandler 會把例外併入訊息，JSON 輸出就無法分開存放 exception 欄位。
+    """
+
+    def prepare(self, record):
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """超過大小或跨日時輪替，舊檔以 gzip 壓縮（在 QueueListener 執行緒中進行）"""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+        self._rollover_day = self._today()
+
+    @staticmethod
+    def _today():
+        return time.strftime('%Y%m%d')
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+    def shouldRollover(self, record):
+        if self._today() != self._rollover_day:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        self._rollover_day = self._today()
+        if self.stream is not None and self.stream.tell() == 0:
+            # 空檔案不必輪替
+            return
+        super().doRollover()
+
+
+def parse_logger_levels(spec):
+    """解析 "name=LEVEL,name2=LEVEL" 設定"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(log_file=LOG_FILE, level=LOG_LEVEL, logger_levels=LOG_LEVELS):
+    """設定根 logger；重複呼叫時不會重複加入 handler"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handlers = []
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if LOG_CONSOLE_FORMAT == 'json' else TextFormatter(TEXT_FORMAT))
+    handlers.append(console)
+    if log_file:
+        path = log_file.format(pid=os.getpid())
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = CompressedRotatingFileHandler(path)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    # 移除先前 basicConfig 等設定的 handler，所有輸出改經由佇列
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    levels = dict(DEFAULT_LOGGER_LEVELS)
+    levels.update(parse_logger_levels(logger_levels))
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """寫完佇列中剩餘的紀錄並停止背景執行緒"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def init_flask(app):
+    """每個 HTTP 請求使用 X-Request-ID（沒有時自動產生），並在回應標頭中帶回"""
+    from flask import g, request
+
+    @app.before_request
+    def bind_request_id():
+        request_id = request.headers.get('X-Request-ID') or request_id_var.get() or new_request_id()
+        g.log_request_token = request_id_var.set(request_id)
+
+    @app.after_request
+    def add_request_id_header(response):
+        request_id = request_id_var.get()
+        if request_id:
+            response.headers.setdefault('X-Request-ID', request_id)
+        return response
+
+    @app.teardown_request
+    def reset_request_id(exc):
+        token = g.pop('log_request_token', None)
+        if token is not None:
+            request_id_var.reset(token)
+
+    return app
+
+
+class RequestIdMiddleware:
+    """ASGI 版本：設定 request_id 並在回應標頭帶回"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        request_id = headers.get(b'x-request-id', b'').decode('latin-1') or new_request_id()
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                response_headers = list(message.get('headers') or [])
+                # 轉交給 Flask 的請求已由 init_flask 加上標頭
+                if not any(name.lower() == b'x-request-id' for name, _ in response_headers):
+                    response_headers.append((b'x-request-id', request_id.encode('latin-1')))
+                message['headers'] = response_headers
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
@@ -0,0 +1,253 @@
+"""處理流程的延遲與用量指標（Prometheus 文字格式）
+
+各階段（下載、轉檔、靜音剪除、Whisper、報告生成、記錄保存、LINE 回覆）的耗時以
+histogram 記錄，另有錯誤與重試次數、處理的音訊秒數、使用的 token 數等 counter，
+由 /metrics 以 Prometheus 文字格式輸出。
+
+設定 METRICS_ENABLED=0 時所有指標都換成空實作，track() 回傳共用的空 context manager，
+不取時間、不加鎖。指標存在各程序的記憶體中，多個 gunicorn worker 時每個 worker 各自計算。
+
+    with metrics.track('whisper'):
+        ...
+    metrics.AUDIO_SECONDS.inc(12.5, source='line')
+"""
+import os
+import time
+import math
+import threading
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_PREFIX = 'care_sch_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 秒；涵蓋 LINE 回覆（數十毫秒）到長錄音轉錄（數分鐘）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self._callback is not None:
+            # 輸出時才讀取目前的值（例如佇列長度），平常不需要更新
+            try:
+                self.set(self._callback())
+            except Exception:
+                pass
+        return super().render()
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _render_value(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class _NoopMetric:
+    """METRICS_ENABLED=0 時使用，所有操作都不做事"""
+
+    def inc(self, amount=1, **labels):
+        pass
+
+    def dec(self, amount=1, **labels):
+        pass
+
+    def set(self, value, **labels):
+        pass
+
+    def observe(self, value, **labels):
+        pass
+
+    def time(self, **labels):
+        return _NULL_CONTEXT
+
+    def render(self):
+        return []
+
+
+_NULL_CONTEXT = nullcontext()
+_NOOP = _NoopMetric()
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    if not METRICS_ENABLED:
+        return _NOOP
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return _register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render():
+    """所有指標的 Prometheus 文字格式"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# 共用指標
+STAGE_SECONDS = histogram('stage_duration_seconds', '各處理階段耗時（秒）', ['stage'])
+STAGE_ERRORS = counter('stage_errors_total', '各處理階段失敗次數', ['stage'])
+OPENAI_RETRIES = counter('openai_retries_total', 'OpenAI API 重試次數', ['call_type'])
+OPENAI_TOKENS = counter('openai_tokens_total', 'Chat Completions 使用的 token 數', ['model', 'kind'])
+AUDIO_SECONDS = counter('audio_seconds_total', '轉錄的音訊長度（秒，剪除靜音前）')
+AUDIO_TRIMMED_SECONDS = counter('audio_trimmed_seconds_total', '轉錄前剪除的靜音長度（秒）')
+
+
+class _StageTimer:
+    """記錄單一階段的耗時，發生例外時同時累計錯誤次數
+
+    例外類別設定 counts_as_error = False 時（例如名額不足而延後）不計入錯誤。
+    """
+
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, stage=self.stage)
+        if exc_type is not None and getattr(exc_type, 'counts_as_error', True):
+            STAGE_ERRORS.inc(stage=self.stage)
+
+
+def track(stage):
+    """with metrics.track('whisper'): ... 記錄該階段耗時與錯誤"""
+    if not METRICS_ENABLED:
+        return _NULL_CONTEXT
+    return _StageTimer(stage)
@@ -0,0 +1,375 @@
+"""共用的 OpenAI 客戶端
+
+app.py、speech_to_text.py 與 care_record blueprint 共用同一個連線池：
+- 連線池大小與 keep-alive 可由環境變數調整
+- 依呼叫類型使用不同逾時（對話較短、語音較長）
+- 遇到 429 / 5xx / 連線錯誤時以指數退避加隨機抖動重試，並遵守 Retry-After
+
+asgi.py 的非同步路徑使用 AsyncOpenAI（a 開頭的函式），逾時與重試規則相同。
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+
+import httpx
+
+import metrics
+import admission
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# 連線池設定
+MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE', '10'))
+KEEPALIVE_EXPIRY = 60.0
+# 非同步路徑單一程序即可同時等待大量請求，連線池需較大
+ASYNC_MAX_CONNECTIONS = int(os.getenv('OPENAI_ASYNC_MAX_CONNECTIONS', '200'))
+
+# 各呼叫類型的逾時（秒）
+TIMEOUTS = {
+    'chat': httpx.Timeout(float(os.getenv('OPENAI_CHAT_TIMEOUT', '120')), connect=10.0),
+    'audio': httpx.Timeout(float(os.getenv('OPENAI_AUDIO_TIMEOUT', '300')), connect=10.0),
+    'default': httpx.Timeout(30.0, connect=10.0)
+}
+
+# 重試設定
+MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '4'))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# 呼叫類型對應的指標階段名稱
+METRIC_STAGES = {'audio': 'whisper', 'chat': 'chat'}
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'responses': 0,
+    'in_flight': 0,
+    'peak_in_flight': 0,
+    'retries': 0,
+    'failures': 0
+}
+
+
+def _count(name, delta=1):
+    with _stats_lock:
+        _stats[name] += delta
+        if name == 'in_flight' and _stats['in_flight'] > _stats['peak_in_flight']:
+            _stats['peak_in_flight'] = _stats['in_flight']
+
+
+def _on_request(request):
+    _count('requests')
+
+
+def _on_response(response):
+    _count('responses')
+
+
+def _create_http_client():
+    return httpx.Client(
+        timeout=TIMEOUTS['default'],
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        follow_redirects=True,
+        event_hooks={'request': [_on_request], 'response': [_on_response]}
+    )
+
+
+async def _on_async_request(request):
+    _count('requests')
+
+
+async def _on_async_response(response):
+    _count('responses')
+
+
+def _create_async_http_client():
+    return httpx.AsyncClient(
+        timeout=TIMEOUTS['default'],
+        limits=httpx.Limits(
+            max_connections=ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=ASYNC_MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        follow_redirects=True,
+        event_hooks={'request': [_on_async_request], 'response': [_on_async_response]}
+    )
+
+
+def get_openai_client():
+    """取得程序共用的 OpenAI 客戶端（重試由 call_with_retry 負責）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(
+                    api_key=os.getenv('OPENAI_API_KEY'),
+                    http_client=_create_http_client(),
+                    max_retries=0
+                )
+    return _client
+
+
+def get_async_openai_client():
+    """取得程序共用的 AsyncOpenAI 客戶端（只能在同一個事件迴圈中使用）"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+                _async_client = AsyncOpenAI(
+                    api_key=os.getenv('OPENAI_API_KEY'),
+                    http_client=_create_async_http_client(),
+                    max_retries=0
+                )
+    return _async_client
+
+
+def _retry_after(error):
+    """讀取 Retry-After 標頭（秒），沒有時回傳 None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_retryable(error):
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRY_STATUS_CODES
+    return False
+
+
+def backoff_delay(attempt, retry_after=None):
+    """指數退避加隨機抖動；伺服器指定 Retry-After 時以其為下限"""
+    cap = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    delay = cap / 2 + random.uniform(0, cap / 2)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _rewind_file(kwargs):
+    """重試上傳前將檔案指標移回開頭"""
+    audio_file = kwargs.get('file')
+    if isinstance(audio_file, tuple):
+        audio_file = audio_file[1]
+    if hasattr(audio_file, 'seek'):
+        audio_file.seek(0)
+
+
+def _stage(call_type):
+    return METRIC_STAGES.get(call_type, call_type)
+
+
+def _span_attributes(kwargs):
+    return {'openai.model': kwargs.get('model', '')}
+
+
+def _record_usage(response, model):
+    """累計 Chat Completions 回應中的 token 用量（串流回應沒有 usage）"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    metrics.OPENAI_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind='prompt')
+    metrics.OPENAI_TOKENS.inc(usage.completion_tokens or 0, model=model, kind='completion')
+
+
+def call_with_retry(call_type, func, admitted=False, **kwargs):
+    """以指定呼叫類型的逾時執行 API 呼叫，可重試的錯誤會自動重試
+
+    admitted 為 True 表示呼叫端已持有模型呼叫名額（例如串流回應），不再另外排隊。
+    """
+    with metrics.track(_stage(call_type)), tracing.span(_stage(call_type), kind='client', **_span_attributes(kwargs)):
+        return _call_with_retry(call_type, func, admitted, **kwargs)
+
+
+def _call_with_retry(call_type, func, admitted, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUTS.get(call_type, TIMEOUTS['default']))
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            if attempt > 0:
+                _rewind_file(kwargs)
+            # 每次嘗試各自取得名額，等待重試時不佔用名額
+            with admission.model_slot(held=admitted):
+                _count('in_flight')
+                try:
+                    return func(**kwargs)
+                finally:
+                    _count('in_flight', -1)
+        except admission.AdmissionBusy:
+            # 名額不足、工作將延後重新執行，不是 API 呼叫失敗
+            raise
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                _count('failures')
+                raise
+            delay = backoff_delay(attempt, _retry_after(e))
+            _count('retries')
+            metrics.OPENAI_RETRIES.inc(call_type=call_type)
+            tracing.set_attribute('openai.retries', attempt + 1)
+            logger.warning(f"OpenAI {call_type} 呼叫失敗，{delay:.1f} 秒後重試（第 {attempt + 1} 次）: {str(e)}")
+            time.sleep(delay)
+
+
+async def acall_with_retry(call_type, func, admitted=False, **kwargs):
+    """call_with_retry 的非同步版本，等待重試時不佔用事件迴圈"""
+    with metrics.track(_stage(call_type)), tracing.span(_stage(call_type), kind='client', **_span_attributes(kwargs)):
+        return await _acall_with_retry(call_type, func, admitted, **kwargs)
+
+
+async def _acall_with_retry(call_type, func, admitted, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUTS.get(call_type, TIMEOUTS['default']))
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            if attempt > 0:
+                _rewind_file(kwargs)
+            async with admission.amodel_slot(held=admitted):
+                _count('in_flight')
+                try:
+                    return await func(**kwargs)
+                finally:
+                    _count('in_flight', -1)
+        except admission.AdmissionBusy:
+            # 名額不足、工作將延後重新執行，不是 API 呼叫失敗
+            raise
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                _count('failures')
+                raise
+            delay = backoff_delay(attempt, _retry_after(e))
+            _count('retries')
+            metrics.OPENAI_RETRIES.inc(call_type=call_type)
+            tracing.set_attribute('openai.retries', attempt + 1)
+            logger.warning(f"OpenAI {call_type} 呼叫失敗，{delay:.1f} 秒後重試（第 {attempt + 1} 次）: {str(e)}")
+            await asyncio.sleep(delay)
+
+
+def transcribe(audio_file, model="whisper-1", language="zh"):
+    """呼叫 Whisper API 轉錄音訊"""
+    client = get_openai_client()
+    response = call_with_retry(
+        'audio',
+        client.audio.transcriptions.create,
+        model=model,
+        file=audio_file,
+        language=language
+    )
+    return response.text
+
+
+def chat(messages, model, admitted=False, **kwargs):
+    """呼叫 Chat Completions API，回傳完整回應"""
+    client = get_openai_client()
+    response = call_with_retry(
+        'chat',
+        client.chat.completions.create,
+        admitted=admitted,
+        model=model,
+        messages=messages,
+        **kwargs
+    )
+    _record_usage(response, model)
+    return response
+
+
+def chat_stream(messages, model, **kwargs):
+    """以 stream=True 呼叫 Chat Completions API，逐段產生文字
+
+    只有建立串流的請求會重試；開始輸出後中斷則直接拋出錯誤，避免重複輸出。
+    模型仍在產生內容，名額持有到串流讀完或關閉為止。
+    """
+    with admission.model_slot():
+        stream = chat(messages, model, admitted=True, stream=True, **kwargs)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # 提前結束（例如瀏覽器中斷連線）時釋放連線回連線池
+            stream.response.close()
+
+
+async def atranscribe(audio_file, model="whisper-1", language="zh"):
+    """非同步呼叫 Whisper API 轉錄音訊"""
+    client = get_async_openai_client()
+    response = await acall_with_retry(
+        'audio',
+        client.audio.transcriptions.create,
+        model=model,
+        file=audio_file,
+        language=language
+    )
+    return response.text
+
+
+async def achat(messages, model, admitted=False, **kwargs):
+    """非同步呼叫 Chat Completions API，回傳完整回應"""
+    client = get_async_openai_client()
+    response = await acall_with_retry(
+        'chat',
+        client.chat.completions.create,
+        admitted=admitted,
+        model=model,
+        messages=messages,
+        **kwargs
+    )
+    _record_usage(response, model)
+    return response
+
+
+async def achat_stream(messages, model, **kwargs):
+    """chat_stream 的非同步版本，逐段產生文字；名額同樣持有到串流結束"""
+    async with admission.amodel_slot():
+        stream = await achat(messages, model, admitted=True, stream=True, **kwargs)
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            await stream.response.aclose()
+
+
+def pool_stats():
+    """連線池與呼叫次數統計"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['max_connections'] = MAX_CONNECTIONS
+    stats['max_keepalive_connections'] = MAX_KEEPALIVE_CONNECTIONS
+    for prefix, client in (('', _client), ('async_', _async_client)):
+        if client is None:
+            continue
+        try:
+            # httpx 未公開連線池狀態，讀取 httpcore 連線池的連線數
+            connections = client._client._transport._pool.connections
+            stats[f'{prefix}open_connections'] = len(connections)
+            stats[f'{prefix}idle_connections'] = sum(1 for c in connections if c.is_idle())
+        except AttributeError:
+            pass
+    return stats
@@ -0,0 +1,236 @@
+"""依床號索引的交接歷程
+
+報告生成後，從「病人編號：NNN」段落（沒有時改用原始轉錄中的「NNN爺爺」等稱呼）
+擷取床號與重點標記（NPO、壓傷、約束、血糖），寫入 patient_events 資料表；
+查詢某床的交接歷程只需一次以床號為前綴的索引查詢。
+
+重建索引（例如匯入舊記錄後）：
+    python patient_index.py reindex
+"""
+import re
+import sys
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patient_events (
+    bed TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    flags TEXT NOT NULL DEFAULT '',
+    excerpt TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (bed, timestamp, record_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_patient_events_record ON patient_events (record_id);
+"""
+
+# 重點標記與對應的關鍵字
+FLAG_KEYWORDS = {
+    'NPO': ('NPO', '禁食'),
+    '壓傷': ('壓傷', '壓瘡', '褥瘡'),
+    '約束': ('約束',),
+    '血糖': ('血糖',)
+}
+
+EXCERPT_CHARS = 80
+TIMELINE_LIMIT = 10
+
+# 報告中的床號標題，例如「**病人編號：052**」或「編號114病人」
+_REPORT_BED_PATTERN = re.compile(r'(?:病人編號|床號)\s*[：:]?\s*(\d{2,4})|編號\s*(\d{2,4})\s*病人')
+# 原始轉錄中的稱呼，例如「052爺爺」「162床」
+_RAW_BED_PATTERN = re.compile(r'(?<!\d)(\d{2,4})\s*(?=號床|床|爺爺|奶奶|阿公|阿嬤|阿伯|伯伯|阿姨)')
+# 已知床號後面若接這些字，通常是日期、時間或劑量而不是床號（例如「114年」）
+_NOT_BED_SUFFIX = r'(?![\d.]|\s*(?:年|月|號|日|點|分|次|cc|CC|ml|mg|公分|度|%))'
+_SECTION_PATTERN = re.compile(r'^\s*#')
+
+
+def detect_flags(text):
+    """回傳文字中出現的重點標記（依 FLAG_KEYWORDS 順序）"""
+    upper = (text or '').upper()
+    return [flag for flag, keywords in FLAG_KEYWORDS.items()
+            if any(keyword.upper() in upper for keyword in keywords)]
+
+
+def _report_sections(report):
+    """依床號將報告逐行分段，回傳 {床號: [段落, ...]}
+
+    遇到下一個床號或 ### 標題時結束目前段落；同一床可能在多個標題下出現。
+    """
+    sections = {}
+    current = None
+    for line in (report or '').splitlines():
+        match = _REPORT_BED_PATTERN.search(line)
+        if match:
+            current = match.group(1) or match.group(2)
+            sections.setdefault(current, []).append([line])
+        elif _SECTION_PATTERN.match(line):
+            current = None
+        elif current is not None:
+            sections[current][-1].append(line)
+    return {bed: ['\n'.join(lines) for lines in blocks] for bed, blocks in sections.items()}
+
+
+def _raw_sections(raw_text, known_beds=()):
+    """以床號切分原始轉錄：每個床號取到下一個床號出現前的文字
+
+    除了「052爺爺」這類稱呼，報告中已知的床號單獨出現時也視為切分點。
+    """
+    raw_text = raw_text or ''
+    positions = {match.start(): match.group(1) for match in _RAW_BED_PATTERN.finditer(raw_text)}
+    for bed in known_beds:
+        for match in re.finditer(rf'(?<!\d){bed}{_NOT_BED_SUFFIX}', raw_text):
+            positions.setdefault(match.start(), bed)
+
+    starts = sorted(positions)
+    sections = {}
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(raw_text)
+        sections.setdefault(positions[start], []).append(raw_text[start:end].strip())
+    return sections
+
+
+def _excerpt(text):
+    text = ' '.join(re.sub(r'[*#>`]|^\s*(?:-|\d+\.)', ' ', text, flags=re.M).split())
+    return text[:EXCERPT_CHARS] + ('…' if len(text) > EXCERPT_CHARS else '')
+
+
+def extract_patients(raw_text, formatted_report):
+    """擷取每一床的重點標記與摘要，回傳 {床號: {'flags': [...], 'excerpt': str}}"""
+    sections = _report_sections(formatted_report)
+    raw_sections = _raw_sections(raw_text, sections)
+    if not sections:
+        sections = raw_sections
+
+    patients = {}
+    for bed, blocks in sections.items():
+        # 報告可能省略口語中提到的細節，標記同時參考該床的原始轉錄
+        flags = detect_flags(' '.join(blocks + raw_sections.get(bed, [])))
+        patients[bed] = {'flags': flags, 'excerpt': _excerpt(blocks[0])}
+    return patients
+
+
+class PatientIndex:
+    """以床號為主鍵前綴的交接事件表，與 RecordStore 共用資料庫"""
+
+    def __init__(self, store):
+        self.store = store
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def conn(self):
+        conn = self.store.conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+        return conn
+
+    def _index_rows(self, conn, rows, replace=True):
+        count = 0
+        for record_id, timestamp, raw_transcription, formatted_report in rows:
+            if replace:
+                conn.execute('DELETE FROM patient_events WHERE record_id = ?', (record_id,))
+            patients = extract_patients(raw_transcription, formatted_report)
+            conn.executemany(
+                'INSERT OR REPLACE INTO patient_events (bed, timestamp, record_id, flags, excerpt) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(bed, timestamp, record_id, ','.join(info['flags']), info['excerpt'])
+                 for bed, info in patients.items()]
+            )
+            count += len(patients)
+        return count
+
+    def index_record(self, record_id, timestamp, raw_transcription, formatted_report):
+        """擷取單筆記錄中的床號並寫入索引，回傳擷取到的床數"""
+        with self.conn as conn:
+            return self._index_rows(conn, [(record_id, timestamp, raw_transcription, formatted_report)])
+
+    def reindex(self, batch_size=1000):
+        """重建所有記錄的床號索引（先清空，再每批一個交易寫入）"""
+        with self.conn as conn:
+            conn.execute('DELETE FROM patient_events')
+        total = 0
+        events = 0
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                'SELECT id, timestamp, raw_transcription, formatted_report FROM records '
+                'WHERE id > ? ORDER BY id LIMIT ?',
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            with self.conn as conn:
+                events += self._index_rows(conn, [tuple(row) for row in rows], replace=False)
+            last_id = rows[-1][0]
+            total += len(rows)
+        logger.info(f"床號索引重建完成，共 {total} 筆記錄、{events} 筆床號事件")
+        return total
+
+    def timeline(self, bed, limit=TIMELINE_LIMIT, flag=None, line_user_id=None):
+        """依時間由新到舊列出某床的交接事件；可只列出含特定標記或特定使用者的事件"""
+        params = [bed]
+        where = 'e.bed = ?'
+        if flag:
+            where += " AND (',' || e.flags || ',') LIKE ?"
+            params.append(f"%,{flag},%")
+        if line_user_id is not None:
+            where += ' AND r.line_user_id = ?'
+            params.append(line_user_id)
+        rows = self.conn.execute(
+            f"""
+            SELECT e.bed, e.timestamp, e.record_id, e.flags, e.excerpt, r.created_at
+            FROM patient_events e
+            JOIN records r ON r.id = e.record_id
+            WHERE {where}
+            ORDER BY e.timestamp DESC
+            LIMIT ?
+            """,
+            params + [limit]
+        ).fetchall()
+        return [
+            dict(row, flags=[flag for flag in row['flags'].split(',') if flag])
+            for row in rows
+        ]
+
+
+def format_timeline(bed, events):
+    """將交接歷程整理成文字訊息"""
+    if not events:
+        return f"{bed} 床目前沒有交接記錄"
+    lines = [f"{bed} 床交接歷程（最新 {len(events)} 筆）"]
+    for event in events:
+        flags = f"［{'、'.join(event['flags'])}］" if event['flags'] else ''
+        lines.append(f"• {event['created_at']} {flags}\n  {event['excerpt']}")
+    return "\n".join(lines)
+
+
+_BED_COMMAND_PATTERN = re.compile(r'^床號\s*(\d{2,4})(?:\s+(\S+))?$')
+
+
+def parse_bed_command(text):
+    """解析「床號 114 [標記]」，不是床號指令時回傳 None"""
+    match = _BED_COMMAND_PATTERN.match(text.strip())
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
+def main(argv):
+    from record_store import RecordStore
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(argv) < 2 or argv[1] != 'reindex':
+        print("用法：python patient_index.py reindex")
+        return 1
+    index = PatientIndex(RecordStore())
+    print(f"已重建 {index.reindex()} 筆記錄的床號索引")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
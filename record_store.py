@@ -0,0 +1,270 @@
+"""照護記錄儲存
+
+記錄的中繼資料與文字存放於 SQLite（WAL 模式），並依時間與 LINE 使用者建立索引；
+音訊依序附加到單一 append-only 檔案，資料表只記錄位移與長度。
+
+匯入舊的 records/YYYYMMDD/HHMMSS/ 資料夾：
+    python record_store.py migrate [records 目錄]
+"""
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import logging
+import threading
+import traceback
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能以執行緒鎖保護
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RECORDS_DIR = os.getenv('RECORDS_DIR', os.path.join(os.getcwd(), 'records'))
+# 記錄查詢範圍：user 只能查看與搜尋自己的記錄；ward 為全病房共用（交班時可查看其他護理師的記錄）
+RECORD_SCOPE = os.getenv('RECORD_SCOPE', 'user')
+DB_FILENAME = 'records.db'
+AUDIO_LOG_FILENAME = 'audio.blob'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    line_user_id TEXT,
+    raw_transcription TEXT NOT NULL DEFAULT '',
+    formatted_report TEXT NOT NULL DEFAULT '',
+    audio_offset INTEGER,
+    audio_length INTEGER,
+    audio_format TEXT,
+    audio_sha256 TEXT,
+    source TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records (timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_user_timestamp ON records (line_user_id, timestamp);
+"""
+
+RECORD_COLUMNS = (
+    'id', 'timestamp', 'created_at', 'line_user_id', 'raw_transcription',
+    'formatted_report', 'audio_offset', 'audio_length', 'audio_format',
+    'audio_sha256', 'source'
+)
+
+
+class AudioLog:
+    """append-only 音訊檔：每段音訊附加在檔尾，以 (位移, 長度) 讀取"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, source):
+        """附加音訊；source 可為 bytes、檔案路徑或具 reader() 的 SpooledAudio"""
+        with self._lock, open(self.path, 'ab') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                if isinstance(source, bytes):
+                    f.write(source)
+                elif isinstance(source, str):
+                    with open(source, 'rb') as audio_file:
+                        shutil.copyfileobj(audio_file, f)
+                else:
+                    shutil.copyfileobj(source.reader(), f)
+                f.flush()
+                os.fsync(f.fileno())
+                length = f.tell() - offset
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return offset, length
+
+    def read(self, offset, length):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+class RecordStore:
+    """照護記錄的 SQLite 儲存"""
+
+    def __init__(self, base_dir=RECORDS_DIR):
+        self.base_dir = base_dir
+        self.db_path = os.path.join(base_dir, DB_FILENAME)
+        self.audio_log = AudioLog(os.path.join(base_dir, AUDIO_LOG_FILENAME))
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def conn(self):
+        """每個執行緒使用自己的連線；第一次使用時才建立資料庫"""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(self.base_dir, exist_ok=True)
+                    with self._connect() as conn:
+                        conn.executescript(SCHEMA)
+                    self._initialized = True
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def add(self, log_data, audio=None, audio_format=None, source=None):
+        """新增一筆記錄並回傳 ID；音訊先附加到音訊檔，再寫入資料表"""
+        audio_offset = audio_length = audio_sha256 = None
+        if audio is not None:
+            audio_offset, audio_length = self.audio_log.append(audio)
+            audio_sha256 = getattr(audio, 'sha256', None)
+            audio_format = audio_format or getattr(audio, 'format', None)
+
+        with self.conn as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO records (
+                    timestamp, created_at, line_user_id, raw_transcription,
+                    formatted_report, audio_offset, audio_length, audio_format,
+                    audio_sha256, source
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    log_data['timestamp'],
+                    log_data['created_at'],
+                    log_data.get('line_user_id'),
+                    log_data.get('raw_transcription', ''),
+                    log_data.get('formatted_report', ''),
+                    audio_offset,
+                    audio_length,
+                    audio_format,
+                    audio_sha256,
+                    source
+                )
+            )
+        return cursor.lastrowid
+
+    def get(self, record_id):
+        row = self.conn.execute('SELECT * FROM records WHERE id = ?', (record_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _filters(self, since=None, until=None, line_user_id=None):
+        clauses = []
+        params = []
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since.strftime('%Y%m%d_%H%M%S'))
+        if until is not None:
+            clauses.append('timestamp < ?')
+            params.append(until.strftime('%Y%m%d_%H%M%S'))
+        if line_user_id is not None:
+            clauses.append('line_user_id = ?')
+            params.append(line_user_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    def list_records(self, since=None, until=None, line_user_id=None, limit=20, offset=0):
+        """依時間由新到舊列出記錄（使用時間與使用者索引）"""
+        where, params = self._filters(since, until, line_user_id)
+        rows = self.conn.execute(
+            f"SELECT * FROM records {where} ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, since=None, until=None, line_user_id=None):
+        where, params = self._filters(since, until, line_user_id)
+        return self.conn.execute(f"SELECT COUNT(*) FROM records {where}", params).fetchone()[0]
+
+    def read_audio(self, record_id):
+        record = self.get(record_id)
+        if record is None or record['audio_offset'] is None:
+            return None
+        return self.audio_log.read(record['audio_offset'], record['audio_length'])
+
+    def has_source(self, source):
+        row = self.conn.execute('SELECT 1 FROM records WHERE source = ?', (source,)).fetchone()
+        return row is not None
+
+
+def migrate_record_folders(store, records_dir=RECORDS_DIR):
+    """匯入舊格式 records/YYYYMMDD/HHMMSS/ 資料夾，已匯入的資料夾會略過"""
+    imported = 0
+    skipped = 0
+    for date_name in sorted(os.listdir(records_dir)):
+        date_folder = os.path.join(records_dir, date_name)
+        if not (os.path.isdir(date_folder) and date_name.isdigit() and len(date_name) == 8):
+            continue
+        for time_name in sorted(os.listdir(date_folder)):
+            record_folder = os.path.join(date_folder, time_name)
+            if not os.path.isdir(record_folder):
+                continue
+            source = f"folder:{date_name}/{time_name}"
+            if store.has_source(source):
+                skipped += 1
+                continue
+            try:
+                log_data = _read_record_folder(record_folder, date_name, time_name)
+                audio_path = next(
+                    (os.path.join(record_folder, name) for name in os.listdir(record_folder)
+                     if name.startswith('audio.')),
+                    None
+                )
+                audio_format = os.path.splitext(audio_path)[1].lstrip('.') if audio_path else None
+                store.add(log_data, audio=audio_path, audio_format=audio_format, source=source)
+                imported += 1
+            except Exception as e:
+                logger.error(f"匯入記錄失敗 {record_folder}: {str(e)}")
+                logger.error(traceback.format_exc())
+    logger.info(f"記錄匯入完成：新增 {imported} 筆，略過 {skipped} 筆")
+    return imported, skipped
+
+
+def _read_record_folder(record_folder, date_name, time_name):
+    """讀取舊格式資料夾；record.json 缺少時以 raw_text.txt 與 report.md 補齊"""
+    log_data = {}
+    record_path = os.path.join(record_folder, 'record.json')
+    if os.path.exists(record_path):
+        with open(record_path, 'r', encoding='utf-8') as f:
+            log_data = json.load(f)
+
+    for key, filename in (('raw_transcription', 'raw_text.txt'), ('formatted_report', 'report.md')):
+        path = os.path.join(record_folder, filename)
+        if key not in log_data and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                log_data[key] = f.read()
+
+    log_data.setdefault('timestamp', f"{date_name}_{time_name}")
+    log_data.setdefault(
+        'created_at',
+        datetime.strptime(log_data['timestamp'], '%Y%m%d_%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+    )
+    return log_data
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(argv) < 2 or argv[1] != 'migrate':
+        print("用法：python record_store.py migrate [records 目錄]")
+        return 1
+    records_dir = argv[2] if len(argv) > 2 else RECORDS_DIR
+    store = RecordStore(records_dir)
+    imported, skipped = migrate_record_folders(store, records_dir)
+    print(f"新增 {imported} 筆，略過 {skipped} 筆，共 {store.count()} 筆記錄")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,79 @@
+"""長錄音的管線化轉錄與報告
+
+切段、轉錄、摘要三個階段重疊進行：找到第一個切點就開始轉錄，
+每段轉錄一完成就交給摘要階段，不必等整段錄音掃描或全部片段轉錄完畢；
+所有摘要完成後再以合併提示整理成完整報告。
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from transcription import merge_transcripts
+
+logger = logging.getLogger(__name__)
+
+# 同時進行的片段摘要數
+SUMMARY_WORKERS = int(os.getenv('REPORT_SUMMARY_WORKERS', '4'))
+
+
+class PipelinedReporter:
+    """轉錄與片段摘要重疊進行，最後合併為一份報告
+
+    summarize_fn(index, text) 回傳單一片段的摘要；
+    merge_fn(summaries) 接收依時間排序的摘要並回傳完整報告。
+    """
+
+    def __init__(self, transcriber, summarize_fn, merge_fn, summary_workers=SUMMARY_WORKERS):
+        self.transcriber = transcriber
+        self.summarize_fn = summarize_fn
+        self.merge_fn = merge_fn
+        self.summary_workers = summary_workers
+
+    def run(self, audio):
+        """處理已載入的 AudioSegment，回傳 (完整轉錄, 報告, 各階段耗時)"""
+        started = time.perf_counter()
+        first_segment_at = None
+        futures = []
+        with ThreadPoolExecutor(self.transcriber.max_workers, thread_name_prefix='transcribe') as transcribe_pool, \
+                ThreadPoolExecutor(self.summary_workers, thread_name_prefix='summarize') as summary_pool:
+            # 子執行緒中的 Whisper 與摘要 span 接續呼叫端的 trace
+            summarize_fn = tracing.bind(self.summarize_fn)
+
+            @tracing.bind
+            def transcribe_and_summarize(index, start, end):
+                # 轉錄完成立即送出摘要，較早完成的片段不必等待其他片段
+                text = self.transcriber.transcribe_segment(audio, index, start, end)
+                return text, summary_pool.submit(summarize_fn, index, text)
+
+            for index, (start, end) in enumerate(self.transcriber.iter_segments(audio)):
+                if first_segment_at is None:
+                    first_segment_at = time.perf_counter()
+                futures.append(transcribe_pool.submit(transcribe_and_summarize, index, start, end))
+            split_at = time.perf_counter()
+            logger.info(f"音訊長度 {len(audio) / 1000:.1f} 秒，切為 {len(futures)} 段，轉錄與摘要同時進行")
+
+            results = [future.result() for future in futures]
+            transcribed_at = time.perf_counter()
+
+            summaries = [summary_future.result() for _, summary_future in results]
+            summarized_at = time.perf_counter()
+
+        report = self.merge_fn(summaries)
+        finished = time.perf_counter()
+
+        timings = {
+            'segments': len(futures),
+            'first_segment': first_segment_at - started,
+            'split': split_at - started,
+            'transcribe': transcribed_at - started,
+            'summarize_tail': summarized_at - transcribed_at,
+            'merge': finished - summarized_at,
+            'total': finished - started
+        }
+        logger.info(
+            f"管線處理完成：{timings['first_segment']:.1f} 秒開始轉錄，{timings['transcribe']:.1f} 秒轉錄完成，"
+            f"最後摘要 {timings['summarize_tail']:.1f} 秒，合併 {timings['merge']:.1f} 秒"
+        )
+        return merge_transcripts([text for text, _ in results]), report, timings
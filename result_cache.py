@@ -0,0 +1,177 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 快取設定
+CACHE_TTL = int(os.getenv('CACHE_TTL', str(7 * 24 * 3600)))
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.getcwd(), '.cache', 'results'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+REDIS_PREFIX = 'care_sch:cache:'
+REDIS_RETRY_INTERVAL = 30  # Redis 失敗後暫停使用的秒數
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """計算檔案的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcription_key(audio_sha256, model, language):
+    """轉錄結果的快取鍵：音訊內容 + 模型 + 語言"""
+    return 'transcription:' + hashlib.sha256(
+        f"{audio_sha256}:{model}:{language}".encode('utf-8')
+    ).hexdigest()
+
+
+def report_key(text, model, prompt):
+    """報告結果的快取鍵：轉錄文字 + 模型 + 提示詞"""
+    return 'report:' + hashlib.sha256(
+        f"{model}\0{prompt}\0{text}".encode('utf-8')
+    ).hexdigest()
+
+
+class DiskLRUCache:
+    """以檔案修改時間實作 LRU 的磁碟快取，總大小超過上限時淘汰最久未使用的項目"""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None  # 第一次寫入時才掃描目錄
+
+    def _ensure_directory(self):
+        if self._total_bytes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace(':', '_'))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+            os.utime(path)  # 更新存取時間
+            return value
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        data = value.encode('utf-8')
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._ensure_directory()
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+        logger.info(f"磁碟快取已淘汰舊項目，目前大小 {total} bytes")
+
+
+class ResultCache:
+    """轉錄與報告結果快取：優先使用 Redis（含 TTL），不可用時改用磁碟 LRU"""
+
+    def __init__(self, redis_client=None, ttl=CACHE_TTL, disk=None):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.disk = disk or DiskLRUCache()
+        self._redis_retry_at = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _redis_available(self):
+        return self.redis is not None and time.time() >= self._redis_retry_at
+
+    def _redis_failed(self, e):
+        logger.warning(f"Redis 快取暫時無法使用，改用磁碟快取: {str(e)}")
+        self._redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+
+    def _count(self, key, outcome):
+        namespace = key.split(':', 1)[0]
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+            stats[outcome] += 1
+
+    def get(self, key):
+        value = None
+        if self._redis_available():
+            try:
+                value = self.redis.get(REDIS_PREFIX + key)
+                if value is not None:
+                    value = value.decode('utf-8')
+            except Exception as e:
+                self._redis_failed(e)
+                value = self.disk.get(key)
+        else:
+            value = self.disk.get(key)
+
+        self._count(key, 'hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        if self._redis_available():
+            try:
+                self.redis.setex(REDIS_PREFIX + key, self.ttl, value)
+                return
+            except Exception as e:
+                self._redis_failed(e)
+        try:
+            self.disk.set(key, value)
+        except Exception as e:
+            logger.error(f"寫入磁碟快取失敗: {str(e)}")
+
+    def get_or_compute(self, key, compute):
+        """有快取時直接回傳，否則執行 compute 並寫入快取"""
+        value = self.get(key)
+        if value is not None:
+            logger.info(f"快取命中: {key[:40]}")
+            return value
+        value = compute()
+        if value:
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        for values in stats.values():
+            total = values['hits'] + values['misses']
+            values['hit_rate'] = round(values['hits'] / total, 3) if total else 0.0
+        stats['backend'] = 'redis' if self._redis_available() else 'disk'
+        return stats
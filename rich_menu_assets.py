@@ -0,0 +1,168 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# 圖片尺寸與版面
+MENU_WIDTH = 2500
+MENU_HEIGHT = 1686
+BUTTON_RADIUS = 300
+FONT_SIZE = 100
+FONT_CANDIDATES = ["simsun.ttc", "NotoSansCJK-Regular.ttc"]
+OUTLINE_WIDTH = 4
+OUTLINE_COLOR = '#000000'
+TEXT_COLOR = '#FFFFFF'
+BACKGROUND_COLOR = '#FFFFFF'
+
+# 繪圖方式變更時遞增，讓舊的快取失效
+RENDER_VERSION = 1
+
+CACHE_DIR = os.path.join('static', 'images', 'cache')
+
+# 主選單按鈕
+MAIN_MENU_BUTTONS = [
+    {'text': '使用說明', 'color': '#FF6B6B'},  # 溫暖的紅色
+    {'text': '上傳資料', 'color': '#4ECDC4'},  # 清新的藍綠色
+    {'text': '查看記錄', 'color': '#45B7D1'},  # 天空藍
+    {'text': '文字記錄', 'color': '#96CEB4'},  # 薄荷綠
+    {'text': '語音記錄', 'color': '#FF8B94'},  # 粉紅色
+    {'text': '設定', 'color': '#7C8DA5'}       # 灰藍色
+]
+
+# 查看記錄選單按鈕
+VIEW_RECORDS_MENU_BUTTONS = [
+    {'text': '今日記錄', 'color': '#4ECDC4'},    # 青綠色
+    {'text': '本週記錄', 'color': '#45B7D1'},    # 天空藍
+    {'text': '搜尋記錄', 'color': '#96CEB4'},    # 薄荷綠
+    {'text': '全部記錄', 'color': '#FF8B94'},    # 粉紅色
+    {'text': '返回主選單', 'color': '#7C8DA5'},  # 灰藍色
+    {'text': '新增記錄', 'color': '#FF6B6B'}     # 溫暖的紅色
+]
+
+
+@lru_cache(maxsize=None)
+def load_font(size=FONT_SIZE):
+    """載入字型（每個程序只載入一次）"""
+    from PIL import ImageFont
+
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    logger.warning("找不到中文字型，使用預設字型")
+    return ImageFont.load_default()
+
+
+def layout_hash(buttons):
+    """以按鈕、顏色、字型與版面參數計算版面的雜湊值"""
+    layout = {
+        'buttons': buttons,
+        'size': [MENU_WIDTH, MENU_HEIGHT],
+        'radius': BUTTON_RADIUS,
+        'font': [FONT_CANDIDATES, FONT_SIZE],
+        'outline': [OUTLINE_WIDTH, OUTLINE_COLOR, TEXT_COLOR],
+        'version': RENDER_VERSION
+    }
+    encoded = json.dumps(layout, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def render_menu_image(buttons):
+    """繪製 2x3 圓形按鈕的 Rich Menu 圖片，回傳 PNG bytes"""
+    import io
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (MENU_WIDTH, MENU_HEIGHT), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+    font = load_font()
+
+    for i, button in enumerate(buttons):
+        row = i // 3
+        col = i % 3
+
+        center_x = 416 + (col * 833)
+        center_y = 421 + (row * 843)
+
+        # 繪製主圓形
+        draw.ellipse([
+            center_x - BUTTON_RADIUS,
+            center_y - BUTTON_RADIUS,
+            center_x + BUTTON_RADIUS,
+            center_y + BUTTON_RADIUS
+        ], fill=button['color'])
+
+        # 繪製含外框的文字（文字位置略為上移）
+        text = button['text']
+        text_bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        draw.text(
+            (center_x - text_width / 2, center_y - 30),
+            text,
+            font=font,
+            fill=TEXT_COLOR,
+            stroke_width=OUTLINE_WIDTH,
+            stroke_fill=OUTLINE_COLOR
+        )
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class RichMenuImageCache:
+    """Rich Menu 圖片快取：同一版面只繪製一次，結果保存在記憶體與磁碟"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f"rich_menu_{digest}.png")
+
+    def get_path(self, buttons):
+        """取得版面圖片的檔案路徑，必要時才繪製"""
+        digest = layout_hash(buttons)
+        path = self._path(digest)
+        with self._lock:
+            if digest in self._images or os.path.exists(path):
+                return path
+            self._render(digest, buttons)
+        return path
+
+    def get_png(self, buttons):
+        """取得版面圖片的 PNG bytes"""
+        digest = layout_hash(buttons)
+        with self._lock:
+            data = self._images.get(digest)
+            if data is not None:
+                return data
+            path = self._path(digest)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self._images[digest] = data
+                return data
+            return self._render(digest, buttons)
+
+    def _render(self, digest, buttons):
+        logger.info(f"開始生成 Rich Menu 圖片: {digest}")
+        data = render_menu_image(buttons)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._images[digest] = data
+        logger.info(f"Rich Menu 圖片已生成: {path}")
+        return data
+
+
+# 程序共用的圖片快取
+image_cache = RichMenuImageCache()
@@ -0,0 +1,293 @@
+"""Rich Menu 註冊表
+
+部署時建立一次主選單與查看記錄選單，將 ID 存入 Redis 並設定預設選單；
+回覆訊息時只查詢快取，不再每位使用者重新建立選單。
+
+部署時執行（railway.toml 的 preDeployCommand）：
+    python rich_menu_registry.py provision
+未執行部署步驟時，第一次需要選單時才建立。
+"""
+import os
+import sys
+import logging
+import threading
+from collections import OrderedDict
+
+from linebot.models import (
+    RichMenu, RichMenuArea, RichMenuBounds, RichMenuSize, MessageAction
+)
+
+from rich_menu_assets import image_cache, MAIN_MENU_BUTTONS, VIEW_RECORDS_MENU_BUTTONS
+
+logger = logging.getLogger(__name__)
+
+MENU_MAIN = 'main'
+MENU_VIEW_RECORDS = 'view_records'
+
+REDIS_MENUS_KEY = 'care_sch:rich_menus'
+REDIS_LINKS_KEY = 'care_sch:rich_menu_links'
+LOCAL_LINKS_MAX = 10000
+
+# 2x3 按鈕的點擊區域
+AREA_BOUNDS = [
+    RichMenuBounds(x=0, y=0, width=833, height=843),
+    RichMenuBounds(x=833, y=0, width=833, height=843),
+    RichMenuBounds(x=1666, y=0, width=834, height=843),
+    RichMenuBounds(x=0, y=843, width=833, height=843),
+    RichMenuBounds(x=833, y=843, width=833, height=843),
+    RichMenuBounds(x=1666, y=843, width=834, height=843)
+]
+
+# 選單定義：名稱、聊天列文字、(按鈕標籤, 送出文字)、圖片按鈕
+MENU_DEFINITIONS = {
+    MENU_MAIN: {
+        'name': '主選單',
+        'chat_bar_text': '開啟選單',
+        'actions': [
+            ('使用說明', '使用說明'),
+            ('上傳資料', '上傳資料'),
+            ('查看記錄', '查看記錄'),
+            ('文字記錄', '文字記錄'),
+            ('語音記錄', '語音記錄'),
+            ('設定', '設定')
+        ],
+        'buttons': MAIN_MENU_BUTTONS
+    },
+    MENU_VIEW_RECORDS: {
+        'name': '查看記錄選單',
+        'chat_bar_text': '查看記錄選單',
+        'actions': [
+            ('今日記錄', '查看今日記錄'),
+            ('本週記錄', '查看本週記錄'),
+            ('搜尋記錄', '搜尋記錄'),
+            ('全部記錄', '查看全部記錄'),
+            ('返回主選單', '返回主選單'),
+            ('新增記錄', '文字記錄')
+        ],
+        'buttons': VIEW_RECORDS_MENU_BUTTONS
+    }
+}
+
+
+def build_rich_menu(key):
+    """依選單定義建立 RichMenu 物件"""
+    definition = MENU_DEFINITIONS[key]
+    return RichMenu(
+        size=RichMenuSize(width=2500, height=1686),
+        selected=True,
+        name=definition['name'],
+        chat_bar_text=definition['chat_bar_text'],
+        areas=[
+            RichMenuArea(bounds=bounds, action=MessageAction(label=label, text=text))
+            for bounds, (label, text) in zip(AREA_BOUNDS, definition['actions'])
+        ]
+    )
+
+
+class RichMenuRegistry:
+    """管理已建立的 Rich Menu ID 與使用者連結狀態"""
+
+    def __init__(self, line_bot_api, redis_client=None):
+        self.line_bot_api = line_bot_api
+        self.redis = redis_client
+        self._menu_ids = {}
+        self._links = OrderedDict()
+        self._links_lock = threading.Lock()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _redis_call(self, method, *args):
+        if self.redis is None:
+            return None
+        try:
+            return getattr(self.redis, method)(*args)
+        except Exception as e:
+            logger.warning(f"Rich Menu 註冊表無法存取 Redis: {str(e)}")
+            return None
+
+    def _load(self):
+        """每個程序載入一次選單 ID：先查 Redis，沒有時依名稱比對現有選單"""
+        if self._loaded:
+            return
+        stored = self._redis_call('hgetall', REDIS_MENUS_KEY) or {}
+        for key, menu_id in stored.items():
+            if isinstance(key, bytes):
+                key, menu_id = key.decode('utf-8'), menu_id.decode('utf-8')
+            self._menu_ids[key] = menu_id
+
+        if len(self._menu_ids) < len(MENU_DEFINITIONS):
+            names = {definition['name']: key for key, definition in MENU_DEFINITIONS.items()}
+            for menu in self.line_bot_api.get_rich_menu_list():
+                key = names.get(menu.name)
+                if key and key not in self._menu_ids:
+                    self._menu_ids[key] = menu.rich_menu_id
+        self._loaded = True
+
+    def _store(self, key, menu_id):
+        self._menu_ids[key] = menu_id
+        self._redis_call('hset', REDIS_MENUS_KEY, key, menu_id)
+
+    def create_menu(self, key):
+        """在 LINE 建立選單並上傳快取的圖片"""
+        definition = MENU_DEFINITIONS[key]
+        menu_id = self.line_bot_api.create_rich_menu(rich_menu=build_rich_menu(key))
+        self.line_bot_api.set_rich_menu_image(
+            menu_id, "image/png", image_cache.get_png(definition['buttons'])
+        )
+        logger.info(f"已建立 Rich Menu {key}: {menu_id}")
+        return menu_id
+
+    def provision(self):
+        """部署時執行：確保所有選單都存在，並將主選單設為預設"""
+        with self._lock:
+            self._load()
+            existing = {menu.rich_menu_id for menu in self.line_bot_api.get_rich_menu_list()}
+            recreated = []
+            for key in MENU_DEFINITIONS:
+                menu_id = self._menu_ids.get(key)
+                if menu_id in existing:
+                    self._store(key, menu_id)
+                    continue
+                self._store(key, self.create_menu(key))
+                recreated.append(key)
+            self.line_bot_api.set_default_rich_menu(self._menu_ids[MENU_MAIN])
+            # 只有重新建立的選單，其使用者連結狀態才對應到舊選單
+            self._forget_links(recreated)
+        logger.info(f"Rich Menu 已就緒: {self._menu_ids}（重新建立: {recreated}）")
+        return dict(self._menu_ids)
+
+    def prune(self):
+        """刪除不在註冊表中的舊選單（清理過去每位使用者重複建立的選單）"""
+        with self._lock:
+            self._load()
+            keep = set(self._menu_ids.values())
+            deleted = []
+            for menu in self.line_bot_api.get_rich_menu_list():
+                if menu.rich_menu_id not in keep:
+                    self.line_bot_api.delete_rich_menu(menu.rich_menu_id)
+                    deleted.append(menu.rich_menu_id)
+        logger.info(f"已刪除 {len(deleted)} 個未使用的 Rich Menu")
+        return deleted
+
+    def menu_id(self, key):
+        with self._lock:
+            self._load()
+            return self._menu_ids.get(key)
+
+    def ensure_menu(self, key):
+        """回傳選單 ID；尚未建立時（部署時未執行 provision）才建立，主選單同時設為預設"""
+        with self._lock:
+            self._load()
+            menu_id = self._menu_ids.get(key)
+            if menu_id is None:
+                logger.warning(f"Rich Menu {key} 尚未建立，改於首次使用時建立")
+                menu_id = self.create_menu(key)
+                self._store(key, menu_id)
+                if key == MENU_MAIN:
+                    self.line_bot_api.set_default_rich_menu(menu_id)
+            return menu_id
+
+    def _forget_links(self, keys):
+        """清除連結到指定選單的使用者狀態，下次切換時重新連結"""
+        if not keys:
+            return
+        keys = set(keys)
+        with self._links_lock:
+            for user_id in [u for u, key in self._links.items() if key in keys]:
+                del self._links[user_id]
+        if self.redis is None:
+            return
+        try:
+            stale = []
+            for user_id, key in self.redis.hscan_iter(REDIS_LINKS_KEY, count=1000):
+                if isinstance(key, bytes):
+                    key = key.decode('utf-8')
+                if key in keys:
+                    stale.append(user_id)
+            for i in range(0, len(stale), 1000):
+                self.redis.hdel(REDIS_LINKS_KEY, *stale[i:i + 1000])
+            logger.info(f"已清除 {len(stale)} 筆舊選單的使用者連結狀態")
+        except Exception as e:
+            logger.warning(f"Rich Menu 註冊表無法存取 Redis: {str(e)}")
+
+    def _linked_menu(self, user_id):
+        # 多個程序共用 Redis 中的連結狀態，本機快取只在 Redis 無法使用時參考
+        if self.redis is not None:
+            try:
+                value = self.redis.hget(REDIS_LINKS_KEY, user_id)
+                if isinstance(value, bytes):
+                    value = value.decode('utf-8')
+                # 未曾連結的使用者看到的是預設選單（主選單）
+                return value or MENU_MAIN
+            except Exception as e:
+                logger.warning(f"Rich Menu 註冊表無法存取 Redis: {str(e)}")
+        with self._links_lock:
+            return self._links.get(user_id, MENU_MAIN)
+
+    def _remember_link(self, user_id, key):
+        with self._links_lock:
+            self._links[user_id] = key
+            self._links.move_to_end(user_id)
+            while len(self._links) > LOCAL_LINKS_MAX:
+                self._links.popitem(last=False)
+        self._redis_call('hset', REDIS_LINKS_KEY, user_id, key)
+
+    def link(self, user_id, key):
+        """切換使用者的選單；狀態已相同時不呼叫 LINE API"""
+        if self._linked_menu(user_id) == key:
+            return False
+
+        menu_id = self.ensure_menu(key)
+        if key == MENU_MAIN:
+            # 主選單即預設選單，解除個別連結即可
+            self.line_bot_api.unlink_rich_menu_from_user(user_id)
+        else:
+            self.line_bot_api.link_rich_menu_to_user(user_id, menu_id)
+
+        self._remember_link(user_id, key)
+        return True
+
+    def status(self):
+        """列出註冊表與 LINE 上的選單狀態"""
+        return {
+            'registered': dict(self._menu_ids) if self._loaded else None,
+            'on_line': [menu.rich_menu_id for menu in self.line_bot_api.get_rich_menu_list()],
+            'default': self.line_bot_api.get_default_rich_menu()
+        }
+
+
+def main(argv):
+    import redis
+    from dotenv import load_dotenv
+    from linebot import LineBotApi
+
+    load_dotenv()
+    # 於載入 .env 後才匯入，LINE API 位址設定才會生效
+    from clients import LINE_API_ENDPOINT, LINE_API_DATA_ENDPOINT
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    registry = RichMenuRegistry(
+        LineBotApi(
+            os.getenv('LINE_CHANNEL_ACCESS_TOKEN'),
+            endpoint=LINE_API_ENDPOINT,
+            data_endpoint=LINE_API_DATA_ENDPOINT
+        ),
+        redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+    )
+
+    command = argv[1] if len(argv) > 1 else 'provision'
+    if command == 'provision':
+        registry.provision()
+    elif command == 'prune':
+        registry.prune()
+    elif command == 'status':
+        registry.menu_id(MENU_MAIN)
+        print(registry.status())
+    else:
+        print("用法：python rich_menu_registry.py [provision|prune|status]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
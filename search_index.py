@@ -0,0 +1,280 @@
+"""照護記錄全文搜尋
+
+在記錄資料庫中維護倒排索引：繁體中文以字元二元組（bigram）切詞，英數字以整詞切詞，
+每次保存記錄時增量更新，查詢時以 BM25 排序並分頁。
+
+重建索引（例如匯入舊記錄後）：
+    python search_index.py reindex
+"""
+import re
+import sys
+import math
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_postings (
+    term TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, record_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_search_postings_record ON search_postings (record_id);
+CREATE TABLE IF NOT EXISTS search_docs (
+    record_id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+"""
+
+# BM25 參數
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+PAGE_SIZE = 5
+SNIPPET_CHARS = 30
+
+_CJK = r'㐀-䶿一-鿿豈-﫿'
+_TOKEN_PATTERN = re.compile(rf'[{_CJK}]+|[A-Za-z]+|\d+')
+_CJK_PATTERN = re.compile(rf'[{_CJK}]')
+
+
+def tokenize(text):
+    """中文連續字元切成二元組（單字則保留單字），英文轉小寫整詞，數字整串保留"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text or ''):
+        run = match.group()
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def make_snippet(text, query, width=SNIPPET_CHARS):
+    """擷取第一個命中關鍵字附近的文字"""
+    text = ' '.join((text or '').split())
+    position = -1
+    for term in [query] + tokenize(query):
+        position = text.lower().find(term.lower())
+        if position >= 0:
+            break
+    if position < 0:
+        return text[:width * 2]
+    start = max(0, position - width)
+    end = min(len(text), position + width)
+    return ('…' if start > 0 else '') + text[start:end] + ('…' if end < len(text) else '')
+
+
+class SearchIndex:
+    """以 SQLite 資料表實作的倒排索引，與 RecordStore 共用資料庫"""
+
+    def __init__(self, store):
+        self.store = store
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def conn(self):
+        conn = self.store.conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+        return conn
+
+    def _index_rows(self, conn, rows, replace=True):
+        for record_id, raw_transcription, formatted_report in rows:
+            counts = Counter(tokenize(raw_transcription) + tokenize(formatted_report))
+            if replace:
+                conn.execute('DELETE FROM search_postings WHERE record_id = ?', (record_id,))
+            conn.executemany(
+                'INSERT INTO search_postings (term, record_id, tf) VALUES (?, ?, ?)',
+                [(term, record_id, tf) for term, tf in counts.items()]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO search_docs (record_id, length) VALUES (?, ?)',
+                (record_id, sum(counts.values()))
+            )
+
+    def index_record(self, record_id, raw_transcription, formatted_report):
+        """增量更新單筆記錄的索引"""
+        with self.conn as conn:
+            self._index_rows(conn, [(record_id, raw_transcription, formatted_report)])
+
+    def reindex(self, batch_size=1000):
+        """重建所有記錄的索引（先清空，再每批一個交易寫入）"""
+        with self.conn as conn:
+            conn.execute('DELETE FROM search_postings')
+            conn.execute('DELETE FROM search_docs')
+        total = 0
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                'SELECT id, raw_transcription, formatted_report FROM records WHERE id > ? ORDER BY id LIMIT ?',
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            with self.conn as conn:
+                self._index_rows(conn, [tuple(row) for row in rows], replace=False)
+            last_id = rows[-1][0]
+            total += len(rows)
+        logger.info(f"搜尋索引重建完成，共 {total} 筆記錄")
+        return total
+
+    def search(self, query, page=1, page_size=PAGE_SIZE, line_user_id=None):
+        """以 BM25 排序搜尋，回傳 (該頁記錄, 總筆數)
+
+        計分與排序都在 SQLite 內完成，Python 只取回當頁的記錄。
+        指定 line_user_id 時只搜尋該使用者的記錄（詞頻統計仍以全部記錄計算）。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+
+        conn = self.conn
+        doc_count, avg_length = conn.execute(
+            'SELECT COUNT(*), AVG(length) FROM search_docs'
+        ).fetchone()
+        if not doc_count:
+            return [], 0
+
+        placeholders = ','.join('?' * len(terms))
+        document_frequency = dict(conn.execute(
+            f"SELECT term, COUNT(*) FROM search_postings WHERE term IN ({placeholders}) GROUP BY term",
+            terms
+        ).fetchall())
+        terms = [term for term in terms if term in document_frequency]
+        if not terms:
+            return [], 0
+
+        idf_case = ' '.join('WHEN ? THEN ?' for _ in terms)
+        idf_params = []
+        for term in terms:
+            df = document_frequency[term]
+            idf_params += [term, math.log(1 + (doc_count - df + 0.5) / (df + 0.5))]
+
+        placeholders = ','.join('?' * len(terms))
+        owner_join, owner_clause, owner_params = '', '', []
+        if line_user_id is not None:
+            owner_join = 'JOIN records r ON r.id = p.record_id'
+            owner_clause = 'AND r.line_user_id = ?'
+            owner_params = [line_user_id]
+        total = conn.execute(
+            f"""
+            SELECT COUNT(DISTINCT p.record_id) FROM search_postings p {owner_join}
+            WHERE p.term IN ({placeholders}) {owner_clause}
+            """,
+            terms + owner_params
+        ).fetchone()[0]
+        if not total:
+            return [], 0
+
+        # 所有詞都命中的記錄優先，其次依分數與新舊排序
+        rows = conn.execute(
+            f"""
+            SELECT p.record_id,
+                   COUNT(*) AS matched,
+                   SUM((CASE p.term {idf_case} END) * p.tf * ? /
+                       (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score
+            FROM search_postings p
+            JOIN search_docs d ON d.record_id = p.record_id
+            {owner_join}
+            WHERE p.term IN ({placeholders}) {owner_clause}
+            GROUP BY p.record_id
+            ORDER BY matched DESC, score DESC, p.record_id DESC
+            LIMIT ? OFFSET ?
+            """,
+            idf_params + [BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, avg_length]
+            + terms + owner_params + [page_size, (page - 1) * page_size]
+        ).fetchall()
+
+        results = []
+        for record_id, _, score in rows:
+            record = self.store.get(record_id)
+            if record is None:
+                continue
+            record['score'] = round(score, 3)
+            record['snippet'] = make_snippet(
+                record['formatted_report'] + ' ' + record['raw_transcription'], query
+            )
+            results.append(record)
+        return results, total
+
+
+def results_to_flex(query, results, page, total, page_size=PAGE_SIZE):
+    """將搜尋結果轉為 LINE Flex Message 的 carousel 內容"""
+    total_pages = max(1, math.ceil(total / page_size))
+    bubbles = []
+    for record in results:
+        bubbles.append({
+            'type': 'bubble',
+            'size': 'kilo',
+            'body': {
+                'type': 'box',
+                'layout': 'vertical',
+                'spacing': 'sm',
+                'contents': [
+                    {'type': 'text', 'text': record['created_at'], 'weight': 'bold', 'size': 'sm'},
+                    {'type': 'text', 'text': record['snippet'] or '（無內容）', 'wrap': True, 'size': 'sm'}
+                ]
+            }
+        })
+
+    if page < total_pages:
+        bubbles.append({
+            'type': 'bubble',
+            'size': 'kilo',
+            'body': {
+                'type': 'box',
+                'layout': 'vertical',
+                'contents': [
+                    {'type': 'text', 'text': f"第 {page} / {total_pages} 頁，共 {total} 筆", 'wrap': True},
+                    {
+                        'type': 'button',
+                        'style': 'primary',
+                        'action': {
+                            'type': 'message',
+                            'label': '下一頁',
+                            'text': f"搜尋 {query} 第{page + 1}頁"
+                        }
+                    }
+                ]
+            }
+        })
+
+    return {'type': 'carousel', 'contents': bubbles}
+
+
+_QUERY_PATTERN = re.compile(r'^搜尋\s+(.+?)(?:\s+第(\d+)頁)?$')
+
+
+def parse_search_command(text):
+    """解析「搜尋 關鍵字 [第N頁]」，不是搜尋指令時回傳 None"""
+    match = _QUERY_PATTERN.match(text.strip())
+    if not match:
+        return None
+    return match.group(1).strip(), int(match.group(2) or 1)
+
+
+def main(argv):
+    from record_store import RecordStore
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(argv) < 2 or argv[1] != 'reindex':
+        print("用法：python search_index.py reindex")
+        return 1
+    index = SearchIndex(RecordStore())
+    print(f"已重建 {index.reindex()} 筆記錄的索引")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
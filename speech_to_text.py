@@ -1,33 +1,34 @@
-import speech_recognition as sr
 from pydub import AudioSegment
 import os
 import time
 import sys
+import glob
+import argparse
 from datetime import datetime
-from openai import OpenAI
-import httpx
 import threading
 import itertools
 from dotenv import load_dotenv
+# 使用共用的 OpenAI 客戶端（連線池、逾時與重試設定統一管理）
+import openai_client
+from openai_client import get_openai_client
+from audio_normalize import probe_duration_ms
+from transcription import MAX_SEGMENT_MS
+from vad import VAD_ENABLED, trim_silence, totals as vad_totals
+from report_pipeline import PipelinedReporter
+from workspace import JobWorkspace
+from result_cache import file_sha256, transcription_key, report_key
+# 轉錄設定、切段轉錄器與結果快取與 LINE Bot、網頁版共用
+import whisper_service
+from whisper_service import WHISPER_MODEL, WHISPER_LANGUAGE, transcriber, result_cache
 
 # 載入環境變數
 load_dotenv()
 
-# 使用環境變數
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-# 初始化 OpenAI 客戶端
-client = OpenAI(
-    api_key=openai.api_key,
-    http_client=httpx.Client(
-        timeout=httpx.Timeout(300.0, connect=60.0),  # 增加超時時間到 300 秒
-        follow_redirects=True,
-        transport=httpx.HTTPTransport(retries=3)  # 使用正確的重試機制
-    )
-)
-
 # 進度動畫類
 class ProgressAnimation:
+    # 批次模式同時處理多個檔案時關閉動畫，避免輸出交錯
+    enabled = True
+
     def __init__(self, description="處理中"):
         self.description = description
         self.done = False
@@ -42,6 +43,8 @@ class ProgressAnimation:
         sys.stdout.flush()
 
     def start(self):
+        if not ProgressAnimation.enabled:
+            return
         self.thread = threading.Thread(target=self.animate)
         self.thread.start()
 
@@ -63,7 +66,7 @@ def check_dependencies():
         print("FFmpeg 檢查通過")
         
         # 檢查 OpenAI API Key
-        if not client.api_key:
+        if not get_openai_client().api_key:
             print("錯誤：找不到 OpenAI API Key")
             return False
         print("OpenAI API Key 檢查通過")
@@ -73,82 +76,25 @@ def check_dependencies():
         print(f"環境檢查時發生錯誤：{str(e)}")
         return False
 
-def convert_m4a_to_wav(m4a_path):
-    print("\n=== 開始進行音訊檔案轉換 ===")
-    print(f"原始檔案：{m4a_path}")
-    
-    # 檢查檔案是否存在
-    if not os.path.exists(m4a_path):
-        raise FileNotFoundError(f"找不到音訊檔案：{m4a_path}")
-    
+def transcribe_with_whisper(audio_path, workspace=None):
+    """使用 OpenAI Whisper 模型進行語音辨識（顯示進度動畫）"""
     try:
-        progress = ProgressAnimation("正在讀取音訊檔案")
+        progress = ProgressAnimation("正在使用 OpenAI Whisper 進行語音辨識")
         progress.start()
         
-        # 讀取M4A檔案
-        audio = AudioSegment.from_file(m4a_path, format="m4a")
+        text = whisper_service.transcribe_with_whisper(audio_path, workspace)
         
         progress.stop()
-        print(f"\n音訊檔案資訊：")
-        duration_seconds = len(audio) / 1000
-        print(f"- 時長：{duration_seconds:.2f} 秒")
-        print(f"- 聲道數：{audio.channels}")
-        print(f"- 取樣率：{audio.frame_rate} Hz")
-        
-        # 轉換為WAV格式
-        progress = ProgressAnimation("正在轉換為WAV格式")
-        progress.start()
-        
-        wav_path = "temp_audio.wav"
-        audio.export(wav_path, format="wav")
-        
-        progress.stop()
-        print(f"\nWAV檔案已儲存至：{wav_path}")
-        
-        return wav_path
-        
-    except Exception as e:
-        if 'progress' in locals():
-            progress.stop()
-        print(f"\n音訊轉換過程中發生錯誤：{str(e)}")
-        print("可能原因：")
-        print("1. FFmpeg 未正確安裝")
-        print("2. 音訊檔案格式不正確或已損壞")
-        print("3. 系統權限不足")
-        raise
-
-def transcribe_with_whisper(audio_path):
-    """使用 OpenAI Whisper 模型進行語音辨識"""
-    try:
-        with open(audio_path, "rb") as audio_file:
-            progress = ProgressAnimation("正在使用 OpenAI Whisper 進行語音辨識")
-            progress.start()
-            
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="zh"
-            )
-            
-            progress.stop()
-            return response.text
+        return text
     except Exception as e:
         if 'progress' in locals():
             progress.stop()
         print(f"\nWhisper 辨識錯誤：{str(e)}")
         raise
 
-def generate_care_report(transcribed_text):
-    """使用 OpenAI 生成照護報告"""
-    max_retries = 3
-    retry_delay = 5  # 重試延遲時間（秒）
-    
-    for attempt in range(max_retries):
-        try:
-            progress = ProgressAnimation("正在生成照護報告")
-            progress.start()
-            
-            prompt = f"""
+CARE_REPORT_MODEL = "gpt-4-turbo-preview"
+CARE_REPORT_SYSTEM_PROMPT = "你是一位專業的醫療照護報告撰寫者，擅長將口語記錄整理成結構化的照護報告。你會確保報告的專業性、完整性和可讀性。"
+CARE_REPORT_PROMPT = """
 請根據以下的語音轉錄內容，生成一份結構完整的照護報告，並注意排版，符合html格式。
 
 報告格式要求：
@@ -204,42 +150,171 @@ def generate_care_report(transcribed_text):
 
 請以專業的醫療照護報告格式輸出，使用繁體中文，確保內容清晰易讀，重點明確。如果某些資訊未在轉錄內容中提及，請標註「未提供相關資訊」。
 """
-            response = client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": "你是一位專業的醫療照護報告撰寫者，擅長將口語記錄整理成結構化的照護報告。你會確保報告的專業性、完整性和可讀性。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                timeout=300  # 設定 API 調用超時時間為 300 秒
-            )
-            
-            progress.stop()
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            progress.stop()
-            print(f"\n第 {attempt + 1} 次嘗試生成報告失敗：{str(e)}")
-            if attempt < max_retries - 1:
-                print(f"等待 {retry_delay} 秒後重試...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # 指數退避
-            else:
-                print("\n已達到最大重試次數，生成報告失敗")
-                raise
-
-def speech_to_text(audio_path):
+
+def generate_care_report(transcribed_text):
+    """使用 OpenAI 生成照護報告"""
+    cache_key = report_key(transcribed_text, CARE_REPORT_MODEL, CARE_REPORT_SYSTEM_PROMPT + CARE_REPORT_PROMPT)
+    cached_report = result_cache.get(cache_key)
+    if cached_report is not None:
+        print("\n使用快取的照護報告")
+        return cached_report
+
     try:
-        print("\n=== 開始進行語音轉文字 ===")
+        progress = ProgressAnimation("正在生成照護報告")
+        progress.start()
         
-        # 將M4A轉換為WAV檔案
-        wav_path = convert_m4a_to_wav(audio_path)
+        prompt = CARE_REPORT_PROMPT.format(transcribed_text=transcribed_text)
+        # 逾時與 429/5xx 重試由共用客戶端處理
+        response = openai_client.chat(
+            model=CARE_REPORT_MODEL,
+            messages=[
+                {"role": "system", "content": CARE_REPORT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7
+        )
+        
+        progress.stop()
+        care_report = response.choices[0].message.content
+        result_cache.set(cache_key, care_report)
+        return care_report
         
+    except Exception as e:
+        if 'progress' in locals():
+            progress.stop()
+        print(f"\n生成報告失敗：{str(e)}")
+        raise
+
+SEGMENT_SUMMARY_PROMPT = """
+以下是一段交班錄音中第 {index} 段的語音轉錄內容（相鄰片段可能有少量重複）。
+請依病人（床號或稱呼）條列這一段提到的重點：症狀與體徵、生命徵象、已完成的照護與用藥、
+特殊處置、需要追蹤或交班的事項。只整理這一段的內容，不要補充未提及的資訊，使用繁體中文。
+
+轉錄內容：
+{segment_text}
+"""
+
+# 合併時以各段摘要取代完整轉錄，沿用原本的報告格式
+REPORT_MERGE_PREFIX = "以下「轉錄內容」是同一段交班錄音依時間順序分段整理的重點摘要，請合併同一病人的資訊並去除重複。\n"
+
+# 超過此長度的錄音改用管線化模式（轉錄與摘要同時進行）
+PIPELINE_MIN_MS = MAX_SEGMENT_MS
+
+# 批次模式預設值
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '2'))
+BATCH_OUTPUT_DIR = os.getenv('BATCH_OUTPUT_DIR', 'batch_reports')
+
+def summarize_segment(index, segment_text):
+    """整理單一片段的重點，供最後合併報告使用"""
+    response = openai_client.chat(
+        model=CARE_REPORT_MODEL,
+        messages=[
+            {"role": "system", "content": CARE_REPORT_SYSTEM_PROMPT},
+            {"role": "user", "content": SEGMENT_SUMMARY_PROMPT.format(
+                index=index + 1, segment_text=segment_text
+            )}
+        ],
+        temperature=0.3
+    )
+    return response.choices[0].message.content
+
+def merge_segment_summaries(summaries):
+    """將各段摘要合併為完整的照護報告"""
+    joined = "\n\n".join(
+        f"【第 {i + 1} 段】\n{summary}" for i, summary in enumerate(summaries)
+    )
+    response = openai_client.chat(
+        model=CARE_REPORT_MODEL,
+        messages=[
+            {"role": "system", "content": CARE_REPORT_SYSTEM_PROMPT},
+            {"role": "user", "content": REPORT_MERGE_PREFIX + CARE_REPORT_PROMPT.format(transcribed_text=joined)}
+        ],
+        temperature=0.7
+    )
+    return response.choices[0].message.content
+
+pipelined_reporter = PipelinedReporter(transcriber, summarize_segment, merge_segment_summaries)
+
+def generate_care_report_pipelined(audio_path):
+    """長錄音：各段轉錄完成就開始摘要，最後合併為報告，回傳 (轉錄文字, 照護報告)"""
+    text_key = transcription_key(file_sha256(audio_path), WHISPER_MODEL, WHISPER_LANGUAGE)
+    transcribed_text = result_cache.get(text_key)
+    if transcribed_text is not None:
+        print("\n使用快取的轉錄結果")
+        return transcribed_text, generate_care_report(transcribed_text)
+
+    progress = ProgressAnimation("正在同時進行語音辨識與分段摘要")
+    progress.start()
+    try:
+        audio = AudioSegment.from_file(audio_path)
+        if VAD_ENABLED:
+            audio, _ = trim_silence(audio)
+        transcribed_text, care_report, timings = pipelined_reporter.run(audio)
+    finally:
+        progress.stop()
+
+    print(f"\n共 {timings['segments']} 段：轉錄 {timings['transcribe']:.1f} 秒，"
+          f"轉錄完成後摘要 {timings['summarize_tail']:.1f} 秒，合併 {timings['merge']:.1f} 秒")
+    # 同一份轉錄再次處理時直接使用這份報告
+    result_cache.set(text_key, transcribed_text)
+    result_cache.set(
+        report_key(transcribed_text, CARE_REPORT_MODEL, CARE_REPORT_SYSTEM_PROMPT + CARE_REPORT_PROMPT),
+        care_report
+    )
+    return transcribed_text, care_report
+
+def process_recording(audio_path, workspace, pipelined=None):
+    """轉錄並生成照護報告，回傳 (轉錄文字, 照護報告, 各階段耗時)
+
+    pipelined 為 None 時，長錄音自動使用管線化模式。
+    """
+    if pipelined is None:
+        pipelined = (probe_duration_ms(audio_path) or 0) > PIPELINE_MIN_MS
+    
+    start_time = time.time()
+    if pipelined:
+        # 長錄音直接由原檔切段，轉錄與摘要重疊進行
+        transcribed_text, care_report = generate_care_report_pipelined(audio_path)
+        transcribed_time = None
+    else:
+        # 使用 Whisper 進行辨識（支援的格式直接上傳原檔）
+        transcribed_text = transcribe_with_whisper(audio_path, workspace)
+        transcribed_time = time.time()
+        care_report = generate_care_report(transcribed_text)
+    end_time = time.time()
+    
+    timings = {
+        'pipelined': pipelined,
+        'transcribe': transcribed_time - start_time if transcribed_time else None,
+        'report': end_time - transcribed_time if transcribed_time else None,
+        'total': end_time - start_time
+    }
+    return transcribed_text, care_report, timings
+
+def write_report_file(output_text_file, audio_path, transcribed_text, care_report, processing_time):
+    """將轉錄內容與照護報告寫入文字檔"""
+    with open(output_text_file, "w", encoding="utf-8") as f:
+        f.write(f"原始檔案：{audio_path}\n")
+        f.write(f"處理時間：{processing_time:.2f} 秒\n")
+        f.write("-" * 50 + "\n\n")
+        f.write("=== 原始轉錄內容 ===\n")
+        f.write(transcribed_text + "\n\n")
+        f.write("=== 整理後的照護報告 ===\n")
+        f.write(care_report)
+    return output_text_file
+
+def speech_to_text(audio_path, pipelined=None):
+    """轉錄並生成照護報告；pipelined 為 None 時，長錄音自動使用管線化模式"""
+    # 中間檔寫入獨立的工作目錄，同時執行多個轉換也不會互相覆蓋
+    workspace = JobWorkspace()
+    try:
+        workspace.open()
+        print("\n=== 開始進行語音轉文字 ===")
+        print(f"原始檔案：{audio_path}")
         print("\n開始進行語音辨識...")
-        start_time = time.time()
         
-        # 使用 Whisper 進行辨識
-        transcribed_text = transcribe_with_whisper(wav_path)
+        transcribed_text, care_report, timings = process_recording(audio_path, workspace, pipelined)
+        processing_time = timings['total']
         
         print("\n=== 語音辨識完成 ===")
         print("\n原始轉換結果：")
@@ -247,14 +322,10 @@ def speech_to_text(audio_path):
         print(transcribed_text)
         print("-" * 50)
         
-        # 使用 OpenAI 生成照護報告
-        care_report = generate_care_report(transcribed_text)
-        
-        end_time = time.time()
-        processing_time = end_time - start_time
-        
         print("\n=== 報告生成完成 ===")
         print(f"總處理時間：{processing_time:.2f} 秒")
+        if VAD_ENABLED:
+            print(f"剪除靜音：{vad_totals()['saved_seconds']:.1f} 秒")
         print("\n照護報告：")
         print("-" * 50)
         print(care_report)
@@ -267,15 +338,10 @@ def speech_to_text(audio_path):
         progress = ProgressAnimation("正在儲存報告")
         progress.start()
         
-        output_text_file = f"照護報告_{timestamp}.txt"
-        with open(output_text_file, "w", encoding="utf-8") as f:
-            f.write(f"原始檔案：{audio_path}\n")
-            f.write(f"處理時間：{processing_time:.2f} 秒\n")
-            f.write("-" * 50 + "\n\n")
-            f.write("=== 原始轉錄內容 ===\n")
-            f.write(transcribed_text + "\n\n")
-            f.write("=== 整理後的照護報告 ===\n")
-            f.write(care_report)
+        output_text_file = write_report_file(
+            f"照護報告_{timestamp}_{workspace.job_id[:8]}.txt",
+            audio_path, transcribed_text, care_report, processing_time
+        )
         
         progress.stop()
         print(f"\n結果已儲存至：{os.path.abspath(output_text_file)}")
@@ -287,15 +353,21 @@ def speech_to_text(audio_path):
         print("詳細錯誤訊息：")
         print(traceback.format_exc())
     finally:
-        # 清理暫時檔案
-        progress = ProgressAnimation("正在清理暫時檔案")
-        progress.start()
-        if os.path.exists(wav_path):
-            os.remove(wav_path)
-        progress.stop()
+        workspace.cleanup()
         print("\n處理完成！")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='語音轉文字暨照護報告生成程式')
+    parser.add_argument('source', help='音訊檔案；批次模式下為資料夾或萬用字元路徑（如 "archive/*.m4a"）')
+    parser.add_argument('--batch', action='store_true', help='批次處理資料夾或萬用字元路徑中的所有錄音')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help='批次模式同時處理的檔案數')
+    parser.add_argument('--output-dir', default=BATCH_OUTPUT_DIR, help='批次模式的報告、進度紀錄與摘要 CSV 目錄')
+    parser.add_argument('--recursive', action='store_true', help='批次模式包含子資料夾')
+    parser.add_argument('--pipelined', choices=['auto', 'on', 'off'], default='auto', help='長錄音管線化模式')
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     print("=== 語音轉文字暨照護報告生成程式啟動 ===")
     print("Python版本：", sys.version)
     print("目前工作目錄：", os.getcwd())
@@ -305,9 +377,17 @@ if __name__ == "__main__":
         print("環境檢查失敗，程式終止")
         sys.exit(1)
     
-    # 設定音訊檔案路徑
-    audio_file = r"C:\Users\aken1\OneDrive\文档\112091522.m4a"
-    print(f"\n處理檔案：{audio_file}")
+    pipelined = {'auto': None, 'on': True, 'off': False}[args.pipelined]
+    if args.batch or os.path.isdir(args.source) or glob.has_magic(args.source):
+        from batch_runner import run_batch
+        
+        summary = run_batch(
+            args.source, args.output_dir, workers=args.workers,
+            recursive=args.recursive, pipelined=pipelined
+        )
+        sys.exit(1 if summary['failed'] else 0)
+    
+    print(f"\n處理檔案：{args.source}")
     
     # 執行轉換和報告生成
-    speech_to_text(audio_file)
\ No newline at end of file
+    speech_to_text(args.source, pipelined)
@@ -0,0 +1,240 @@
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+import metrics
+import openai_client
+from admission import AdmissionBusy, AdmissionController, WAITER_TIMEOUT, _LocalBackend
+
+LEASE = 60
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def advance(self, seconds):
+        self.now += seconds
+        return self.now
+
+
+def test_slots_are_granted_in_fifo_order():
+    backend = _LocalBackend()
+    clock = Clock()
+
+    assert backend.try_acquire('a', clock.now, 1, LEASE) == 0
+    assert backend.try_acquire('b', clock.now, 1, LEASE) == 1
+    assert backend.try_acquire('c', clock.now, 1, LEASE) == 2
+
+    backend.release('a')
+    # c 輪詢時 b 仍排在前面，c 不能插隊
+    assert backend.try_acquire('c', clock.advance(1), 1, LEASE) == 1
+    assert backend.try_acquire('b', clock.now, 1, LEASE) == 0
+    assert backend.depth() == (1, 1)
+
+
+def test_expired_lease_frees_the_slot():
+    backend = _LocalBackend()
+    clock = Clock()
+
+    assert backend.try_acquire('crashed', clock.now, 1, LEASE) == 0
+    assert backend.try_acquire('next', clock.advance(LEASE - 1), 1, LEASE) == 1
+    assert backend.try_acquire('next', clock.advance(2), 1, LEASE) == 0
+
+
+def test_waiters_that_stop_polling_leave_the_queue():
+    backend = _LocalBackend()
+    clock = Clock()
+
+    backend.try_acquire('holder', clock.now, 1, LEASE)
+    backend.try_acquire('gone', clock.now, 1, LEASE)
+    assert backend.try_acquire('waiting', clock.now, 1, LEASE) == 2
+
+    clock.advance(WAITER_TIMEOUT - 1)
+    assert backend.try_acquire('waiting', clock.now, 1, LEASE) == 2
+    clock.advance(2)
+    assert backend.try_acquire('waiting', clock.now, 1, LEASE) == 1
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    backend = _LocalBackend()
+    clock = Clock()
+    rate, burst = 1 / 15, 3
+
+    waits = [backend.reserve('U1', clock.now, rate, burst) for _ in range(5)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(15)
+    assert waits[4] == pytest.approx(30)
+    # 其他使用者不受影響
+    assert backend.reserve('U2', clock.now, rate, burst) == 0.0
+
+
+def test_token_bucket_refills_over_time():
+    backend = _LocalBackend()
+    clock = Clock()
+    rate, burst = 1.0, 2
+
+    backend.reserve('U1', clock.now, rate, burst)
+    backend.reserve('U1', clock.now, rate, burst)
+    assert backend.reserve('U1', clock.now, rate, burst) == pytest.approx(1)
+    # 補滿後不超過 burst
+    clock.advance(100)
+    assert [backend.reserve('U1', clock.now, rate, burst) for _ in range(3)] == [0.0, 0.0, pytest.approx(1)]
+
+
+def test_background_job_is_deferred_instead_of_waiting(monkeypatch):
+    monkeypatch.setattr(admission, 'POLL_INTERVAL', 0.01)
+    controller = AdmissionController(max_concurrent=1, max_wait=5)
+
+    with controller.slot():
+        with admission.queue_notifications(lambda position: None, defer_after=0.05):
+            with pytest.raises(AdmissionBusy) as excinfo:
+                with controller.slot():
+                    pass
+    assert excinfo.value.position == 1
+    # 延後的排隊登記已撤回，名額也已釋放
+    assert controller.local.depth() == (0, 0)
+
+
+def test_queue_position_is_notified_once(monkeypatch):
+    monkeypatch.setattr(admission, 'POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(admission, 'ADMISSION_NOTIFY_AFTER', 0)
+    controller = AdmissionController(max_concurrent=1, max_wait=5)
+    positions = []
+
+    with controller.slot():
+        with admission.queue_notifications(positions.append, defer_after=0.05):
+            for _ in range(2):
+                with pytest.raises(AdmissionBusy):
+                    with controller.slot():
+                        pass
+    assert positions == [1]
+
+
+def test_deferred_job_keeps_its_place_ahead_of_later_requests(monkeypatch):
+    monkeypatch.setattr(admission, 'POLL_INTERVAL', 0.01)
+    controller = AdmissionController(max_concurrent=1, max_wait=5)
+
+    with controller.slot():
+        with admission.queue_notifications(lambda position: None, defer_after=0.05):
+            with pytest.raises(AdmissionBusy) as excinfo:
+                with controller.slot():
+                    pass
+        priority = excinfo.value.priority
+        assert controller.local.try_acquire('later', time.time(), 1, LEASE) == 1
+
+        # 重新執行的工作排回原本的順位，排在延後期間才到的請求前面
+        with admission.queue_notifications(lambda position: None, defer_after=0.05, priority=priority):
+            with pytest.raises(AdmissionBusy) as excinfo:
+                with controller.slot():
+                    pass
+        assert excinfo.value.priority == priority
+        assert controller.local.try_acquire('resumed', time.time(), 1, LEASE, priority) == 1
+        assert controller.local.try_acquire('later', time.time(), 1, LEASE) == 2
+
+
+def test_deferral_is_not_counted_as_stage_error():
+    before = metrics.STAGE_ERRORS._values.get(('admission_test',), 0)
+
+    with pytest.raises(AdmissionBusy):
+        with metrics.track('admission_test'):
+            raise AdmissionBusy(1)
+
+    assert metrics.STAGE_ERRORS._values.get(('admission_test',), 0) == before
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+                       for delta in deltas]
+        self.response = SimpleNamespace(close=lambda: None)
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+def test_stream_holds_its_slot_until_consumed(monkeypatch):
+    controller = AdmissionController(max_concurrent=1)
+    monkeypatch.setattr(admission, 'controller', controller)
+    monkeypatch.setattr(openai_client, 'chat', lambda messages, model, **kwargs: FakeStream(['交', '班']))
+
+    stream = openai_client.chat_stream([], 'gpt-test')
+    assert next(stream) == '交'
+    assert controller.local.depth() == (0, 1)
+
+    assert list(stream) == ['班']
+    assert controller.local.depth() == (0, 0)
+
+
+class FlakyRedisBackend:
+    """第一次排隊成功、之後失敗的 Redis backend"""
+
+    name = 'redis'
+
+    def __init__(self):
+        self.calls = 0
+        self.released = []
+
+    def try_acquire(self, ticket, now, limit, lease, priority=None):
+        self.calls += 1
+        if self.calls > 1:
+            raise ConnectionError('redis down')
+        return 1
+
+    def release(self, ticket):
+        self.released.append(ticket)
+
+
+def test_ticket_is_released_on_the_backend_it_was_queued_on(monkeypatch):
+    monkeypatch.setattr(admission, 'POLL_INTERVAL', 0.01)
+    controller = AdmissionController(max_concurrent=1)
+    controller.redis = FlakyRedisBackend()
+
+    with controller.slot():
+        pass
+
+    assert len(controller.redis.released) == 1
+    assert controller.local.depth() == (0, 0)
+
+
+def test_depth_is_cached_between_gauges():
+    controller = AdmissionController()
+    calls = []
+    depth = controller.local.depth
+    controller.local.depth = lambda: calls.append(1) or depth()
+
+    controller.depth()
+    controller.depth()
+
+    assert len(calls) == 1
+
+
+@pytest.mark.skipif(not os.getenv('REDIS_TEST_URL'), reason='設定 REDIS_TEST_URL 才測試 Redis 腳本')
+def test_redis_scripts_match_local_backend():
+    import redis
+
+    client = redis.from_url(os.getenv('REDIS_TEST_URL'))
+    prefix = f"care_sch:test:{uuid.uuid4().hex}:"
+    backend = admission._RedisBackend(client)
+    backend.keys = [prefix + name for name in ('holders', 'waiters', 'seen')]
+    user = f"test-{uuid.uuid4().hex}"
+    clock = Clock()
+    try:
+        assert backend.try_acquire('a', clock.now, 1, LEASE) == 0
+        assert backend.try_acquire('b', clock.now, 1, LEASE) == 1
+        assert backend.try_acquire('c', clock.now, 1, LEASE) == 2
+        backend.release('a')
+        assert backend.try_acquire('c', clock.now, 1, LEASE) == 1
+        assert backend.try_acquire('b', clock.now, 1, LEASE) == 0
+        assert backend.try_acquire('c', clock.advance(LEASE + 1), 1, LEASE) == 0
+
+        waits = [backend.reserve(user, clock.now, 1 / 15, 3) for _ in range(5)]
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert waits[3:] == [pytest.approx(15), pytest.approx(30)]
+    finally:
+        client.delete(*backend.keys, admission.REDIS_PREFIX + 'user:' + user)
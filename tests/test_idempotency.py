@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+from idempotency import IdempotencyGuard, event_key
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class BrokenRedis:
+    def __init__(self):
+        self.calls = 0
+
+    def set(self, *args, **kwargs):
+        self.calls += 1
+        raise ConnectionError('redis down')
+
+    def delete(self, key):
+        raise ConnectionError('redis down')
+
+
+def test_second_claim_is_rejected():
+    guard = IdempotencyGuard()
+
+    assert guard.claim('webhook:1')
+    assert not guard.claim('webhook:1')
+    assert guard.claim('webhook:2')
+
+
+def test_released_key_can_be_claimed_again():
+    guard = IdempotencyGuard(FakeRedis())
+
+    assert guard.claim('webhook:1')
+    guard.release('webhook:1')
+    assert guard.claim('webhook:1')
+
+
+def test_redis_is_shared_between_guards():
+    redis = FakeRedis()
+
+    assert IdempotencyGuard(redis).claim('webhook:1')
+    assert not IdempotencyGuard(redis).claim('webhook:1')
+
+
+def test_falls_back_to_local_set_when_redis_fails():
+    guard = IdempotencyGuard(BrokenRedis())
+
+    assert guard.claim('webhook:1')
+    assert not guard.claim('webhook:1')
+
+
+def test_failed_redis_is_skipped_until_retry_interval(monkeypatch):
+    redis = BrokenRedis()
+    guard = IdempotencyGuard(redis)
+
+    guard.claim('webhook:1')
+    guard.claim('webhook:2')
+    assert redis.calls == 1
+
+    # 重試時間到後再使用 Redis；中斷期間已處理的事件仍視為重複
+    working = FakeRedis()
+    monkeypatch.setattr(guard, 'redis', working)
+    monkeypatch.setattr(guard, '_redis_retry_at', 0)
+    assert not guard.claim('webhook:1')
+    assert guard.claim('webhook:3')
+    assert 'care_sch:event:webhook:3' in working.data
+
+
+def test_local_set_expires_and_is_bounded():
+    guard = IdempotencyGuard(ttl=0)
+    assert guard.claim('a')
+    assert guard.claim('a')
+
+    guard = IdempotencyGuard(local_max=2)
+    for key in ('a', 'b', 'c'):
+        guard.claim(key)
+    # 最舊的 a 已被淘汰
+    assert guard.claim('a')
+    assert not guard.claim('c')
+
+
+def test_event_key_prefers_webhook_event_id():
+    message = SimpleNamespace(id='m1')
+
+    assert event_key(SimpleNamespace(webhook_event_id='w1', message=message)) == 'webhook:w1'
+    assert event_key(SimpleNamespace(webhook_event_id=None, message=message)) == 'message:m1'
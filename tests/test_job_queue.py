@@ -0,0 +1,217 @@
+import json
+import time
+
+import pytest
+
+import job_queue
+from job_queue import JobDeferred, JobQueue, LocalBackend, RedisBackend, select_backend
+
+
+class FakeRedis:
+    """只實作佇列用到的 list 與 hash 指令"""
+
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError('redis down')
+
+    def ping(self):
+        self._check()
+        return True
+
+    def lpush(self, key, value):
+        self._check()
+        self.lists.setdefault(key, []).insert(0, value)
+
+    def llen(self, key):
+        self._check()
+        return len(self.lists.get(key, []))
+
+    def lmove(self, source, destination, src='LEFT', dest='RIGHT'):
+        self._check()
+        items = self.lists.get(source)
+        if not items:
+            return None
+        value = items.pop(0 if src == 'LEFT' else -1)
+        target = self.lists.setdefault(destination, [])
+        if dest == 'LEFT':
+            target.insert(0, value)
+        else:
+            target.append(value)
+        return value
+
+    def blmove(self, source, destination, timeout, src='LEFT', dest='RIGHT'):
+        return self.lmove(source, destination, src, dest)
+
+    def lrem(self, key, count, value):
+        self._check()
+        self.lists.get(key, []).remove(value)
+
+    def hset(self, key, field, value):
+        self._check()
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        self._check()
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, field):
+        self._check()
+        return 1 if self.hashes.get(key, {}).pop(field, None) is not None else 0
+
+    def register_script(self, script):
+        return lambda keys, args: 0
+
+
+def make_queue():
+    return JobQueue(LocalBackend(), workers=1)
+
+
+def test_jobs_run_in_order_with_their_data():
+    jobs = make_queue()
+    seen = []
+    jobs.register('note', seen.append)
+
+    jobs.enqueue('note', message_id='1')
+    jobs.enqueue('note', message_id='2')
+
+    assert jobs.size() == 2
+    assert jobs.process_one(timeout=0.01)
+    assert jobs.process_one(timeout=0.01)
+    assert not jobs.process_one(timeout=0.01)
+    assert seen == [{'message_id': '1'}, {'message_id': '2'}]
+
+
+def test_failing_handler_does_not_stop_the_queue():
+    jobs = make_queue()
+    seen = []
+
+    @jobs.handler('note')
+    def handle(data):
+        seen.append(data['n'])
+        if data['n'] == 1:
+            raise RuntimeError('boom')
+
+    jobs.enqueue('note', n=1)
+    jobs.enqueue('note', n=2)
+    jobs.process_one(timeout=0.01)
+    jobs.process_one(timeout=0.01)
+
+    assert seen == [1, 2]
+
+
+def test_unknown_job_type_is_dropped():
+    jobs = make_queue()
+    jobs.enqueue('missing')
+
+    assert jobs.process_one(timeout=0.01)
+    assert jobs.size() == 0
+
+
+def test_deferred_job_waits_in_delayed_set_with_updated_data():
+    jobs = make_queue()
+    seen = []
+
+    @jobs.handler('note')
+    def handle(data):
+        seen.append(dict(data))
+        if not data.get('admitted'):
+            raise JobDeferred(0.2, admitted=True)
+
+    jobs.enqueue('note', n=1)
+    jobs.process_one(timeout=0.01)
+
+    # 未到期前不會回到佇列
+    assert jobs.size() == 0
+    assert not jobs.process_one(timeout=0.01)
+
+    time.sleep(0.25)
+    jobs._next_promote = 0
+    assert jobs.process_one(timeout=0.01)
+    assert seen == [{'n': 1}, {'n': 1, 'admitted': True}]
+
+
+def test_local_backend_promotes_only_due_jobs():
+    backend = LocalBackend()
+    backend.schedule('late', 200)
+    backend.schedule('early', 100)
+
+    assert backend.promote_due(50) == 0
+    assert backend.promote_due(150) == 1
+    assert backend.pop(0.01) == 'early'
+    assert backend.promote_due(250) == 1
+    assert backend.pop(0.01) == 'late'
+
+
+def test_payload_is_json_with_request_metadata():
+    backend = LocalBackend()
+    jobs = JobQueue(backend)
+
+    job_id = jobs.enqueue('note', text='中文')
+
+    job = json.loads(backend.pop(0.01))
+    assert job['id'] == job_id
+    assert job['type'] == 'note'
+    assert job['data'] == {'text': '中文'}
+    assert 'enqueued_at' in job and 'traceparent' in job
+
+
+def test_redis_job_stays_in_processing_list_until_acked():
+    redis = FakeRedis()
+    backend = RedisBackend(redis, 'jobs')
+    jobs = JobQueue(backend)
+    seen = []
+
+    @jobs.handler('note')
+    def handle(data):
+        seen.append(redis.llen(backend.processing_name()))
+
+    jobs.enqueue('note', n=1)
+    assert jobs.process_one(timeout=0.01)
+
+    assert seen == [1]
+    assert redis.llen(backend.processing_name()) == 0
+    assert redis.llen('jobs') == 0
+
+
+def test_jobs_of_a_dead_consumer_are_requeued():
+    redis = FakeRedis()
+    backend = RedisBackend(redis, 'jobs')
+    redis.lists['jobs:processing:dead-host:1'] = ['job']
+    redis.hset('jobs:consumers', 'dead-host:1', time.time() - job_queue.CONSUMER_TIMEOUT - 1)
+    backend.heartbeat(time.time())
+
+    assert backend.recover(time.time()) == 1
+    assert redis.lists['jobs'] == ['job']
+    assert list(redis.hgetall('jobs:consumers')) == [job_queue.consumer_id()]
+    # 已回收的程序不會再被處理一次
+    assert backend.recover(time.time()) == 0
+
+
+def test_web_process_without_workers_never_falls_back_to_local_queue():
+    redis = FakeRedis()
+    redis.down = True
+    jobs = JobQueue(lambda: select_backend(redis, queue_name='jobs', allow_local=False))
+
+    with pytest.raises(ConnectionError):
+        jobs.enqueue('note', n=1)
+
+
+def test_queue_returns_to_redis_after_it_recovers(monkeypatch):
+    redis = FakeRedis()
+    redis.down = True
+    jobs = JobQueue(lambda: select_backend(redis, queue_name='jobs'))
+
+    jobs.enqueue('note', n=1)
+    assert jobs.backend.name == 'local'
+
+    redis.down = False
+    monkeypatch.setattr(jobs, '_reselect_at', 0)
+    jobs.enqueue('note', n=2)
+
+    assert jobs.backend.name == 'redis'
+    assert [json.loads(item)['data'] for item in reversed(redis.lists['jobs'])] == [{'n': 1}, {'n': 2}]
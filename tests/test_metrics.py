@@ -0,0 +1,68 @@
+import metrics
+from metrics import Counter, Gauge, Histogram
+
+
+def test_counter_renders_labels_and_escapes_values():
+    counter = Counter('requests_total', '請求數', ['stage'])
+    counter.inc(stage='whisper')
+    counter.inc(2, stage='whisper')
+    counter.inc(stage='say "hi"\n')
+
+    assert counter.render() == [
+        '# HELP care_sch_requests_total 請求數',
+        '# TYPE care_sch_requests_total counter',
+        'care_sch_requests_total{stage="say \\"hi\\"\\n"} 1',
+        'care_sch_requests_total{stage="whisper"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', '延遲', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 5):
+        histogram.observe(value)
+
+    lines = histogram.render()[2:]
+
+    assert lines == [
+        'care_sch_latency_seconds_bucket{le="0.1"} 1',
+        'care_sch_latency_seconds_bucket{le="1"} 3',
+        'care_sch_latency_seconds_bucket{le="+Inf"} 4',
+        'care_sch_latency_seconds_sum 6.25',
+        'care_sch_latency_seconds_count 4',
+    ]
+
+
+def test_gauge_reads_callback_at_render_time():
+    depth = [3]
+    gauge = Gauge('queue_depth', '佇列長度', callback=lambda: depth[0])
+
+    assert gauge.render()[-1] == 'care_sch_queue_depth 3'
+    depth[0] = 7
+    assert gauge.render()[-1] == 'care_sch_queue_depth 7'
+
+
+def test_failing_gauge_callback_keeps_last_value():
+    values = iter([5])
+    gauge = Gauge('queue_depth', '佇列長度', callback=lambda: next(values))
+
+    gauge.render()
+
+    assert gauge.render()[-1] == 'care_sch_queue_depth 5'
+
+
+def test_track_records_duration_and_errors():
+    before = metrics.STAGE_ERRORS._values.get(('test_stage',), 0)
+
+    with metrics.track('test_stage'):
+        pass
+    try:
+        with metrics.track('test_stage'):
+            raise ValueError('boom')
+    except ValueError:
+        pass
+
+    assert metrics.STAGE_SECONDS._values[('test_stage',)]['count'] == 2
+    assert metrics.STAGE_ERRORS._values[('test_stage',)] == before + 1
+    output = metrics.render()
+    assert 'care_sch_stage_duration_seconds_count{stage="test_stage"} 2' in output
+    assert output.endswith('\n')
@@ -0,0 +1,66 @@
+import pytest
+
+from patient_index import PatientIndex, detect_flags, extract_patients, parse_bed_command
+from record_store import RecordStore
+
+REPORT = """### 病人狀況
+**病人編號：052**
+- NPO 待檢查
+- 約束中
+**病人編號：114**
+- 血糖 180
+### 其他
+記得補藥"""
+
+RAW = "052爺爺今天NPO，有約束。114奶奶血糖180，尾骶有壓傷。"
+
+
+def test_detect_flags_in_keyword_order():
+    assert detect_flags('血糖偏高，npo，壓瘡') == ['NPO', '壓傷', '血糖']
+    assert detect_flags('') == []
+
+
+def test_extract_patients_from_report_sections():
+    patients = extract_patients(RAW, REPORT)
+
+    assert set(patients) == {'052', '114'}
+    assert patients['052']['flags'] == ['NPO', '約束']
+    assert patients['052']['excerpt'] == '病人編號：052 NPO 待檢查 約束中'
+    # 報告省略的壓傷由原始轉錄補上；「### 其他」之後的內容不屬於 114 床
+    assert patients['114']['flags'] == ['壓傷', '血糖']
+    assert '補藥' not in patients['114']['excerpt']
+
+
+def test_extract_patients_falls_back_to_raw_text():
+    patients = extract_patients('162床翻身，壓瘡換藥。114年度評鑑', '')
+
+    # 「114年」是年份，不是床號
+    assert list(patients) == ['162']
+    assert patients['162']['flags'] == ['壓傷']
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('床號 114 壓傷', ('114', '壓傷')),
+    ('床號052', ('052', None)),
+    ('114', None),
+])
+def test_parse_bed_command(text, expected):
+    assert parse_bed_command(text) == expected
+
+
+def test_timeline_filters_by_flag_and_user(tmp_path):
+    store = RecordStore(str(tmp_path))
+    index = PatientIndex(store)
+    for timestamp, user, raw, report in [
+        ('20250101_080000', 'U1', RAW, REPORT),
+        ('20250102_080000', 'U2', '052爺爺今天穩定', '**病人編號：052**\n- 生命徵象穩定'),
+    ]:
+        record_id = store.add({
+            'timestamp': timestamp, 'created_at': timestamp, 'line_user_id': user,
+            'raw_transcription': raw, 'formatted_report': report,
+        })
+        index.index_record(record_id, timestamp, raw, report)
+
+    assert [event['timestamp'] for event in index.timeline('052')] == ['20250102_080000', '20250101_080000']
+    assert [event['flags'] for event in index.timeline('052', flag='約束')] == [['NPO', '約束']]
+    assert len(index.timeline('052', line_user_id='U1')) == 1
@@ -0,0 +1,63 @@
+import os
+
+from result_cache import DiskLRUCache, ResultCache, report_key, transcription_key
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1024)
+
+    assert cache.get('transcription:abc') is None
+    cache.set('transcription:abc', '交班內容')
+    assert cache.get('transcription:abc') == '交班內容'
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=25)
+    cache.set('a', 'x' * 10)
+    cache.set('b', 'x' * 10)
+    # 將 a 的存取時間設為較舊，再讀取 b 使其成為最近使用
+    os.utime(cache._path('a'), (1, 1))
+    cache.get('b')
+
+    cache.set('c', 'x' * 10)
+
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+    assert cache.get('c') is not None
+
+
+def test_overwrite_does_not_double_count_size(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=25)
+    for _ in range(5):
+        cache.set('a', 'x' * 10)
+    cache.set('b', 'x' * 10)
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is not None
+
+
+def test_get_or_compute_only_computes_once(tmp_path):
+    cache = ResultCache(disk=DiskLRUCache(str(tmp_path)))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return '報告'
+
+    assert cache.get_or_compute('report:1', compute) == '報告'
+    assert cache.get_or_compute('report:1', compute) == '報告'
+    assert len(calls) == 1
+
+
+def test_empty_results_are_not_cached(tmp_path):
+    cache = ResultCache(disk=DiskLRUCache(str(tmp_path)))
+
+    cache.get_or_compute('report:1', lambda: '')
+
+    assert cache.get('report:1') is None
+
+
+def test_keys_change_with_model_and_prompt():
+    assert transcription_key('abc', 'whisper-1', 'zh') != transcription_key('abc', 'whisper-1', 'en')
+    assert report_key('text', 'gpt-3.5-turbo', 'a') != report_key('text', 'gpt-3.5-turbo', 'b')
+    assert report_key('text', 'gpt-3.5-turbo', 'a') == report_key('text', 'gpt-3.5-turbo', 'a')
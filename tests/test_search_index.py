@@ -0,0 +1,74 @@
+import pytest
+
+from record_store import RecordStore
+from search_index import SearchIndex, make_snippet, parse_search_command, tokenize
+
+
+def test_tokenize_chinese_bigrams_and_words():
+    assert tokenize('壓傷 Foley 2次') == ['壓傷', 'foley', '2', '次']
+    assert tokenize('翻身擺位') == ['翻身', '身擺', '擺位']
+
+
+def test_snippet_is_centered_on_first_match():
+    text = 'a' * 50 + '壓傷處理' + 'b' * 50
+
+    snippet = make_snippet(text, '壓傷', width=10)
+
+    assert snippet == '…' + 'a' * 10 + '壓傷處理bbbbbb' + '…'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('搜尋 壓傷', ('壓傷', 1)),
+    ('搜尋 壓傷 第2頁', ('壓傷', 2)),
+    ('搜尋記錄', None),
+    ('你好', None),
+])
+def test_parse_search_command(text, expected):
+    assert parse_search_command(text) == expected
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RecordStore(str(tmp_path))
+
+
+def add_record(store, index, user, text):
+    record_id = store.add({
+        'timestamp': '20250101_080000',
+        'created_at': '2025-01-01 08:00:00',
+        'line_user_id': user,
+        'raw_transcription': text,
+        'formatted_report': text,
+    })
+    index.index_record(record_id, text, text)
+    return record_id
+
+
+def test_search_ranks_records_matching_all_terms_first(store):
+    index = SearchIndex(store)
+    only_wound = add_record(store, index, 'U1', '尾骶壓傷換藥')
+    both = add_record(store, index, 'U1', '尾骶壓傷換藥，血糖偏高')
+    add_record(store, index, 'U1', '今日無特殊狀況')
+
+    results, total = index.search('壓傷 血糖')
+
+    assert total == 2
+    assert [record['id'] for record in results] == [both, only_wound]
+    assert '壓傷' in results[0]['snippet']
+
+
+def test_search_pages_and_user_scope(store):
+    index = SearchIndex(store)
+    for i in range(3):
+        add_record(store, index, 'U1', f'第{i}床壓傷')
+    add_record(store, index, 'U2', '壓傷換藥')
+
+    first, total = index.search('壓傷', page=1, page_size=2)
+    second, _ = index.search('壓傷', page=2, page_size=2)
+    assert total == 4
+    assert len(first) == 2 and len(second) == 2
+
+    mine, my_total = index.search('壓傷', line_user_id='U2')
+    assert my_total == 1
+    assert [record['line_user_id'] for record in mine] == ['U2']
+    assert index.search('換藥', line_user_id='U1') == ([], 0)
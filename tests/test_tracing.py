@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import tracing
+from job_queue import JobQueue, LocalBackend
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+SPAN_ID = '00f067aa0ba902b7'
+
+
+def test_parse_traceparent():
+    context = tracing.parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-01")
+
+    assert (context.trace_id, context.span_id, context.sampled) == (TRACE_ID, SPAN_ID, True)
+    assert not tracing.parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-00").sampled
+
+
+@pytest.mark.parametrize('value', [
+    None,
+    '',
+    'garbage',
+    f"00-{TRACE_ID[:-1]}-{SPAN_ID}-01",
+    f"00-{TRACE_ID}-{SPAN_ID}",
+    f"00-{'z' * 32}-{SPAN_ID}-01",
+    f"00-{'0' * 32}-{SPAN_ID}-01",
+    f"00-{TRACE_ID}-{'0' * 16}-01",
+])
+def test_invalid_traceparent_is_ignored(value):
+    assert tracing.parse_traceparent(value) is None
+
+
+def test_traceparent_round_trip():
+    value = f"00-{TRACE_ID}-{SPAN_ID}-01"
+
+    assert tracing.parse_traceparent(value).traceparent == value
+
+
+def test_child_span_continues_parent_trace():
+    span, token = tracing.start_span('job', parent=f"00-{TRACE_ID}-{SPAN_ID}-01")
+    try:
+        assert span.context.trace_id == TRACE_ID
+        assert span.parent_span_id == SPAN_ID
+        assert span.context.span_id != SPAN_ID
+        child, child_token = tracing.start_span('transcribe')
+        tracing.finish_span(child, child_token)
+        assert child.parent_span_id == span.context.span_id
+    finally:
+        tracing.finish_span(span, token)
+    assert tracing.current_span() is None
+
+    entry = span.to_dict()
+    assert entry['traceId'] == TRACE_ID
+    assert entry['parentSpanId'] == SPAN_ID
+    assert entry['endTimeUnixNano'] >= entry['startTimeUnixNano']
+
+
+def test_enqueued_job_carries_current_traceparent():
+    backend = LocalBackend()
+    jobs = JobQueue(backend)
+    span, token = tracing.start_span('webhook')
+    try:
+        jobs.enqueue('note')
+    finally:
+        tracing.finish_span(span, token)
+
+    job = json.loads(backend.pop(0.01))
+    assert tracing.parse_traceparent(job['traceparent']).trace_id == span.context.trace_id
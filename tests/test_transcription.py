@@ -0,0 +1,99 @@
+import io
+import asyncio
+import threading
+
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+import audio_normalize
+from audio_ingest import ingest_stream
+from transcription import ChunkedTranscriber, merge_transcripts, plan_segments
+
+
+def test_short_audio_is_a_single_segment():
+    assert plan_segments(60000, [], target_ms=30000, max_ms=90000) == [(0, 60000)]
+
+
+def test_cuts_prefer_silence_near_target_and_add_overlap():
+    silences = [(20000, 22000), (29000, 31000), (70000, 72000)]
+
+    segments = plan_segments(100000, silences, target_ms=30000, max_ms=50000, overlap_ms=1000)
+
+    assert segments == [(0, 30000), (29000, 71000), (70000, 100000)]
+
+
+def test_hard_cut_when_there_is_no_silence():
+    assert plan_segments(100000, [], target_ms=30000, max_ms=40000, overlap_ms=0) == [
+        (0, 40000), (40000, 80000), (80000, 100000)
+    ]
+
+
+def test_merge_removes_overlapping_text():
+    assert merge_transcripts(['今天052爺爺血糖', '爺爺血糖180，需要追蹤', '', 'OK']) == '今天052爺爺血糖180，需要追蹤OK'
+    assert merge_transcripts(['check vitals', 'then rest']) == 'check vitals then rest'
+
+
+def speech(seconds):
+    audio = AudioSegment.silent(duration=0, frame_rate=16000)
+    for _ in range(seconds):
+        audio += Sine(440).to_audio_segment(duration=800, volume=-10).set_frame_rate(16000)
+        audio += AudioSegment.silent(duration=600, frame_rate=16000)
+    return audio
+
+
+def test_long_audio_is_split_and_transcribed_in_parallel_with_a_fake():
+    audio = speech(10)
+    lock = threading.Lock()
+    calls = []
+
+    def fake_whisper(segment_file):
+        segment = AudioSegment.from_file(segment_file, format='wav')
+        with lock:
+            calls.append(len(segment))
+        return f"片段{len(calls)}"
+
+    transcriber = ChunkedTranscriber(fake_whisper, max_workers=3, target_ms=4000,
+                                     max_ms=5000, overlap_ms=500, export_format='wav')
+    segments = transcriber.split(audio)
+
+    text = transcriber.transcribe_segment_audio(audio)
+
+    assert len(segments) > 1
+    assert all(end - start <= 5000 + 500 for start, end in segments)
+    assert len(calls) == len(segments)
+    assert text.startswith('片段')
+
+
+def test_short_buffer_with_known_duration_is_uploaded_without_decoding():
+    buffer = io.BytesIO()
+    speech(1).export(buffer, format='wav')
+    uploads = []
+    transcriber = ChunkedTranscriber(lambda upload: uploads.append(upload) or '結果')
+
+    with ingest_stream([buffer.getvalue()], suffix='.m4a', duration_ms=1400) as audio:
+        assert transcriber.transcribe(audio) == '結果'
+
+    filename, _ = uploads[0]
+    assert filename == 'audio.m4a'
+
+
+def test_async_path_splits_and_merges_like_the_sync_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'long.wav')
+    speech(10).export(path, format='wav')
+    monkeypatch.setattr(audio_normalize, 'ffmpeg_available', lambda: True)
+    monkeypatch.setattr(audio_normalize, 'probe_duration_ms', lambda source: 14000)
+
+    def fake_whisper(segment_file):
+        return f"長度{len(AudioSegment.from_file(segment_file, format='wav')) // 100}。"
+
+    async def afake_whisper(segment_file):
+        await asyncio.sleep(0)
+        return fake_whisper(segment_file)
+
+    transcriber = ChunkedTranscriber(fake_whisper, max_workers=2, target_ms=4000, max_ms=5000,
+                                     overlap_ms=500, export_format='wav', atranscribe_fn=afake_whisper)
+
+    expected = transcriber.transcribe(path)
+
+    assert expected.count('長度') > 1
+    assert asyncio.run(transcriber.atranscribe(path)) == expected
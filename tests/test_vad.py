@@ -0,0 +1,54 @@
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from vad import speech_ranges, trim_silence
+
+
+def tone(ms):
+    return Sine(440).to_audio_segment(duration=ms, volume=-10).set_frame_rate(16000)
+
+
+def silence(ms):
+    return AudioSegment.silent(duration=ms, frame_rate=16000)
+
+
+def test_long_silence_between_bursts_is_cut():
+    audio = tone(1000) + silence(3000) + tone(1000)
+
+    ranges = speech_ranges(audio, min_silence_ms=1500, keep_silence_ms=400)
+
+    assert ranges == [(0, 1400), (3600, 5000)]
+
+
+def test_short_pause_is_kept():
+    audio = tone(1000) + silence(1000) + tone(1000)
+
+    assert speech_ranges(audio, min_silence_ms=1500, keep_silence_ms=400) == [(0, 3000)]
+
+
+def test_trim_silence_joins_kept_ranges():
+    audio = tone(1000) + silence(6000) + tone(1000)
+
+    trimmed, saved_ms = trim_silence(audio, min_saved_ms=1000)
+
+    # 兩段聲音各保留前後 400 ms 靜音
+    assert len(trimmed) == 2800
+    assert saved_ms == 5200
+
+
+def test_small_saving_keeps_original():
+    audio = tone(1000) + silence(3000) + tone(1000)
+
+    trimmed, saved_ms = trim_silence(audio, min_saved_ms=3000)
+
+    assert trimmed is audio
+    assert saved_ms == 0
+
+
+def test_all_silence_is_passed_through():
+    audio = silence(5000)
+
+    assert speech_ranges(audio) == []
+    trimmed, saved_ms = trim_silence(audio)
+    assert trimmed is audio
+    assert saved_ms == 0
@@ -0,0 +1,405 @@
+"""輕量的分散式追蹤（span）
+
+每個處理階段記錄一個 span（開始、結束時間與屬性），同一個請求的 span 共用 trace_id。
+以 W3C traceparent 標頭傳遞：HTTP 請求可由上游帶入，加入背景工作時存進工作內容，
+worker 執行時接續同一個 trace，webhook → 下載 → 轉錄 → 報告 → 儲存 → 推送可在離線時還原成一條關鍵路徑。
+
+span 完成後經由記憶體佇列交給背景執行緒輸出，每行一筆 JSON，欄位名稱沿用 OpenTelemetry
+OTLP/JSON（traceId、spanId、parentSpanId、startTimeUnixNano…），可再轉交其他追蹤工具。
+
+- TRACE_EXPORTER=file：寫入 TRACE_FILE，console：輸出到主控台，空字串：停用（預設）
+- 停用時 span() 回傳共用的空 context manager，不產生 ID、不取時間
+
+    with tracing.span('transcribe', audio_seconds=12.5):
+        ...
+
+離線分析：
+    python tracing.py "traces.*.jsonl*" --slowest 5
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import argparse
+import functools
+import contextvars
+from contextlib import contextmanager, nullcontext
+from logging.handlers import QueueHandler, QueueListener
+
+from logging_setup import CompressedRotatingFileHandler, job_id_var, request_id_var
+
+# span 輸出方式：file、console，空字串（預設）停用，需要分析延遲時再開啟
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '')
+# 輸出檔案路徑，{pid} 代入程序 ID，多個 worker 不會同時輪替同一個檔案
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.{pid}.jsonl')
+# 新 trace 的取樣比例（0～1）；由上游帶入的 traceparent 沿用上游的取樣決定
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1'))
+SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'care_sch')
+
+current_span_var = contextvars.ContextVar('current_span', default=None)
+
+_NULL_CONTEXT = nullcontext()
+_exporter = None
+_listener = None
+
+
+def _random_hex(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_traceparent(value):
+    """解析 "00-<trace_id>-<span_id>-<flags>"，格式錯誤時回傳 None"""
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return SpanContext(parts[1], parts[2], sampled)
+
+
+class SpanContext:
+    """跨程序傳遞所需的最少資訊"""
+
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span:
+    def __init__(self, name, parent=None, kind='internal', attributes=None):
+        if parent is None:
+            trace_id = _random_hex(128)
+            sampled = random.random() < TRACE_SAMPLE_RATE
+            parent_span_id = None
+        else:
+            trace_id = parent.trace_id
+            sampled = parent.sampled
+            parent_span_id = parent.span_id
+        self.name = name
+        self.kind = kind
+        self.context = SpanContext(trace_id, _random_hex(64), sampled)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.status = 'OK'
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def traceparent(self):
+        return self.context.traceparent
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = 'ERROR'
+        self.status_message = f"{type(exc).__name__}: {str(exc)}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.context.sampled and _exporter is not None:
+            _exporter.export(self)
+
+    def to_dict(self):
+        entry = {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'parentSpanId': self.parent_span_id or '',
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'durationMs': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': {'code': self.status},
+            'resource': {'service.name': SERVICE_NAME, 'process.pid': os.getpid()},
+        }
+        if self.status_message:
+            entry['status']['message'] = self.status_message
+        return entry
+
+
+class SpanExporter:
+    """把完成的 span 放進佇列，由 QueueListener 執行緒寫出"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.queue = queue.Queue(-1)
+        self.queue_handler = QueueHandler(self.queue)
+
+    def export(self, span):
+        try:
+            record = logging.makeLogRecord({
+                'name': 'care_sch.traces',
+                'levelno': logging.INFO,
+                'levelname': 'INFO',
+                'msg': json.dumps(span.to_dict(), ensure_ascii=False, default=str),
+            })
+            self.queue_handler.handle(record)
+        except Exception:
+            # 追蹤失敗不影響請求處理
+            pass
+
+
+def configure_tracing(exporter=TRACE_EXPORTER, trace_file=TRACE_FILE):
+    """啟動 span 輸出；重複呼叫時不會重複建立"""
+    global _exporter, _listener
+    if _exporter is not None or exporter not in ('file', 'console'):
+        return _exporter
+
+    if exporter == 'file':
+        path = trace_file.format(pid=os.getpid())
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = CompressedRotatingFileHandler(path)
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    _exporter = SpanExporter(handler)
+    _listener = QueueListener(_exporter.queue, handler)
+    _listener.start()
+    atexit.register(shutdown_tracing)
+    return _exporter
+
+
+def shutdown_tracing():
+    """寫完佇列中剩餘的 span 並停止背景執行緒"""
+    global _exporter, _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _exporter.handler.close()
+    _exporter = None
+    _listener = None
+
+
+def current_span():
+    return current_span_var.get()
+
+
+def current_traceparent():
+    """目前 span 的 traceparent，沒有進行中的 span 時回傳 None"""
+    span = current_span_var.get()
+    return span.traceparent if span is not None else None
+
+
+def start_span(name, parent=None, kind='internal', **attributes):
+    """建立 span 並設為目前的 span，回傳 (span, token)；須以 finish_span 結束
+
+    parent 可為 traceparent 字串；未指定時接續目前的 span。
+    """
+    if isinstance(parent, str):
+        parent = parse_traceparent(parent)
+    if parent is None:
+        current = current_span_var.get()
+        parent = current.context if current is not None else None
+    for key, value in (('request_id', request_id_var.get()), ('job_id', job_id_var.get())):
+        if value:
+            attributes.setdefault(key, value)
+    span = Span(name, parent, kind, attributes)
+    return span, current_span_var.set(span)
+
+
+def finish_span(span, token, exc=None):
+    if exc is not None:
+        span.record_exception(exc)
+    span.end()
+    try:
+        current_span_var.reset(token)
+    except ValueError:
+        # 串流回應可能在不同的 context 中結束
+        pass
+
+
+@contextmanager
+def _span(name, parent, kind, attributes):
+    span, token = start_span(name, parent, kind, **attributes)
+    try:
+        yield span
+    except BaseException as e:
+        finish_span(span, token, e)
+        raise
+    finish_span(span, token)
+
+
+def span(name, parent=None, kind='internal', **attributes):
+    """with tracing.span('whisper'): ... 記錄一個處理階段；停用時不做事"""
+    if _exporter is None:
+        return _NULL_CONTEXT
+    return _span(name, parent, kind, attributes)
+
+
+def child_span(name, kind='internal', **attributes):
+    """只在已有進行中的 span 時記錄（例如健康檢查等背景呼叫不另外產生 trace）"""
+    if _exporter is None or current_span_var.get() is None:
+        return _NULL_CONTEXT
+    return _span(name, None, kind, attributes)
+
+
+def record_exception(exc):
+    """將目前的 span 標記為失敗（例外已在函數內處理、不會傳出 span 時使用）"""
+    span = current_span_var.get()
+    if span is not None:
+        span.record_exception(exc)
+
+
+def set_attribute(key, value):
+    """設定目前 span 的屬性（沒有進行中的 span 時略過）"""
+    span = current_span_var.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+def bind(func):
+    """讓交給執行緒池的函數沿用呼叫端目前的 span 與日誌 request_id / job_id
+
+    ThreadPoolExecutor 不會複製 contextvars，未綁定時子執行緒中的 span 會成為新的 trace。
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        # 同一個 Context 不能同時在多個執行緒中進入，每次執行使用複本
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+def init_flask(app):
+    """每個 HTTP 請求建立一個 server span，接續請求標頭中的 traceparent，並在回應標頭帶回"""
+    from flask import g, request
+
+    @app.before_request
+    def start_request_span():
+        if _exporter is None:
+            return
+        g.trace_span = start_span(
+            f"{request.method} {request.path}",
+            parent=request.headers.get('traceparent'),
+            kind='server',
+            **{'http.method': request.method, 'http.target': request.path}
+        )
+
+    @app.after_request
+    def add_traceparent_header(response):
+        started = g.get('trace_span')
+        if started is not None:
+            span = started[0]
+            span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.status = 'ERROR'
+            response.headers.setdefault('traceparent', span.traceparent)
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        started = g.pop('trace_span', None)
+        if started is not None:
+            finish_span(started[0], started[1], exc)
+
+    return app
+
+
+def load_spans(pattern):
+    """讀取 span 輸出檔；可用萬用字元一次讀取多個 worker 的檔案"""
+    spans = []
+    for path in sorted(glob.glob(pattern)):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    return spans
+
+
+def critical_path(spans):
+    """由根 span 開始，每層取最晚結束的子 span，回傳沿途的 span 列表"""
+    children = {}
+    for span in spans:
+        children.setdefault(span['parentSpanId'], []).append(span)
+    span_ids = {span['spanId'] for span in spans}
+    roots = [span for span in spans if span['parentSpanId'] not in span_ids]
+    if not roots:
+        return []
+    path = [min(roots, key=lambda span: span['startTimeUnixNano'])]
+    while children.get(path[-1]['spanId']):
+        path.append(max(children[path[-1]['spanId']], key=lambda span: span['endTimeUnixNano']))
+    return path
+
+
+def print_trace(trace_id, spans):
+    children = {}
+    for span in spans:
+        children.setdefault(span['parentSpanId'], []).append(span)
+    span_ids = {span['spanId'] for span in spans}
+    start = min(span['startTimeUnixNano'] for span in spans)
+    end = max(span['endTimeUnixNano'] for span in spans)
+    on_path = {span['spanId'] for span in critical_path(spans)}
+    print(f"\ntrace {trace_id}：{(end - start) / 1e9:.2f} 秒，{len(spans)} 個 span（* 為關鍵路徑）")
+
+    def walk(span, depth):
+        offset = (span['startTimeUnixNano'] - start) / 1e9
+        marker = '*' if span['spanId'] in on_path else ' '
+        error = f"  [{span['status'].get('message', 'ERROR')}]" if span['status']['code'] == 'ERROR' else ''
+        print(f"{marker} {'  ' * depth}{span['name']:<{40 - 2 * depth}} "
+              f"+{offset:7.2f}s {span['durationMs'] / 1000:8.2f}s{error}")
+        for child in sorted(children.get(span['spanId'], []), key=lambda s: s['startTimeUnixNano']):
+            walk(child, depth + 1)
+
+    roots = [span for span in spans if span['parentSpanId'] not in span_ids]
+    for root in sorted(roots, key=lambda s: s['startTimeUnixNano']):
+        walk(root, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='依 trace 列出各階段耗時與關鍵路徑')
+    parser.add_argument('path', nargs='?', default=TRACE_FILE.format(pid='*'), help='span 輸出檔，可用萬用字元（例如 "traces*.jsonl*"）')
+    parser.add_argument('--trace', help='只顯示指定的 trace_id')
+    parser.add_argument('--slowest', type=int, default=5, help='顯示最慢的 N 個 trace')
+    args = parser.parse_args()
+
+    traces = {}
+    for span in load_spans(args.path):
+        traces.setdefault(span['traceId'], []).append(span)
+    if args.trace:
+        selected = [args.trace] if args.trace in traces else []
+    else:
+        def total_ns(trace_id):
+            spans = traces[trace_id]
+            return max(s['endTimeUnixNano'] for s in spans) - min(s['startTimeUnixNano'] for s in spans)
+        selected = sorted(traces, key=total_ns, reverse=True)[:args.slowest]
+    if not selected:
+        print("找不到符合的 trace")
+    for trace_id in selected:
+        print_trace(trace_id, traces[trace_id])
+
+
+if __name__ == "__main__":
+    main()
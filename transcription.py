@@ -0,0 +1,298 @@
+import io
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Whisper API 單次上傳上限為 25 MB，保留一些餘裕
+MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+# 切段設定（毫秒）
+TARGET_SEGMENT_MS = int(os.getenv('TRANSCRIBE_SEGMENT_MS', str(90 * 1000)))
+MAX_SEGMENT_MS = int(os.getenv('TRANSCRIBE_MAX_SEGMENT_MS', str(150 * 1000)))
+OVERLAP_MS = int(os.getenv('TRANSCRIBE_OVERLAP_MS', '1500'))
+MIN_SILENCE_MS = 400
+SILENCE_OFFSET_DB = 16  # 低於平均音量多少 dB 視為靜音
+SILENCE_SEEK_MS = 10  # 偵測靜音的步進，逐毫秒掃描長錄音過慢
+
+# 同時轉錄的片段數上限
+MAX_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS', '4'))
+
+# 合併時比對重疊文字的最大長度
+MAX_OVERLAP_CHARS = 40
+MIN_OVERLAP_CHARS = 2
+
+
+def plan_segments(duration_ms, silences, target_ms=TARGET_SEGMENT_MS,
+                  max_ms=MAX_SEGMENT_MS, overlap_ms=OVERLAP_MS):
+    """依靜音區段規劃切段位置
+
+    silences 為 (start, end) 靜音區間列表（毫秒），切點選在最接近目標長度、
+    且不超過最大長度的靜音中點；找不到靜音時於最大長度處硬切。
+    回傳含重疊的 (start, end) 片段列表。
+    """
+    if duration_ms <= max_ms:
+        return [(0, duration_ms)]
+
+    candidates = sorted((start + end) // 2 for start, end in silences)
+
+    cuts = []
+    position = 0
+    while duration_ms - position > max_ms:
+        window = [c for c in candidates if position < c <= position + max_ms]
+        if window:
+            target = position + target_ms
+            cut = min(window, key=lambda c: abs(c - target))
+        else:
+            cut = position + max_ms
+        cuts.append(cut)
+        position = cut
+
+    boundaries = [0] + cuts + [duration_ms]
+    segments = []
+    for i in range(len(boundaries) - 1):
+        start = boundaries[i]
+        if i > 0:
+            start = max(0, start - overlap_ms)
+        segments.append((start, boundaries[i + 1]))
+    return segments
+
+
+def _overlap_length(previous, current, max_chars=MAX_OVERLAP_CHARS):
+    """找出 previous 結尾與 current 開頭重複的最長長度"""
+    limit = min(len(previous), len(current), max_chars)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous[-size:] == current[:size]:
+            return size
+    return 0
+
+
+def merge_transcripts(texts):
+    """依序合併各片段的轉錄文字，並去除片段重疊處重複的文字"""
+    merged = ''
+    for text in texts:
+        text = (text or '').strip()
+        if not text:
+            continue
+        if not merged:
+            merged = text
+            continue
+        overlap = _overlap_length(merged, text)
+        remainder = text[overlap:].lstrip()
+        if not remainder:
+            continue
+        # 英數字之間保留空白，中文直接相接
+        if merged[-1].isascii() and merged[-1].isalnum() and remainder[0].isascii() and remainder[0].isalnum():
+            merged += ' '
+        merged += remainder
+    return merged
+
+
+class ChunkedTranscriber:
+    """將長錄音依靜音切段，以有限的執行緒池並行轉錄後依序合併
+
+    transcribe_fn 接收具 name 屬性的檔案物件或 (檔名, 檔案物件) 並回傳文字，
+    正式環境傳入呼叫 Whisper API 的函數，測試時可傳入本地的假函數。
+    atranscribe_fn 為其非同步版本，供 atranscribe 使用（ASGI 上傳路徑）。
+    """
+
+    def __init__(self, transcribe_fn, max_workers=MAX_WORKERS,
+                 target_ms=TARGET_SEGMENT_MS, max_ms=MAX_SEGMENT_MS,
+                 overlap_ms=OVERLAP_MS, export_format='mp3', trim_silence=False,
+                 atranscribe_fn=None):
+        self.transcribe_fn = transcribe_fn
+        self.atranscribe_fn = atranscribe_fn
+        self.max_workers = max_workers
+        self.target_ms = target_ms
+        self.max_ms = max_ms
+        self.overlap_ms = overlap_ms
+        self.export_format = export_format
+        self.trim_silence = trim_silence
+
+    def split(self, audio):
+        """回傳 AudioSegment 的切段規劃"""
+        from pydub.silence import detect_silence
+
+        silences = detect_silence(
+            audio,
+            min_silence_len=MIN_SILENCE_MS,
+            silence_thresh=audio.dBFS - SILENCE_OFFSET_DB,
+            seek_step=SILENCE_SEEK_MS
+        )
+        return plan_segments(len(audio), silences, self.target_ms,
+                             self.max_ms, self.overlap_ms)
+
+    def iter_segments(self, audio):
+        """逐一找出切點並立即產生 (start, end) 片段
+
+        與 split 相同的切段規則，但每次只偵測下一個切點範圍內的靜音，
+        呼叫端不必等整段錄音掃描完畢就能開始轉錄前面的片段。
+        跨越範圍邊界的靜音只計算範圍內的部分，中點因此可能不同，
+        切點不保證與 split 完全相同（仍落在靜音內且不超過最大長度）。
+        """
+        from pydub.silence import detect_silence
+
+        duration_ms = len(audio)
+        if duration_ms <= self.max_ms:
+            yield 0, duration_ms
+            return
+
+        silence_thresh = audio.dBFS - SILENCE_OFFSET_DB
+        position = 0
+        while duration_ms - position > self.max_ms:
+            silences = detect_silence(
+                audio[position:position + self.max_ms],
+                min_silence_len=MIN_SILENCE_MS,
+                silence_thresh=silence_thresh,
+                seek_step=SILENCE_SEEK_MS
+            )
+            candidates = [position + (start + end) // 2 for start, end in silences]
+            candidates = [c for c in candidates if c > position]
+            if candidates:
+                target = position + self.target_ms
+                cut = min(candidates, key=lambda c: abs(c - target))
+            else:
+                cut = position + self.max_ms
+            yield max(0, position - self.overlap_ms) if position else 0, cut
+            position = cut
+        yield max(0, position - self.overlap_ms), duration_ms
+
+    def _export(self, audio, index):
+        buffer = io.BytesIO()
+        audio.export(buffer, format=self.export_format)
+        buffer.seek(0)
+        buffer.name = f"segment_{index:03d}.{self.export_format}"
+        return buffer
+
+    def transcribe_segment(self, audio, index, start, end):
+        """匯出並轉錄單一片段"""
+        segment_file = self._export(audio[start:end], index)
+        text = self.transcribe_fn(segment_file)
+        logger.info(f"片段 {index} ({start / 1000:.1f}s - {end / 1000:.1f}s) 轉錄完成")
+        return text
+
+    def transcribe_segment_audio(self, audio):
+        """轉錄已載入的 AudioSegment"""
+        return self._transcribe_segments(audio, self.split(audio))
+
+    def _transcribe_segments(self, audio, segments):
+        logger.info(f"音訊長度 {len(audio) / 1000:.1f} 秒，切為 {len(segments)} 段轉錄")
+
+        if len(segments) == 1:
+            return self.transcribe_fn(self._export(audio, 0))
+
+        # 各段的 Whisper span 接續呼叫端的 trace
+        transcribe_segment = tracing.bind(self.transcribe_segment)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(transcribe_segment, audio, i, start, end)
+                for i, (start, end) in enumerate(segments)
+            ]
+            texts = [future.result() for future in futures]
+        return merge_transcripts(texts)
+
+    def _upload(self, source):
+        """直接上傳原檔"""
+        if isinstance(source, str):
+            with open(source, 'rb') as audio_file:
+                return self.transcribe_fn(audio_file)
+        return self.transcribe_fn(source.upload_file())
+
+    def _duration_ms(self, source, has_ffmpeg):
+        """不解碼取得音訊長度（毫秒）：緩衝區使用 LINE 事件附帶的長度，檔案讀取標頭；取不到時回傳 None"""
+        if not isinstance(source, str):
+            return source.duration_ms
+        if not has_ffmpeg:
+            return None
+        from audio_normalize import probe_duration_ms
+
+        return probe_duration_ms(source)
+
+    def _plan(self, source):
+        """決定轉錄方式，回傳 (AudioSegment, 切段規劃)；可直接上傳原檔時回傳 (None, None)
+
+        短錄音直接上傳原檔，長錄音才解碼切段。
+        trim_silence 開啟時先解碼並剪除長靜音，剪除後的音訊重新編碼上傳。
+        """
+        from audio_normalize import ffmpeg_available
+
+        file_size = os.path.getsize(source) if isinstance(source, str) else source.size
+        if file_size <= MAX_UPLOAD_BYTES and not self.trim_silence:
+            has_ffmpeg = ffmpeg_available()
+            duration_ms = self._duration_ms(source, has_ffmpeg)
+            if duration_ms is not None and duration_ms <= self.max_ms:
+                metrics.AUDIO_SECONDS.inc(duration_ms / 1000)
+                return None, None
+            if not has_ffmpeg:
+                # 沒有 FFmpeg 無法解碼切段，未超過上傳上限時仍可整段上傳
+                logger.warning("找不到 FFmpeg，不切段直接上傳原檔")
+                if duration_ms is not None:
+                    metrics.AUDIO_SECONDS.inc(duration_ms / 1000)
+                return None, None
+
+        from pydub import AudioSegment
+
+        if isinstance(source, str):
+            audio = AudioSegment.from_file(source)
+        else:
+            audio = AudioSegment.from_file(source.reader(), format=source.format)
+        metrics.AUDIO_SECONDS.inc(len(audio) / 1000)
+
+        if self.trim_silence:
+            from vad import trim_silence
+
+            audio, saved_ms = trim_silence(audio)
+            if saved_ms:
+                return audio, self.split(audio)
+
+        if len(audio) <= self.max_ms and file_size <= MAX_UPLOAD_BYTES:
+            return None, None
+
+        return audio, self.split(audio)
+
+    def transcribe(self, source):
+        """轉錄音訊；短錄音直接上傳原檔，長錄音才解碼切段
+
+        source 可為檔案路徑，或 audio_ingest.SpooledAudio 緩衝區。
+        """
+        audio, segments = self._plan(source)
+        if audio is None:
+            return self._upload(source)
+        return self._transcribe_segments(audio, segments)
+
+    async def atranscribe(self, source):
+        """transcribe 的非同步版本：切段規則與靜音剪除相同，轉換在執行緒中進行，各段以 atranscribe_fn 並行上傳"""
+        loop = asyncio.get_running_loop()
+        audio, segments = await loop.run_in_executor(None, tracing.bind(self._plan), source)
+        if audio is None:
+            if isinstance(source, str):
+                data = await loop.run_in_executor(None, _read_file, source)
+                return await self.atranscribe_fn((os.path.basename(source), data))
+            return await self.atranscribe_fn(source.upload_file())
+
+        logger.info(f"音訊長度 {len(audio) / 1000:.1f} 秒，切為 {len(segments)} 段轉錄")
+        limit = asyncio.Semaphore(self.max_workers)
+
+        async def transcribe_segment(index, start, end):
+            async with limit:
+                segment_file = await loop.run_in_executor(None, self._export, audio[start:end], index)
+                text = await self.atranscribe_fn(segment_file)
+            logger.info(f"片段 {index} ({start / 1000:.1f}s - {end / 1000:.1f}s) 轉錄完成")
+            return text
+
+        texts = await asyncio.gather(*[
+            transcribe_segment(i, start, end) for i, (start, end) in enumerate(segments)
+        ])
+        if len(texts) == 1:
+            return texts[0]
+        return merge_transcripts(texts)
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
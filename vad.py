@@ -0,0 +1,184 @@
+"""轉錄前剪除長時間靜音
+
+交班錄音常有長時間停頓與病房背景噪音，Whisper 依音訊秒數計費與計時。
+以分析窗能量找出有聲音的區段，超過 VAD_MIN_SILENCE_MS 的靜音
+只保留前後 VAD_KEEP_SILENCE_MS，其餘剪除；較短的停頓維持原樣，不影響斷句。
+
+靜音門檻取「平均音量 - SILENCE_OFFSET_DB」與「背景噪音 + VAD_NOISE_MARGIN_DB」中較高者，
+有持續背景噪音的錄音也能辨識出停頓。
+"""
+import os
+import math
+import uuid
+import logging
+import threading
+
+import metrics
+from transcription import SILENCE_OFFSET_DB, SILENCE_SEEK_MS
+from audio_normalize import ffmpeg_available
+
+logger = logging.getLogger(__name__)
+
+# 預設關閉：開啟後每段錄音都要先以 FFmpeg 解碼，短錄音無法直接上傳原檔
+VAD_ENABLED = os.getenv('VAD_ENABLED', '0') == '1'
+if VAD_ENABLED and not ffmpeg_available():
+    logger.warning("找不到 FFmpeg，停用剪除靜音（VAD_ENABLED）")
+    VAD_ENABLED = False
+# 超過此長度的靜音才剪除（毫秒）
+VAD_MIN_SILENCE_MS = int(os.getenv('VAD_MIN_SILENCE_MS', '1500'))
+# 每段聲音前後保留的靜音（毫秒），避免切掉字首字尾
+VAD_KEEP_SILENCE_MS = int(os.getenv('VAD_KEEP_SILENCE_MS', '400'))
+# 高於背景噪音多少 dB 才視為聲音
+VAD_NOISE_MARGIN_DB = float(os.getenv('VAD_NOISE_MARGIN_DB', '6'))
+# 節省不到此長度時使用原音訊，不重新編碼（毫秒）
+VAD_MIN_SAVED_MS = int(os.getenv('VAD_MIN_SAVED_MS', '3000'))
+
+# 分析窗長度（毫秒）與估計背景噪音的百分位數
+FRAME_MS = SILENCE_SEEK_MS
+NOISE_PERCENTILE = 10
+
+_totals_lock = threading.Lock()
+_totals = {'recordings': 0, 'original_seconds': 0.0, 'saved_seconds': 0.0}
+
+
+def frame_levels(audio, frame_ms=FRAME_MS):
+    """每個分析窗的 RMS 振幅，直接由原始取樣計算一次
+
+    pydub 的 detect_nonsilent 每個步進都重新切出整個最短靜音長度計算音量，
+    長錄音相當耗時；這裡每個分析窗只計算一次，靜音長度改以連續的分析窗數判斷。
+    """
+    from pydub.utils import audioop
+
+    frame_bytes = audio.frame_width * max(1, int(audio.frame_rate * frame_ms / 1000))
+    raw = audio.raw_data
+    return [
+        audioop.rms(raw[i:i + frame_bytes], audio.sample_width)
+        for i in range(0, len(raw) - frame_bytes + 1, frame_bytes)
+    ]
+
+
+def noise_floor_dbfs(audio, levels, percentile=NOISE_PERCENTILE):
+    """以分析窗音量的低百分位數估計背景噪音（dBFS）"""
+    from pydub.utils import ratio_to_db
+
+    if not levels:
+        return audio.dBFS
+    level = sorted(levels)[min(len(levels) - 1, len(levels) * percentile // 100)]
+    if level == 0:
+        return -float('inf')
+    return ratio_to_db(level / audio.max_possible_amplitude)
+
+
+def silence_threshold(audio, levels):
+    threshold = audio.dBFS - SILENCE_OFFSET_DB
+    floor = noise_floor_dbfs(audio, levels)
+    if not math.isinf(floor):
+        threshold = max(threshold, floor + VAD_NOISE_MARGIN_DB)
+    # 仍須低於平均音量，避免門檻高到把語音當成靜音
+    return min(threshold, audio.dBFS - 1)
+
+
+def speech_ranges(audio, min_silence_ms=VAD_MIN_SILENCE_MS, keep_silence_ms=VAD_KEEP_SILENCE_MS,
+                  frame_ms=FRAME_MS):
+    """回傳要保留的 (start, end) 區段（毫秒），已加上前後保留的靜音並合併重疊
+
+    連續低於門檻達 min_silence_ms 的分析窗才算靜音。
+    """
+    from pydub.utils import db_to_float
+
+    if len(audio) == 0 or math.isinf(audio.dBFS):
+        return []
+    levels = frame_levels(audio, frame_ms)
+    threshold = db_to_float(silence_threshold(audio, levels)) * audio.max_possible_amplitude
+    min_frames = max(1, min_silence_ms // frame_ms)
+
+    # 找出夠長的靜音，其餘即為要保留的聲音
+    silences = []
+    run_start = None
+    for i, level in enumerate(levels + [threshold]):
+        if level < threshold:
+            if run_start is None:
+                run_start = i
+        elif run_start is not None:
+            if i - run_start >= min_frames:
+                silences.append((run_start * frame_ms, min(len(audio), i * frame_ms)))
+            run_start = None
+
+    ranges = []
+    position = 0
+    for silence_start, silence_end in silences:
+        if silence_start > position:
+            ranges.append((position, silence_start))
+        position = silence_end
+    if position < len(audio):
+        ranges.append((position, len(audio)))
+
+    merged = []
+    for start, end in ranges:
+        start = max(0, start - keep_silence_ms)
+        end = min(len(audio), end + keep_silence_ms)
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def _record_savings(original_ms, saved_ms):
+    metrics.AUDIO_TRIMMED_SECONDS.inc(saved_ms / 1000)
+    with _totals_lock:
+        _totals['recordings'] += 1
+        _totals['original_seconds'] += original_ms / 1000
+        _totals['saved_seconds'] += saved_ms / 1000
+
+
+def totals():
+    """程序啟動以來累計處理的錄音數、原始秒數與剪除秒數"""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def trim_silence(audio, min_saved_ms=VAD_MIN_SAVED_MS):
+    """剪除長靜音，回傳 (AudioSegment, 剪除的毫秒數)
+
+    節省不足 min_saved_ms 時回傳原音訊與 0，呼叫端可直接上傳原檔。
+    """
+    original_ms = len(audio)
+    with metrics.track('vad'):
+        ranges = speech_ranges(audio)
+    if not ranges:
+        # 整段都是靜音時保留原音訊，交由 Whisper 判斷
+        logger.info(f"未偵測到語音，保留原音訊 {original_ms / 1000:.1f} 秒")
+        _record_savings(original_ms, 0)
+        return audio, 0
+
+    kept_ms = sum(end - start for start, end in ranges)
+    saved_ms = original_ms - kept_ms
+    if saved_ms < min_saved_ms:
+        _record_savings(original_ms, 0)
+        return audio, 0
+
+    trimmed = audio[ranges[0][0]:ranges[0][1]]
+    for start, end in ranges[1:]:
+        trimmed += audio[start:end]
+    _record_savings(original_ms, saved_ms)
+    logger.info(
+        f"剪除靜音 {saved_ms / 1000:.1f} 秒：{original_ms / 1000:.1f} 秒 → {len(trimmed) / 1000:.1f} 秒"
+        f"（{saved_ms / original_ms:.0%}）"
+    )
+    return trimmed, saved_ms
+
+
+def trim_file(path, output_dir, export_format='mp3'):
+    """檔案版本：剪除後的音訊寫入 output_dir，回傳 (檔案路徑, 剪除的毫秒數)
+
+    節省不足時回傳原路徑與 0。
+    """
+    from pydub import AudioSegment
+
+    trimmed, saved_ms = trim_silence(AudioSegment.from_file(path))
+    if not saved_ms:
+        return path, 0
+    output_path = os.path.join(output_dir, f"trimmed_{uuid.uuid4().hex}.{export_format}")
+    trimmed.export(output_path, format=export_format)
+    return output_path, saved_ms
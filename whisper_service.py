@@ -0,0 +1,58 @@
+"""Whisper 轉錄服務
+
+LINE Bot、網頁版照護記錄（WSGI 與 ASGI）與命令列工具共用同一組轉錄設定、
+切段轉錄器與結果快取，/status 的快取統計因此涵蓋所有入口。
+"""
+import os
+
+import clients
+import openai_client
+from audio_normalize import normalize_audio
+from transcription import ChunkedTranscriber
+from vad import VAD_ENABLED
+from workspace import JobWorkspace
+from result_cache import ResultCache, file_sha256, transcription_key
+
+WHISPER_MODEL = "whisper-1"
+WHISPER_LANGUAGE = "zh"
+
+def whisper_transcribe(audio_file):
+    """呼叫 Whisper API 轉錄單一檔案或片段"""
+    return openai_client.transcribe(audio_file, model=WHISPER_MODEL, language=WHISPER_LANGUAGE)
+
+async def awhisper_transcribe(audio_file):
+    """whisper_transcribe 的非同步版本（ASGI 上傳路徑）"""
+    return await openai_client.atranscribe(audio_file, model=WHISPER_MODEL, language=WHISPER_LANGUAGE)
+
+# 長錄音切段並行轉錄
+transcriber = ChunkedTranscriber(whisper_transcribe, trim_silence=VAD_ENABLED, atranscribe_fn=awhisper_transcribe)
+
+# 轉錄與報告結果快取（Redis 無法使用時改用磁碟 LRU）
+result_cache = ResultCache(clients.redis_client)
+
+def transcribe_normalized(audio_path, workspace=None):
+    """Whisper 支援的格式直接上傳，其他格式才轉為壓縮的單聲道 16 kHz 音訊後上傳
+
+    轉檔結果寫入工作目錄；未指定 workspace 時建立一個，用完即清除。
+    """
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"找不到音訊檔案：{audio_path}")
+    if workspace is None:
+        with JobWorkspace() as workspace:
+            return transcribe_normalized(audio_path, workspace)
+    upload_path, transcoded = normalize_audio(audio_path, workspace.path)
+    try:
+        if transcoded:
+            workspace.track(upload_path)
+        return transcriber.transcribe(upload_path)
+    finally:
+        if transcoded and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+def transcribe_with_whisper(audio_path, workspace=None):
+    """使用 OpenAI Whisper 模型進行語音辨識，相同內容的檔案直接使用快取結果"""
+    # 快取以原始檔案計算，轉檔結果每次位元組不同
+    return result_cache.get_or_compute(
+        transcription_key(file_sha256(audio_path), WHISPER_MODEL, WHISPER_LANGUAGE),
+        lambda: transcribe_normalized(audio_path, workspace)
+    )
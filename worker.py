@@ -0,0 +1,14 @@
+"""獨立的背景 worker 程序
+
+與 web 程序共用同一個 Redis 佇列（web 端請設定 JOB_WORKERS_IN_PROCESS=0），執行方式：
+    python worker.py
+"""
+import os
+
+os.environ['JOB_WORKERS_IN_PROCESS'] = '0'
+
+from app import job_queue, logger
+
+if __name__ == "__main__":
+    logger.info("啟動獨立 worker 程序")
+    job_queue.run_forever()
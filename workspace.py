@@ -0,0 +1,134 @@
+"""每個工作的獨立暫存目錄
+
+CLI 與網頁上傳的每個工作都在 WORKSPACE_ROOT 下取得以 UUID 命名的目錄，
+上傳檔、轉檔結果等中間檔只寫入自己的目錄，同一台主機上同時處理多個工作也不會互相覆蓋。
+工作結束（包含發生例外）時整個目錄刪除；程序異常終止留下的目錄，
+會在下一次建立工作目錄時依 WORKSPACE_STALE_SECONDS 清除。
+"""
+import os
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_ROOT = os.getenv('WORKSPACE_ROOT', os.path.join(tempfile.gettempdir(), 'care_sch_jobs'))
+# 單一工作可使用的磁碟空間
+WORKSPACE_QUOTA_BYTES = int(os.getenv('WORKSPACE_QUOTA_BYTES', str(512 * 1024 * 1024)))
+# 磁碟剩餘空間低於此值時不再接受新工作
+WORKSPACE_MIN_FREE_BYTES = int(os.getenv('WORKSPACE_MIN_FREE_BYTES', str(1024 * 1024 * 1024)))
+# 超過此時間仍存在的工作目錄視為殘留
+WORKSPACE_STALE_SECONDS = int(os.getenv('WORKSPACE_STALE_SECONDS', str(6 * 3600)))
+
+WORKSPACE_PREFIX = 'job_'
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# 殘留目錄每個程序最多每小時掃描一次
+_SWEEP_INTERVAL = 3600
+_last_sweep = {}
+
+
+class WorkspaceQuotaExceeded(Exception):
+    """工作目錄超過磁碟配額，或主機剩餘空間不足"""
+
+
+def cleanup_stale_workspaces(root=WORKSPACE_ROOT, max_age=WORKSPACE_STALE_SECONDS):
+    """刪除超過 max_age 秒未清除的工作目錄，回傳刪除數量"""
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(root):
+        if not entry.name.startswith(WORKSPACE_PREFIX) or not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info(f"已清除 {removed} 個殘留的工作目錄")
+    return removed
+
+
+def _sweep_if_due(root):
+    now = time.time()
+    if now - _last_sweep.get(root, 0) < _SWEEP_INTERVAL:
+        return
+    _last_sweep[root] = now
+    try:
+        cleanup_stale_workspaces(root)
+    except Exception as e:
+        logger.error(f"清除殘留工作目錄時發生錯誤: {str(e)}")
+
+
+class JobWorkspace:
+    """單一工作的暫存目錄，可作為 context manager 使用
+
+        with JobWorkspace() as workspace:
+            path = workspace.save_stream(file.stream, file.filename)
+            ...
+    """
+
+    def __init__(self, job_id=None, root=WORKSPACE_ROOT, quota_bytes=WORKSPACE_QUOTA_BYTES):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.path = os.path.join(root, f"{WORKSPACE_PREFIX}{self.job_id}")
+        self.reserved_bytes = 0
+
+    def open(self):
+        os.makedirs(self.root, exist_ok=True)
+        _sweep_if_due(self.root)
+        free_bytes = shutil.disk_usage(self.root).free
+        if free_bytes < WORKSPACE_MIN_FREE_BYTES:
+            raise WorkspaceQuotaExceeded(f"磁碟剩餘空間不足：{free_bytes / 1024 / 1024:.0f} MB")
+        # 目錄已存在代表工作 ID 重複，直接拋出例外而不共用
+        os.makedirs(self.path)
+        logger.info(f"建立工作目錄: {self.path}")
+        return self
+
+    def file_path(self, filename):
+        """工作目錄中的檔案路徑；檔名經過過濾，不會寫到目錄之外"""
+        name = secure_filename(os.path.basename(filename or '')) or uuid.uuid4().hex
+        return os.path.join(self.path, name)
+
+    def reserve(self, nbytes):
+        """登記即將寫入的位元組數，超過配額時拋出 WorkspaceQuotaExceeded"""
+        self.reserved_bytes += nbytes
+        if self.reserved_bytes > self.quota_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"工作 {self.job_id} 超過磁碟配額 {self.quota_bytes / 1024 / 1024:.0f} MB"
+            )
+
+    def save_stream(self, stream, filename, chunk_size=COPY_CHUNK_BYTES):
+        """將上傳串流寫入工作目錄，邊寫邊檢查配額"""
+        path = self.file_path(filename)
+        with open(path, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                self.reserve(len(chunk))
+                f.write(chunk)
+        return path
+
+    def track(self, path):
+        """將工具程式（如 FFmpeg）產生的檔案計入配額"""
+        self.reserve(os.path.getsize(path))
+        return path
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.info(f"工作目錄已清理: {self.path}")
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()